@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Throughput of the AES-128-CBC decryption used for HLS fragments.
+
+    bench_aes.py [SIZE_KB]
+
+Compares the byte-list aes_cbc_decrypt, the word-oriented AES fallback
+of youtube_dl.aes and, when installed, pycrypto, in MB/s on SIZE_KB
+(default 256) of random data.  The outputs are checked to agree.
+"""
+from __future__ import unicode_literals, print_function
+
+import os
+from os.path import dirname as dirn
+import sys
+import time
+
+sys.path.insert(0, dirn(dirn(os.path.abspath(__file__))))
+
+from youtube_dl.aes import AES, aes_cbc_decrypt
+from youtube_dl.utils import bytes_to_intlist, intlist_to_bytes
+
+
+def throughput(func, data, seconds=1.0):
+    count = 0
+    start = time.time()
+    while True:
+        res = func(data)
+        count += 1
+        elapsed = time.time() - start
+        if elapsed >= seconds:
+            return res, len(data) * count / elapsed / 1024 / 1024
+
+
+def main(args):
+    size = int(args[0]) * 1024 if args else 256 * 1024
+    size -= size % 16
+    key, iv, data = os.urandom(16), os.urandom(16), os.urandom(size)
+
+    def intlist(data):
+        return intlist_to_bytes(aes_cbc_decrypt(
+            bytes_to_intlist(data), bytes_to_intlist(key), bytes_to_intlist(iv)))
+
+    candidates = [
+        ('aes_cbc_decrypt', intlist),
+        ('aes.AES', lambda data: AES.new(key, AES.MODE_CBC, iv).decrypt(data)),
+    ]
+    try:
+        from Crypto.Cipher import AES as CryptoAES
+    except ImportError:
+        pass
+    else:
+        candidates.append(
+            ('pycrypto', lambda data: CryptoAES.new(key, CryptoAES.MODE_CBC, iv).decrypt(data)))
+
+    expected = None
+    for name, func in candidates:
+        res, rate = throughput(func, data)
+        if expected is None:
+            expected = res
+        elif res != expected:
+            print('%s disagrees with aes_cbc_decrypt' % name)
+            return 1
+        print('%-16s %10.3f MB/s' % (name, rate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Startup time of main.py per subcommand, checked against a budget.
+
+    bench_commands.py [ROUNDS]
+
+Runs `main.py -h` and `main.py <command> -h` for every command of
+projects.COMMANDS, each in a fresh interpreter (run this with the one
+main.py runs under), and takes the median of ROUNDS (default 5) runs of
+the time from importing main to the command returning.  Exits 1 when a
+median is over its BUDGETS entry or a command loaded one of the
+HEAVY_MODULES it is not allowed, so it can gate a change.
+"""
+from __future__ import print_function
+
+import json
+import os
+from os.path import dirname as dirn
+import subprocess
+import sys
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from projects import COMMANDS
+
+# Seconds, median of the runs
+DEFAULT_BUDGET = 0.1
+BUDGETS = {
+    # tornado is needed to define the handlers
+    "server": 0.3,
+}
+HEAVY_MODULES = ["youtube_dl", "xlrd", "xlwt", "numpy", "requests", "tornado"]
+ALLOWED_MODULES = {
+    "server": ["tornado"],
+}
+
+PROBE = '''
+import json, sys, time
+start = time.time()
+sys.path.insert(0, %r)
+import main
+class Sink(object):
+    # optparse encodes help to the stream encoding
+    encoding = "utf-8"
+    def write(self, data):
+        pass
+sys.stdout = Sink()
+try:
+    main.main(["main.py"] + sys.argv[1:])
+except SystemExit:
+    pass
+elapsed = time.time() - start
+sys.stdout = sys.__stdout__
+print(json.dumps({"seconds": elapsed, "modules": len(sys.modules),
+                  "heavy": [m for m in %r if m in sys.modules]}))
+''' % (ROOT, HEAVY_MODULES)
+
+
+def run_once(args):
+    out = subprocess.check_output([sys.executable, "-c", PROBE] + args, cwd=ROOT)
+    return json.loads(out.decode("utf-8").splitlines()[-1])
+
+
+def main(rounds=5):
+    cases = [("-h", ["-h"])] + [(name, [name, "-h"]) for name in COMMANDS]
+    failed = False
+    for name, args in cases:
+        runs = [run_once(args) for _ in range(rounds)]
+        seconds = sorted(run["seconds"] for run in runs)[len(runs) // 2]
+        budget = BUDGETS.get(name, DEFAULT_BUDGET)
+        heavy = [m for m in runs[0]["heavy"] if m not in ALLOWED_MODULES.get(name, [])]
+        problems = []
+        if seconds > budget:
+            problems.append("over budget")
+        if heavy:
+            problems.append("imports " + ", ".join(heavy))
+        failed = failed or bool(problems)
+        print("%-12s %7.3fs  budget %5.2fs  modules %4d  %s" % (
+            name, seconds, budget, runs[0]["modules"], "; ".join(problems) or "ok"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Throughput of youtube_dl.jsinterp on signature decipher routines.
+
+    bench_jsinterp.py [base.js FUNCNAME [SIGLEN]]
+
+Without arguments a synthetic routine shaped like the base.js ones
+(split, a helper object doing reverse/splice/swap, join) is used.
+Reports fresh player compiles per second (new JSInterpreter, extract
+and first call) and calls per second of an already compiled routine.
+"""
+from __future__ import unicode_literals, print_function
+
+import io
+import os
+from os.path import dirname as dirn
+import sys
+import time
+
+sys.path.insert(0, dirn(dirn(os.path.abspath(__file__))))
+
+from youtube_dl.compat import compat_chr
+from youtube_dl.jsinterp import JSInterpreter
+
+SAMPLE_PLAYER = '''
+var Xy={Ab:function(a){a.reverse()},
+Cd:function(a,b){a.splice(0,b)},
+"Ef":function(a,b){var c=a[0];a[0]=a[b%a.length];a[b%a.length]=c}};
+var Gh=function(a){a=a.split("");Xy.Cd(a,3);Xy.Ef(a,7);Xy.Ab(a,24);Xy.Ef(a,45);
+Xy.Cd(a,2);Xy.Ef(a,39);Xy.Ab(a,58);Xy.Ef(a,5);Xy["Cd"](a,1);return a.join("")};
+'''
+# Gh() on compat_chr(0..86), checks that the interpreter still agrees
+SAMPLE_SPEC = [
+    4, 5, 6, 7, 10, 9, 3, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21,
+    22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37, 38, 39,
+    40, 86, 42, 43, 44, 84, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55, 56, 57,
+    58, 59, 60, 61, 62, 63, 64, 65, 66, 67, 68, 69, 70, 71, 72, 73, 74, 75,
+    76, 77, 78, 79, 80, 81, 82, 83, 45]
+
+
+def rate(func, seconds=1.0):
+    count = 0
+    start = time.time()
+    while True:
+        func()
+        count += 1
+        elapsed = time.time() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+def main(args):
+    if args:
+        with io.open(args[0], encoding='utf-8') as f:
+            code = f.read()
+        funcname = args[1]
+        siglen = int(args[2]) if len(args) > 2 else 87
+    else:
+        code, funcname, siglen = SAMPLE_PLAYER, 'Gh', 87
+    test_string = ''.join(map(compat_chr, range(siglen)))
+
+    def compile_and_call():
+        return JSInterpreter(code).extract_function(funcname)([test_string])
+
+    spec = [ord(c) for c in compile_and_call()]
+    if not args and spec != SAMPLE_SPEC:
+        print('unexpected result %r' % spec)
+        return 1
+    func = JSInterpreter(code).extract_function(funcname)
+    print('compile+call %10.1f players/s' % rate(compile_and_call))
+    print('call         %10.1f functions/s' % rate(lambda: func([test_string])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Speed and path agreement of the numpy aligner (utils/u_match.py)
+against sonic-annotator running the match vamp plugin.
+
+    bench_match.py [SP_WAV TP_WAV]
+
+Without arguments a synthetic reference (random notes with harmonics)
+and a performance of it with a drifting tempo and a lead-in silence are
+generated, and both aligners are also compared with the true mapping.
+sonic-annotator is skipped when it is not installed.
+"""
+from __future__ import print_function
+
+import os
+from os.path import dirname as dirn
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from utils.u_match import MatchAligner, load_transform
+
+SONIC = "/usr/bin/sonic-annotator"
+CONFIG = os.path.join(ROOT, "configs/tp_match_sp.txt")
+RATE = 44100
+
+
+def write_wav(path, samples):
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    w = wave.open(path, "wb")
+    w.setnchannels(2)
+    w.setsampwidth(2)
+    w.setframerate(RATE)
+    w.writeframes(np.repeat(pcm, 2).tobytes())
+    w.close()
+
+
+def synthesize(tmp, seconds=120, seed=1):
+    """Reference and performance wavs, and the true mapping as
+    (performance times, reference times) breakpoints"""
+    rng = np.random.RandomState(seed)
+    notes = []
+    total = 0.0
+    while total < seconds:
+        duration = rng.uniform(0.15, 0.6)
+        notes.append((rng.randint(48, 84), duration))
+        total += duration
+    lead_in = 2.0
+
+    def render(stretches, offset):
+        length = offset + sum(d * s for (_, d), s in zip(notes, stretches)) + 0.5
+        out = np.zeros(int(length * RATE), np.float32)
+        starts = []
+        t = offset
+        for (midi, duration), stretch in zip(notes, stretches):
+            n = int(duration * stretch * RATE)
+            x = np.arange(n) / float(RATE)
+            freq = 440.0 * 2 ** ((midi - 69) / 12.0)
+            tone = sum(np.sin(2 * np.pi * freq * k * x) / k for k in (1, 2, 3))
+            envelope = np.exp(-3 * x / max(duration * stretch, 1e-3))
+            first = int(t * RATE)
+            out[first:first + n] += (0.3 * tone * envelope)[:len(out) - first]
+            starts.append(t)
+            t += duration * stretch
+        return out, starts + [t]
+
+    reference, ref_starts = render([1.0] * len(notes), 0.0)
+    # Tempo drifts between 0.8x and 1.25x
+    phase = np.cumsum([d for _, d in notes]) / seconds * 2 * np.pi
+    stretches = 1.0 + 0.22 * np.sin(phase)
+    performance, perf_starts = render(stretches, lead_in)
+    sp = os.path.join(tmp, "sp.wav")
+    tp = os.path.join(tmp, "tp.wav")
+    write_wav(sp, reference)
+    write_wav(tp, performance)
+    return sp, tp, (np.array(perf_starts), np.array(ref_starts))
+
+
+def read_csv(path):
+    data = np.loadtxt(path, delimiter=",", ndmin=2)
+    return data[:, 0], data[:, 1]
+
+
+def compare(name, mapping, truth):
+    times = np.arange(truth[0][0], truth[0][-1], 0.05)
+    err = np.abs(np.interp(times, *mapping) - np.interp(times, *truth))
+    print("%-28s mean %.3fs  max %.3fs  within 0.1s %5.1f%%" % (
+        name, err.mean(), err.max(), 100.0 * (err <= 0.1).mean()))
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    try:
+        truth = None
+        if args:
+            sp, tp = args[:2]
+        else:
+            sp, tp, truth = synthesize(tmp)
+        config = load_transform(CONFIG)
+        aligner = MatchAligner(config, cache_dir=os.path.join(tmp, "features"))
+        csv = os.path.join(tmp, "numpy_b_a.csv")
+        start = time.time()
+        aligner.align_to_csv(sp, tp, csv)
+        cold = time.time() - start
+        # The reference features come from the cache now
+        aligner.memory.pop(aligner.cache_key(tp))
+        start = time.time()
+        aligner.align_to_csv(sp, tp, csv)
+        warm = time.time() - start
+        print("numpy aligner    cold %.2fs  cached reference %.2fs" % (cold, warm))
+        mapping = read_csv(csv)
+
+        sonic = None
+        if os.path.exists(SONIC):
+            out = os.path.join(tmp, "sonic")
+            os.mkdir(out)
+            start = time.time()
+            subprocess.call([SONIC, "-t", CONFIG, "-m", sp, tp, "-w", "csv", "--csv-basedir", out])
+            print("sonic-annotator  %.2fs" % (time.time() - start))
+            sonic_csv = os.path.join(
+                out, "%s_vamp_match-vamp-plugin_match_b_a.csv" % os.path.basename(sp)[:-4])
+            if os.path.exists(sonic_csv):
+                sonic = read_csv(sonic_csv)
+        else:
+            print("sonic-annotator  not installed, skipped")
+
+        if sonic is not None:
+            compare("numpy vs sonic-annotator", mapping, sonic)
+        if truth is not None:
+            compare("numpy vs truth", mapping, truth)
+            if sonic is not None:
+                compare("sonic-annotator vs truth", sonic, truth)
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
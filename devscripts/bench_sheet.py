@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Wall time and peak memory of reading a sc_match sheet and writing the
+result, the old way (xlrd + per cell merged dict + xlwt) against the
+streaming utils/u_sheet reader and writers.
+
+    bench_sheet.py [ROWS]
+
+A synthetic xlsx of ROWS (default 100000) rows shaped like the sc_match
+input, with vertically merged cells, is generated first.  Every variant
+runs in its own process so ru_maxrss is its own peak; the rows read are
+checked to agree.  xls cannot hold more than 65536 rows, the old variant
+only writes that many.
+"""
+from __future__ import print_function
+
+import hashlib
+import os
+from os.path import dirname as dirn
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, dirn(dirn(os.path.abspath(__file__))))
+
+from utils import u_sheet
+
+HEADER = [u"Done", u"Region", u"Id", u"Composer", u"Work", u"Movement", u"Key",
+          u"Year", u"Performer", u"Label", u"Album", u"Duration", u"URL", u"Path",
+          u"Index", u"CSV", u"Start", u"End"]
+VARIANTS = ["xlrd+xlwt", "stream+xls", "stream+xlsx", "stream+csv"]
+
+
+def generate(path, rows):
+    writer = u_sheet.XlsxWriter(path)
+    writer.writerow(HEADER)
+    for i in range(1, rows + 1):
+        work = (i - 1) // 10
+        writer.writerow([
+            u"", u"US", float(i),
+            # Composer and work cells are merged over their rows
+            u"作曲家 {}".format(work // 5) if (i - 1) % 50 == 0 else u"",
+            u"Work {}".format(work) if (i - 1) % 10 == 0 else u"",
+            u"Movement {}".format(i % 10), u"C major", 1800.0 + i % 200,
+            u"Performer {}".format(i % 997), u"Label", u"Album {}".format(i % 313),
+            u"{}:{:02d}".format(i % 9, i % 60),
+            u"https://www.youtube.com/watch?v={:011d}".format(i),
+            u"/works/{}/{}".format(work, i % 10), u"", u"",
+            0.0 if i % 7 else 0.25, u""])
+        if (i - 1) % 50 == 0:
+            writer.merge(i, min(i + 50, rows + 1), 3, 4)
+        if (i - 1) % 10 == 0:
+            writer.merge(i, min(i + 10, rows + 1), 4, 5)
+    writer.close()
+
+
+def old_rows(path):
+    import xlrd
+    workbook = xlrd.open_workbook(path)
+    sheet = workbook.sheet_by_name(u"Sheet1")
+    colspan = {}
+    for item in sheet.merged_cells:
+        for row in range(item[0], item[1]):
+            for col in range(item[2], item[3]):
+                if (row, col) != (item[0], item[2]):
+                    colspan.update({(row, col): (item[0], item[2])})
+    data = [sheet.row_values(0)]
+    for i in range(1, sheet.nrows):
+        row = sheet.row_values(i)
+        for j in range(len(row)):
+            if not row[j]:
+                pos = colspan.get((i, j))
+                if pos is not None:
+                    row[j] = sheet.cell_value(*pos)
+        data.append(row)
+    return data
+
+
+def run_variant(variant, path, out_dir):
+    start = time.time()
+    digest = hashlib.md5()
+    if variant == "xlrd+xlwt":
+        import xlwt
+        data = old_rows(path)
+        for row in data:
+            digest.update(repr(row).encode("utf-8"))
+        workbook = xlwt.Workbook()
+        sheet = workbook.add_sheet(u"Sheet1", cell_overwrite_ok=True)
+        for i in range(min(len(data), u_sheet.XLS_MAX_ROWS)):
+            for j in range(len(data[i])):
+                sheet.write(i, j, data[i][j])
+        workbook.save(os.path.join(out_dir, "old.xls"))
+    else:
+        ext = variant.split("+")[1]
+        writer = u_sheet.open_writer(os.path.join(out_dir, "result." + ext))
+        for i, row in enumerate(u_sheet.iter_rows(path)):
+            digest.update(repr(row).encode("utf-8"))
+            if ext != "xls" or i < u_sheet.XLS_MAX_ROWS:
+                writer.writerow(row)
+        writer.close()
+    elapsed = time.time() - start
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, digest.hexdigest())
+
+
+def main(args):
+    if args and args[0] == "--variant":
+        run_variant(*args[1:4])
+        return 0
+    rows = int(args[0]) if args else 100000
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "sheet.xlsx")
+        start = time.time()
+        generate(path, rows)
+        print("generated %d rows (%.1f MB) in %.1fs" % (
+            rows, os.path.getsize(path) / 1048576.0, time.time() - start))
+        digests = set()
+        for variant in VARIANTS:
+            out = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--variant", variant, path, tmp])
+            elapsed, maxrss, digest = out.decode().split()
+            digests.add(digest)
+            print("%-12s %7.2fs  peak %7.1f MB" % (variant, float(elapsed), int(maxrss) / 1024.0))
+        if len(digests) != 1:
+            print("the readers disagree")
+            return 1
+    finally:
+        shutil.rmtree(tmp)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
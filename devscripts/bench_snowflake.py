@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Ids per second of utils.u_snowflake.IdWorker.
+
+    bench_snowflake.py [THREADS [PROCESSES]]
+
+Reports get_id and get_ids(1000) on one thread, get_id from THREADS
+(default 8) threads sharing a worker, and get_ids from PROCESSES
+(default 4) processes with their own automatically allocated worker
+ids.  All ids are checked to be unique.
+"""
+from __future__ import print_function
+
+import multiprocessing
+import os
+from os.path import dirname as dirn
+import sys
+import threading
+import time
+
+sys.path.insert(0, dirn(dirn(os.path.abspath(__file__))))
+
+from utils.u_snowflake import IdWorker
+
+SECONDS = 1.0
+
+
+def rate(worker, batch):
+    ids = []
+    start = time.time()
+    while time.time() - start < SECONDS:
+        if batch == 1:
+            for _ in range(1000):
+                ids.append(worker.get_id())
+        else:
+            ids.extend(worker.get_ids(batch))
+    return ids, len(ids) / (time.time() - start)
+
+
+def threaded(worker, threads):
+    results = []
+
+    def run():
+        results.append(rate(worker, 1)[0])
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.time()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.time() - start
+    ids = [i for res in results for i in res]
+    return ids, len(ids) / elapsed
+
+
+def process_ids(_):
+    worker = IdWorker()
+    ids = rate(worker, 1000)[0]
+    return worker.get_worker_id(), ids
+
+
+def check(name, ids, per_sec):
+    unique = len(set(ids)) == len(ids)
+    print("%-28s %12.0f ids/s  %s" % (name, per_sec, "unique" if unique else "DUPLICATES"))
+    return unique
+
+
+def main(args):
+    threads = int(args[0]) if args else 8
+    processes = int(args[1]) if len(args) > 1 else 4
+    worker = IdWorker()
+    ok = check("get_id, 1 thread", *rate(worker, 1))
+    ok &= check("get_ids(1000), 1 thread", *rate(worker, 1000))
+    ok &= check("get_id, %d threads" % threads, *threaded(worker, threads))
+    pool = multiprocessing.Pool(processes)
+    start = time.time()
+    results = pool.map(process_ids, range(processes))
+    elapsed = time.time() - start
+    pool.close()
+    pool.join()
+    ids = [i for _, res in results for i in res]
+    ok &= check("get_ids(1000), %d processes" % processes, ids, len(ids) / elapsed)
+    print("worker ids: main %d, processes %s" % (
+        worker.get_worker_id(), sorted(worker_id for worker_id, _ in results)))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Startup cost of youtube_dl: `import youtube_dl` and YoutubeDL(...)
+construction, wall time and peak RSS, each measured in a fresh interpreter.
+
+Run it before and after `shells/build_lazy_extractors.sh` to compare.
+"""
+from __future__ import unicode_literals, print_function
+
+import json
+import os
+from os.path import dirname as dirn
+import subprocess
+import sys
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, resource, sys, time
+sys.path.insert(0, %r)
+rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.time()
+import youtube_dl
+imported = time.time()
+rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+ydl = youtube_dl.YoutubeDL({'quiet': True})
+built = time.time()
+rss2 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+from youtube_dl.extractor import _LAZY_LOADER
+print(json.dumps({
+    'lazy': _LAZY_LOADER,
+    'import_s': imported - start,
+    'ydl_s': built - imported,
+    'import_rss_kb': rss1 - rss0,
+    'ydl_rss_kb': rss2 - rss1,
+    'modules': len(sys.modules),
+}))
+''' % ROOT
+
+
+def run_once():
+    out = subprocess.check_output([sys.executable, '-c', PROBE])
+    return json.loads(out.decode('utf-8'))
+
+
+def main(rounds=5):
+    runs = [run_once() for _ in range(rounds)]
+    print('lazy extractors: %s, modules loaded: %d' % (runs[0]['lazy'], runs[0]['modules']))
+    for key in ('import_s', 'ydl_s', 'import_rss_kb', 'ydl_rss_kb'):
+        values = sorted(r[key] for r in runs)
+        print('%-14s min %10.3f  median %10.3f' % (key, values[0], values[len(values) // 2]))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,100 @@
+from __future__ import unicode_literals, print_function
+
+from inspect import getsource
+import io
+import os
+from os.path import dirname as dirn
+import sys
+
+sys.path.insert(0, dirn(dirn((os.path.abspath(__file__)))))
+
+lazy_extractors_filename = sys.argv[1]
+if os.path.exists(lazy_extractors_filename):
+    os.remove(lazy_extractors_filename)
+# Also drop a stale compiled module so the import below sees the real extractors
+for ext in ('c', 'o'):
+    if os.path.exists(lazy_extractors_filename + ext):
+        os.remove(lazy_extractors_filename + ext)
+
+from youtube_dl.extractor import _ALL_CLASSES, _LAZY_LOADER
+from youtube_dl.extractor.common import InfoExtractor, SearchInfoExtractor
+
+assert not _LAZY_LOADER, 'lazy_extractors is still importable, remove it first'
+
+with io.open(os.path.join(dirn(os.path.abspath(__file__)), 'lazy_load_template.py'), 'rt', encoding='utf-8') as f:
+    module_template = f.read()
+
+module_contents = [
+    module_template + '\n' + getsource(InfoExtractor.suitable) + '\n',
+    'class LazyLoadSearchExtractor(LazyLoadExtractor):\n' + getsource(SearchInfoExtractor.suitable)]
+
+ie_template = '''
+class {name}({bases}):
+    _VALID_URL = {valid_url!r}
+    _module = '{module}'
+'''
+
+make_valid_template = '''
+    @classmethod
+    def _make_valid_url(cls):
+        return {valid_url!r}
+'''
+
+
+def get_base_name(base):
+    if base is InfoExtractor:
+        return 'LazyLoadExtractor'
+    elif base is SearchInfoExtractor:
+        return 'LazyLoadSearchExtractor'
+    else:
+        return base.__name__
+
+
+def build_lazy_ie(ie, name):
+    valid_url = getattr(ie, '_VALID_URL', None)
+    s = ie_template.format(
+        name=name,
+        bases=', '.join(map(get_base_name, ie.__bases__)),
+        valid_url=valid_url,
+        module=ie.__module__)
+    if ie.suitable.__func__ is not InfoExtractor.suitable.__func__ and 'suitable' in ie.__dict__:
+        s += '\n' + getsource(ie.suitable)
+    if hasattr(ie, '_make_valid_url'):
+        # search extractors
+        s += make_valid_template.format(valid_url=ie._make_valid_url())
+    return s
+
+
+# Base classes have to be defined before their subclasses, keep the
+# original order otherwise
+classes = _ALL_CLASSES[:-1]
+ordered_cls = []
+while classes:
+    for c in classes[:]:
+        bases = set(c.__bases__) - set((object, InfoExtractor, SearchInfoExtractor))
+        stop = False
+        for b in bases:
+            if b not in classes and b not in ordered_cls:
+                if b.__name__ == 'GenericIE':
+                    raise SystemExit('GenericIE must not be subclassed')
+                classes.insert(0, b)
+                stop = True
+        if stop:
+            break
+        if all(b in ordered_cls for b in bases):
+            ordered_cls.append(c)
+            classes.remove(c)
+            break
+ordered_cls.append(_ALL_CLASSES[-1])
+
+for ie in ordered_cls:
+    module_contents.append(build_lazy_ie(ie, ie.__name__))
+
+# The order of _ALL_CLASSES decides which extractor wins, keep it as is
+module_contents.append(
+    '_ALL_CLASSES = [{0}]'.format(', '.join(ie.__name__ for ie in _ALL_CLASSES)))
+
+module_src = '\n'.join(module_contents) + '\n'
+
+with io.open(lazy_extractors_filename, 'wt', encoding='utf-8') as f:
+    f.write(module_src)
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import os
 import sys
-import importlib
+
+from projects import COMMANDS, load
 
 
 def main(argv):
@@ -10,15 +10,11 @@ def main(argv):
         if argv[1] in ["-h", "--help"]:
             usage()
         else:
-            try:
-                name = "projects.sc_%s" % argv[1]
-                modular = importlib.import_module(name)
-            except ImportError:
+            command = COMMANDS.get(argv[1])
+            if command is None:
                 print "Cannot find [%s], use -h for help." % argv[1]
-                raise
-                return
-            classname = getattr(modular, "ScriptHandler")
-            obj = classname()
+                return 1
+            obj = load(command)()
             obj.parser_args(argv[1:])
     else:
         usage()
@@ -28,13 +24,9 @@ def usage():
     print "Usage: python {} [options]\n".format(__file__)
     print "Options:"
 
-    projects = os.listdir("projects/")
-    for project in projects:
-        if project.startswith("sc_") and project.endswith(".py"):
-            pro = project.split(".")[0]
-            modular = importlib.import_module("projects.%s" % pro)
-            print "\t%-20s%-50s" % (pro[3:], modular.ScriptHandler.__doc__)
+    for command in COMMANDS.values():
+        print "\t%-20s%-50s" % (command.name, command.description)
 
 
 if __name__ == '__main__':
-    main(sys.argv)
+    sys.exit(main(sys.argv))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import collections
+import importlib
+
+# A main.py subcommand: the module behind it is only imported to run it,
+# `main.py -h` lists name and description from here.
+Command = collections.namedtuple("Command", ["name", "description", "entry_point"])
+
+COMMANDS = collections.OrderedDict((command.name, command) for command in [
+    Command("match", "下载曲目视频并与音频对齐", "projects.sc_match:ScriptHandler"),
+    Command("server", "代码更新webhook和/resolve服务", "projects.sc_server:ScriptHandler"),
+    Command("virtualenv", "部署virtualenv", "projects.sc_virtualenv:ScriptHandler"),
+])
+
+
+def load(command):
+    """The ScriptHandler class of command"""
+    module, _, name = command.entry_point.partition(":")
+    return getattr(importlib.import_module(module), name)
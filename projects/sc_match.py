@@ -1,23 +1,96 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
-import xlrd
-import xlwt
+import sys
+import time
 import glob
-import requests
+import subprocess
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser
-from youtube_dl import _real_main
 from utils.u_file import FileHandler
 from utils.u_snowflake import IdWorker
+from utils.u_journal import Journal
+from utils import u_sheet
 
 
 class ScriptHandler(object):
-    """部署virtualenv"""
+    """下载曲目视频并与音频对齐"""
+    # ffmpeg output options of the wav handed to sonic-annotator
+    AUDIO_ARGS = ["-ab", "160k", "-ac", "2", "-ar", "44100", "-vn", "-f", "wav"]
+    # Formats ffmpeg can read from the network by itself
+    STREAM_PROTOCOLS = ("http", "https", "m3u8", "m3u8_native")
+    STREAM_BLOCK_SIZE = 64 * 1024
+
     def __init__(self):
         self.home = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.sonic = "/usr/bin/sonic-annotator"
         self.ffmpeg = "/usr/bin/ffmpeg"
         self.config = os.path.join(self.home, "configs/tp_match_sp.txt")
+        self.id_worker = IdWorker()
+        self.journal = None
+        self.ydl = None
+        self.resolvers = threading.local()
+        self.extraction_stats = None
+        self.format_spec = None
+        self.stream = False
+        self.keep_video = False
+        self.aligner = "sonic"
+        self.aligner_instance = None
+        self.result_type = "xls"
+        self.download_params = {
+            "quiet": True,
+            "noprogress": True,
+            "continuedl": True,
+            "retries": 10,
+            # Range requests of this size, a dropped connection only
+            # costs the current chunk (single connection downloads).
+            "http_chunk_size": 10 * 1024 * 1024,
+            # Byte ranges fetched in parallel, resumable per range.
+            "http_connections": 4,
+        }
+
+    def __getstate__(self):
+        # Worker processes only run extract_audio/rundata.
+        state = self.__dict__.copy()
+        state["journal"] = None
+        state["ydl"] = None
+        state["resolvers"] = None
+        state["extraction_stats"] = None
+        state["aligner_instance"] = None
+        state["id_worker"] = None
+        return state
+
+    def resolver(self):
+        """One warm Resolver per download thread"""
+        resolver = getattr(self.resolvers, "resolver", None)
+        if resolver is None:
+            argv = ["--quiet"]
+            if self.format_spec:
+                argv += ["--format", self.format_spec]
+            params = None
+            if self.extraction_stats is not None:
+                params = {"profile_hooks": [self.extraction_stats.add]}
+            from youtube_dl import Resolver
+            resolver = self.resolvers.resolver = Resolver(argv, params=params)
+        return resolver
+
+    def downloader(self):
+        """YoutubeDL without extractors, only used for its opener"""
+        if self.ydl is None:
+            from youtube_dl import YoutubeDL
+            self.ydl = YoutubeDL(self.download_params, auto_init=False)
+        return self.ydl
+
+    def matcher(self):
+        """The numpy aligner, features are cached in tmp/features"""
+        if self.aligner_instance is None:
+            from utils import u_match
+            self.aligner_instance = u_match.MatchAligner(
+                u_match.load_transform(self.config),
+                cache_dir=os.path.join(self.home, "tmp/features"))
+        return self.aligner_instance
 
     def parser_args(self, argv):
         parser = OptionParser()
@@ -40,6 +113,79 @@ class ScriptHandler(object):
                           default=False,
                           help="Output dir path")
 
+        parser.add_option("-j", "--jobs",
+                          action="store",
+                          dest="jobs",
+                          type="int",
+                          default=1,
+                          help="Number of concurrent download workers")
+
+        parser.add_option("-p", "--pipeline",
+                          action="store_true",
+                          dest="pipeline",
+                          default=False,
+                          help="Run download and audio stages as a pipeline")
+
+        parser.add_option("", "--cpu-jobs",
+                          action="store",
+                          dest="cpu_jobs",
+                          type="int",
+                          default=multiprocessing.cpu_count(),
+                          help="Number of ffmpeg/sonic-annotator processes")
+
+        parser.add_option("-c", "--connections",
+                          action="store",
+                          dest="connections",
+                          type="int",
+                          default=4,
+                          help="Connections per video download, each fetching a byte range")
+
+        parser.add_option("-f", "--format",
+                          action="store",
+                          dest="format",
+                          default=None,
+                          help="youtube-dl format spec, default: smallest audio-only format")
+
+        parser.add_option("-s", "--stream",
+                          action="store_true",
+                          dest="stream",
+                          default=False,
+                          help="Decode the audio while downloading, without saving the video")
+
+        parser.add_option("", "--keep-video",
+                          action="store_true",
+                          dest="keep_video",
+                          default=False,
+                          help="With --stream, also save the video to the videos dir")
+
+        parser.add_option("-a", "--aligner",
+                          action="store",
+                          dest="aligner",
+                          type="choice",
+                          choices=["sonic", "numpy"],
+                          default="sonic",
+                          help="sonic (sonic-annotator) or numpy (in-process, needs numpy)")
+
+        parser.add_option("", "--result",
+                          action="store",
+                          dest="result",
+                          type="choice",
+                          choices=["xls", "xlsx", "csv"],
+                          default="xls",
+                          help="Result file type, xls holds at most 65536 rows")
+
+        parser.add_option("", "--profile",
+                          action="store_true",
+                          dest="profile",
+                          default=False,
+                          help="Report the extraction time per phase (network, regex, json, ...)")
+
+        parser.add_option("-r", "--rebuild",
+                          action="store_true",
+                          dest="rebuild",
+                          default=False,
+                          help="Rebuild result.xls from the journal without matching")
+
         parser.add_option("-t", "--test",
                           action="store_true",
                           dest="test",
@@ -52,166 +198,663 @@ class ScriptHandler(object):
             self.test()
             return
 
+        self.download_params["http_connections"] = max(options.connections, 1)
+        self.format_spec = options.format
+        self.stream = options.stream
+        self.keep_video = options.keep_video
+        self.aligner = options.aligner
+        self.result_type = options.result
+        if options.profile:
+            self.extraction_stats = ExtractionStats()
+        if self.aligner == "numpy":
+            # numpy is only imported when it is asked for
+            from utils import u_match
+            if u_match.np is None:
+                print "Error: --aligner numpy needs numpy installed"
+                return
+
         if options.excel and options.wav and options.output:
             if not os.path.exists(options.output):
                 self.mkdir_output(options.output)
             self.output = options.output
-            self.match_handler(options.excel, options.wav)
+            self.journal = Journal(os.path.join(self.output, "journal.jsonl"))
+            if options.rebuild:
+                self.rebuild_result(options.excel)
+            elif options.pipeline or options.jobs > 1:
+                self.pipeline_handler(options.excel, options.wav,
+                                      max(options.jobs, 1), max(options.cpu_jobs, 1))
+            else:
+                self.match_handler(options.excel, options.wav)
         else:
             print "Miss args, use --excel, --wav and --output set args."
             return
 
     def match_handler(self, excel, wav_dir):
-        workbook = xlrd.open_workbook(excel)
-        sheet = workbook.sheet_by_name(u'Sheet1')
-        num_rows = sheet.nrows
-        first_row = sheet.row_values(0)
-        index_num = first_row.index("Index")
-        csv_num = first_row.index("CSV")
-        start_num = first_row.index("Start")
-        end_num = first_row.index("End")
-        content = self.get_excel_content(sheet)
-        data = [first_row]
-        for curr_row in range(1, len(content)):
-            row = content[curr_row]
-            if not row[0] and row[1] == "US":
-                index = IdWorker().get_id()
-                url = row[12]
-                path = row[13][1:] if row[13].startswith("/") else row[13]
-                sp_dir = os.path.join(wav_dir, path)
-                sp_path = os.path.join(sp_dir, "sp.wav")
-                self.show_start_info(row)
-                if os.path.exists(sp_path):
-                    video_path = self.download_youtube(url, index)
-                    if video_path is not None:
-                        start_time = row[start_num]
-                        end_time = row[end_num]
-                        tp_path = self.extract_audio(video_path, start_time, end_time)
-                        tmp_csv = self.rundata(sp_path, tp_path)
-                        if tmp_csv is not None:
-                            dst_csv = os.path.join(self.output, "csvs/{}.csv".format(index))
-                            os.rename(tmp_csv, dst_csv)
-                            row[index_num] = str(index)
-                            row[csv_num] = dst_csv
-                            row[0] = 1
-                            print "Info: success: index={}".format(index)
-                        else:
-                            print "Error: make csv error, index={}".format(index)
-                    else:
-                        print "Error: tp file not exists, index={}".format(index)
+        first_row, content = self.load_excel(excel)
+        result = self.open_result(first_row)
+        for curr_row, row in content:
+            job = self.prepare_row(row, wav_dir, curr_row)
+            if job is not None:
+                index, url, sp_path = job
+                timings = []
+                start_time = row[self.start_num]
+                end_time = row[self.end_num]
+                media_path, is_audio = self.fetch_media(url, index, start_time, end_time, timings)
+                if media_path is not None:
+                    index, tmp_csv, align_timings = _align_stage(
+                        self, index, sp_path, media_path, is_audio, start_time, end_time)
+                    self.finish_row(row, index, tmp_csv, curr_row, timings + align_timings)
                 else:
-                    print "Error: sp file not exists, index={}, path={}".format(index, sp_path)
-            data.append(row)
+                    print "Error: tp file not exists, index={}".format(index)
+                    self.finish_row(row, index, None, curr_row, timings)
+            result.put(curr_row, row)
+        if self.extraction_stats is not None:
+            self.extraction_stats.report()
+        print "Info: save result..."
+        result.close()
+        print "Info: save result finished"
+
+    def pipeline_handler(self, excel, wav_dir, jobs, cpu_jobs):
+        """Overlap downloads with ffmpeg/sonic-annotator runs.
+
+        Rows are resolved and downloaded by `jobs` threads and handed to
+        `cpu_jobs` worker processes for extract_audio/rundata.  At most
+        jobs + cpu_jobs rows are in flight, and results are written back
+        into their own row, which is saved once every row above it is, so
+        the output order never changes.
+        """
+        first_row, content = self.load_excel(excel)
+        result = self.open_result(first_row)
+        # Fork the worker processes before any thread exists.
+        cpu_pool = multiprocessing.Pool(cpu_jobs)
+        io_pool = ThreadPool(jobs)
+        window = threading.BoundedSemaphore(jobs + cpu_jobs)
+        finished = threading.Semaphore(0)
+        lock = threading.Lock()
+        stats = StageStats()
+
+        # done and on_fetched run on the pools' result threads, an
+        # exception there would kill the thread and never release the row.
+        def done(row, key, index, tmp_csv, timings):
+            try:
+                for stage, elapsed in timings:
+                    stats.add(stage, elapsed)
+                with lock:
+                    try:
+                        self.finish_row(row, index, tmp_csv, key, timings)
+                    except Exception as ex:
+                        print "Error: finish row failed, index={}, error={}".format(index, ex)
+                        self.record_failed(row, index, key, timings)
+                result.put(key, row)
+            except Exception as ex:
+                print "Error: save row failed, index={}, error={}".format(index, ex)
+            finally:
+                window.release()
+                finished.release()
+
+        def on_fetched(args):
+            row, key, index, sp_path, media_path, is_audio, timings = args
+            if media_path is None:
+                print "Error: tp file not exists, index={}".format(index)
+                done(row, key, index, None, timings)
+                return
+            # Rows stay in this process, the workers only see paths.
+            try:
+                cpu_pool.apply_async(
+                    _align_stage,
+                    (self, index, sp_path, media_path, is_audio,
+                     row[self.start_num], row[self.end_num]),
+                    callback=lambda result: done(row, key, result[0], result[1],
+                                                 timings + result[2]))
+            except Exception as ex:
+                print "Error: align stage not started, index={}, error={}".format(index, ex)
+                done(row, key, index, None, timings)
+
+        pending = 0
+        stats.start()
+        for curr_row, row in content:
+            job = self.prepare_row(row, wav_dir, curr_row)
+            if job is None:
+                result.put(curr_row, row)
+                continue
+            window.acquire()
+            pending += 1
+            index, url, sp_path = job
+            io_pool.apply_async(self._fetch_stage, (row, curr_row, index, url, sp_path),
+                                callback=on_fetched)
+
+        for _ in range(pending):
+            finished.acquire()
+        io_pool.close()
+        cpu_pool.close()
+        io_pool.join()
+        cpu_pool.join()
+        stats.report()
+        if self.extraction_stats is not None:
+            self.extraction_stats.report()
+        print "Info: save result..."
+        result.close()
+        print "Info: save result finished"
+
+    def _fetch_stage(self, row, key, index, url, sp_path):
+        timings = []
+        try:
+            media_path, is_audio = self.fetch_media(url, index, row[self.start_num],
+                                                    row[self.end_num], timings)
+        except Exception as ex:
+            print "Error: download stage failed, index={}, error={}".format(index, ex)
+            media_path, is_audio = None, False
+        return row, key, index, sp_path, media_path, is_audio, timings
+
+    def fetch_media(self, url, index, start_time, end_time, timings):
+        """Download stage of a row, returns (path, is_audio): the wav with
+        --stream or for Start/End rows (only their window is fetched),
+        else the video"""
+        if self.stream or start_time or end_time:
+            return self.fetch_audio(url, index, start_time, end_time, timings), True
+        start = time.time()
+        video_path = self.download_youtube(url, index)
+        timings.append(("download", time.time() - start))
+        return video_path, False
+
+    def load_excel(self, excel):
+        """Header row and a stream of (key, row) for the rows to match"""
+        rows = u_sheet.iter_rows(excel, u'Sheet1')
+        first_row = next(rows)
+        # The second sheet row never was matched nor saved.
+        next(rows, None)
+        self.index_num = first_row.index("Index")
+        self.csv_num = first_row.index("CSV")
+        self.start_num = first_row.index("Start")
+        self.end_num = first_row.index("End")
+        return first_row, enumerate(rows, 1)
+
+    def open_result(self, first_row):
+        """Ordered writer of output/result.<type>, the header already put"""
+        path = os.path.join(self.output, "result.{}".format(self.result_type))
+        result = u_sheet.OrderedWriter(u_sheet.open_writer(path, u'Sheet1'))
+        result.put(0, first_row)
+        return result
+
+    def rebuild_result(self, excel):
+        first_row, content = self.load_excel(excel)
+        result = self.open_result(first_row)
+        for curr_row, row in content:
+            entry = self.journal.get(curr_row, row[12])
+            if not row[0] and entry is not None and entry["status"] == "success":
+                self.restore_row(row, entry["index"])
+            result.put(curr_row, row)
         print "Info: save result..."
-        self.save_result(data)
+        result.close()
         print "Info: save result finished"
 
+    def restore_row(self, row, index):
+        row[self.index_num] = str(index)
+        row[self.csv_num] = os.path.join(self.output, "csvs/{}.csv".format(index))
+        row[0] = 1
+
+    def prepare_row(self, row, wav_dir, key):
+        """Return (index, url, sp_path) if the row still needs matching"""
+        if row[0] or row[1] != "US":
+            return None
+        url = row[12]
+        entry = self.journal.get(key, url) if self.journal else None
+        if entry is not None:
+            # Keep the index of the previous run to reuse its videos/csvs.
+            index = entry["index"]
+            if self.is_match(index):
+                print "Info: already matched, index={}".format(index)
+                self.restore_row(row, index)
+                if entry["status"] != "success":
+                    self.journal.record(key, url=url, index=index, status="success")
+                return None
+        else:
+            index = self.id_worker.get_id()
+            if self.journal:
+                self.journal.record(key, url=url, index=index, status="start")
+        path = row[13][1:] if row[13].startswith("/") else row[13]
+        sp_dir = os.path.join(wav_dir, path)
+        sp_path = os.path.join(sp_dir, "sp.wav")
+        self.show_start_info(row)
+        if not os.path.exists(sp_path):
+            print "Error: sp file not exists, index={}, path={}".format(index, sp_path)
+            return None
+        return index, url, sp_path
+
+    def finish_row(self, row, index, tmp_csv, key=None, timings=()):
+        if tmp_csv is None:
+            print "Error: make csv error, index={}".format(index)
+            status = "failed"
+        else:
+            dst_csv = os.path.join(self.output, "csvs/{}.csv".format(index))
+            os.rename(tmp_csv, dst_csv)
+            self.restore_row(row, index)
+            print "Info: success: index={}".format(index)
+            status = "success"
+        if self.journal and key is not None:
+            self.journal.record(key, url=row[12], index=index, status=status,
+                                csv=row[self.csv_num] if tmp_csv else None,
+                                timings=dict(timings))
+        return tmp_csv is not None
+
+    def record_failed(self, row, index, key=None, timings=()):
+        """Journal row as failed after finish_row itself failed"""
+        if self.journal and key is not None:
+            self.journal.record(key, url=row[12], index=index, status="failed",
+                                csv=None, timings=dict(timings))
+
     def show_start_info(self, row):
         print "{}Start{}-{}-{}-{}-{}-{}{}".format("#"*5, "#"*5, row[3].strip().encode("utf-8"), row[4].strip().encode("utf-8"), row[5].strip().encode("utf-8"), row[8].strip().encode("utf-8"), row[10].strip().encode("utf-8"), "#"*10)
 
-    def save_result(self, data):
-        workbook = xlwt.Workbook()
-        sheet = workbook.add_sheet(u'Sheet1', cell_overwrite_ok=True)
-        for i in range(len(data)):
-            for j in range(len(data[i])):
-                sheet.write(i, j, data[i][j])
-        workbook.save("{}/result.xls".format(self.output))
-
     def is_match(self, index):
         csv = os.path.join(self.output, "csvs/{}.csv".format(index))
         if os.path.exists(csv):
             return True
         return False
 
+    def downloaded_video(self, index):
+        """Completed download of a previous run, whatever its format"""
+        for filename in glob.glob("{}/videos/{}.*".format(self.output, index)):
+            if os.path.splitext(filename)[1] not in (".part", ".ytdl", ".wav"):
+                return filename
+        return None
+
     def download_youtube(self, url, index):
+        from youtube_dl.utils import DownloadError
+        filename = self.downloaded_video(index)
+        if filename is not None:
+            print "Info: reuse downloaded video, index={}".format(index)
+            return filename
         try:
-            download_url = _real_main(url)
-        except youtube_dl.utils.DownloadError:
+            fmt = self.resolver().resolve(url)
+        except DownloadError:
+            fmt = None
+        if not fmt:
             print "Error: get download url failed, index={}".format(index)
             return None
+        filename = "{}/videos/{}.{}".format(self.output, index, fmt.get("ext") or "mp4")
         try:
-            r = requests.get(download_url)
-            filename = "{}/videos/{}.mp4".format(self.output, index)
-            if os.path.exists(filename):
-                os.remove(filename)
-            with open(filename, "w") as f:
-                f.write(r.content)
+            if not self.download_video(fmt, filename):
+                raise DownloadError("incomplete download")
         except Exception as ex:
-            print "Error: download youtube video failed, index={}".format(index)
+            print "Error: download youtube video failed, index={}, error={}".format(index, ex)
             return None
         return filename
 
+    def download_video(self, fmt, filename):
+        """Download the resolved format fmt to filename.part and rename it
+        to filename once complete.  Plain http(s) formats are fetched over
+        http_connections byte ranges when the server allows it, resuming
+        a previous partial file.
+        """
+        from youtube_dl.downloader import get_suitable_downloader
+        from youtube_dl.utils import DownloadError
+        if fmt.get("requested_formats"):
+            raise DownloadError("merged formats are not supported, choose a single format")
+        info = dict(fmt)
+        fd = get_suitable_downloader(info, self.download_params)(self.downloader(), self.download_params)
+        if isinstance(filename, bytes):
+            filename = filename.decode(sys.getfilesystemencoding() or "utf-8")
+        return fd.download(filename, info)
+
     def mkdir_output(self, output):
         os.mkdir(output)
         os.mkdir("{}/videos/".format(output))
         os.mkdir("{}/csvs/".format(output))
 
-    def rundata(self, sp, tp):
+    def run_cmd(self, cmd):
+        """Run cmd (an argument list), True if it exited with status 0"""
+        cmd = [arg.encode("utf-8") if isinstance(arg, unicode) else str(arg) for arg in cmd]
+        print "Info: Run cmd: {}".format(" ".join(cmd))
+        try:
+            ret = subprocess.call(cmd)
+        except OSError as ex:
+            print "Error: cannot run {}, error={}".format(cmd[0], ex)
+            return False
+        if ret != 0:
+            print "Error: {} exited with status {}".format(os.path.basename(cmd[0]), ret)
+            return False
+        return True
+
+    def rundata(self, sp, tp, index=None):
+        if tp is None:
+            return None
         csv_tmp = os.path.join(self.home, "tmp/csvs/")
-        cmd = "{} -t {} -m {} {} -w csv --csv-basedir {}".format(self.sonic, self.config, sp, tp, csv_tmp)
-        print "Info: Run cmd: {}".format(cmd)
-        os.system(cmd)
+        if index is not None:
+            # Every reference is named sp.wav, keep parallel runs apart.
+            csv_tmp = os.path.join(csv_tmp, "{}/".format(index))
+        if not os.path.exists(csv_tmp):
+            os.makedirs(csv_tmp)
         sp_name = os.path.basename(sp)
         csv = os.path.join(csv_tmp, "{}_vamp_match-vamp-plugin_match_b_a.csv".format(sp_name[:-4]))
+        if self.aligner == "numpy":
+            print "Info: Align {} to {}".format(tp, sp)
+            try:
+                return self.matcher().align_to_csv(sp, tp, csv)
+            except Exception as ex:
+                print "Error: numpy aligner failed, error={}".format(ex)
+                return None
+        cmd = [self.sonic, "-t", self.config, "-m", sp, tp, "-w", "csv", "--csv-basedir", csv_tmp]
+        if not self.run_cmd(cmd):
+            return None
         if os.path.exists(csv):
             return csv
         return None
 
     def extract_audio(self, video, start_time, end_time):
-        if start_time and end_time:
+        try:
+            window = clip_window(start_time, end_time)
+        except ValueError as ex:
+            print "Error: {}".format(ex)
             return None
-        elif (not start_time) and (not end_time):
-            audio = "{}.wav".format(video.split(".")[0])
-            if os.path.exists(audio):
-                os.remove(audio)
-            cmd = "{} -i {} -ab 160k -ac 2 -ar 44100 -vn {}".format(self.ffmpeg, video, audio)
-            print "Info: Run cmd: {}".format(cmd)
-            os.system(cmd)
-            if os.path.exists(audio):
-                return audio
+        audio = "{}.wav".format(os.path.splitext(video)[0])
+        if os.path.exists(audio):
+            os.remove(audio)
+        if window is not None:
+            return self.split_wav(video, window, audio)
+        # A killed ffmpeg must not leave a wav to be reused later
+        tmp_audio = audio + ".part"
+        cmd = [self.ffmpeg, "-y", "-nostdin", "-i", video] + self.AUDIO_ARGS + [tmp_audio]
+        if self.run_cmd(cmd) and os.path.exists(tmp_audio):
+            os.rename(tmp_audio, audio)
+            return audio
+        if os.path.exists(tmp_audio):
+            os.remove(tmp_audio)
         return None
 
-    def split_wav(self, audio, start_time, end_time):
-        cmd = "{} -i input.mp3 -ss hh:mm:ss -t hh:mm:ss -acodec copy output.mp3 "
-
-    def get_excel_content(self, sheet):
-        colspan = {}
-        for item in sheet.merged_cells:
-            for row in range(item[0], item[1]):
-                for col in range(item[2], item[3]):
-                    # 合并单元格的首格是有值的，所以在这里进行了去重
-                    if (row, col) != (item[0], item[2]):
-                        colspan.update({(row, col): (item[0], item[2])})
-        data = []
-        num_rows = sheet.nrows
-        for i in range(1, num_rows):
-            row = sheet.row_values(i)
-            for j in range(len(row)):
-                if not row[j]:
-                    pos = colspan.get((i, j))
-                    if pos is not None:
-                        row[j] = sheet.cell_value(*colspan.get((i, j)))
-            data.append(row)
-        return data
+    def fetch_audio(self, url, index, start_time, end_time, timings):
+        """--stream counterpart of download_youtube + extract_audio.
+
+        Resolves url and decodes the chosen format straight into
+        videos/<index>.wav while it downloads, see stream_audio.  Rows with
+        Start/End only fetch that window, see split_wav, and never keep
+        the video.  A wav or video left by a previous run is reused.
+        Stage durations are appended to timings, returns the wav path or
+        None.
+        """
+        from youtube_dl.utils import DownloadError
+        try:
+            window = clip_window(start_time, end_time)
+        except ValueError as ex:
+            print "Error: {}, index={}".format(ex, index)
+            return None
+        audio = "{}/videos/{}.wav".format(self.output, index)
+        if os.path.exists(audio):
+            print "Info: reuse extracted audio, index={}".format(index)
+            return audio
+        video = self.downloaded_video(index)
+        if video is not None:
+            start = time.time()
+            audio = self.extract_audio(video, start_time, end_time)
+            timings.append(("audio", time.time() - start))
+            return audio
+
+        start = time.time()
+        try:
+            fmt = self.resolver().resolve(url)
+        except DownloadError:
+            fmt = None
+        timings.append(("resolve", time.time() - start))
+        if not fmt:
+            print "Error: get download url failed, index={}".format(index)
+            return None
+        video = "{}/videos/{}.{}".format(self.output, index, fmt.get("ext") or "mp4")
+        streamable = fmt.get("protocol") in self.STREAM_PROTOCOLS and not fmt.get("requested_formats")
+
+        if window is not None and streamable:
+            start = time.time()
+            audio = self.split_wav(fmt["url"], window, audio, fmt.get("http_headers"))
+            timings.append(("clip", time.time() - start))
+            return audio
+
+        if not streamable:
+            # Fragmented or merged formats, download them first
+            start = time.time()
+            try:
+                ok = self.download_video(fmt, video)
+            except Exception as ex:
+                print "Error: download youtube video failed, index={}, error={}".format(index, ex)
+                ok = False
+            timings.append(("download", time.time() - start))
+            if not ok:
+                return None
+            start = time.time()
+            audio = self.extract_audio(video, start_time, end_time)
+            timings.append(("audio", time.time() - start))
+            if not self.keep_video or window is not None:
+                os.remove(video)
+            return audio
+
+        start = time.time()
+        audio = self.stream_audio(fmt, audio, video if self.keep_video else None)
+        timings.append(("stream", time.time() - start))
+        return audio
+
+    def stream_audio(self, fmt, audio, video=None):
+        """Decode the audio of the resolved format fmt into audio (wav).
+
+        Without video ffmpeg reads the URL itself, with the format's
+        http headers, so it can still seek to a trailing moov atom.  With
+        video the bytes are fetched here, saved to video and piped into
+        ffmpeg at the same time; when ffmpeg cannot decode the pipe the
+        saved file is decoded afterwards.  The wav only appears once
+        ffmpeg succeeded.
+        """
+        tmp_audio = audio + ".part"
+        if video is None:
+            cmd = [self.ffmpeg, "-y", "-nostdin", "-loglevel", "error"]
+            cmd += _ffmpeg_headers(fmt.get("http_headers"))
+            cmd += ["-i", fmt["url"]] + self.AUDIO_ARGS + [tmp_audio]
+            ok = self.run_cmd(cmd)
+        else:
+            ok = self.tee_to_ffmpeg(fmt, video, tmp_audio)
+        if not ok or not os.path.exists(tmp_audio):
+            if os.path.exists(tmp_audio):
+                os.remove(tmp_audio)
+            return None
+        os.rename(tmp_audio, audio)
+        return audio
+
+    def tee_to_ffmpeg(self, fmt, video, tmp_audio):
+        """Download fmt to video while piping the same bytes to ffmpeg"""
+        from youtube_dl.utils import sanitized_Request
+        cmd = [self.ffmpeg, "-y", "-loglevel", "error", "-i", "pipe:0"] + self.AUDIO_ARGS + [tmp_audio]
+        cmd = [arg.encode("utf-8") if isinstance(arg, unicode) else arg for arg in cmd]
+        print "Info: Run cmd: {}".format(" ".join(cmd))
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError as ex:
+            print "Error: cannot run {}, error={}".format(cmd[0], ex)
+            return False
+        sink = proc.stdin
+        part = video + ".part"
+        complete = False
+        try:
+            # The body as sent, its size is checked against Content-Length
+            headers = dict(fmt.get("http_headers") or {}, **{"Youtubedl-no-compression": "True"})
+            request = sanitized_Request(fmt["url"], None, headers)
+            response = self.downloader().urlopen(request)
+            expected = response.info().get("Content-Length")
+            size = 0
+            with open(part, "wb") as f:
+                while True:
+                    chunk = response.read(self.STREAM_BLOCK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    f.write(chunk)
+                    if sink is not None:
+                        try:
+                            sink.write(chunk)
+                        except (IOError, OSError):
+                            # ffmpeg gave up on the pipe, keep downloading
+                            sink = None
+            complete = expected is None or size == int(expected)
+            if not complete:
+                print "Error: incomplete download, {} of {} bytes".format(size, expected)
+        except Exception as ex:
+            print "Error: download failed, error={}".format(ex)
+        finally:
+            try:
+                proc.stdin.close()
+            except (IOError, OSError):
+                pass
+            ret = proc.wait()
+        if not complete:
+            if os.path.exists(part):
+                os.remove(part)
+            return False
+        os.rename(part, video)
+        if ret == 0:
+            return True
+        print "Error: ffmpeg exited with status {} on the pipe, decode {}".format(ret, video)
+        return self.run_cmd([self.ffmpeg, "-y", "-nostdin", "-i", video] + self.AUDIO_ARGS + [tmp_audio])
+
+    def split_wav(self, source, window, audio, headers=None):
+        """Decode the (start, duration) window of source into audio (wav).
+
+        source is a local file or an http(s)/m3u8 URL fetched with
+        headers.  -ss/-t are input options, so ffmpeg seeks with the
+        container index (byte range requests for URLs) and stops reading
+        after the window instead of decoding everything before it.
+        """
+        start, duration = window
+        cmd = [self.ffmpeg, "-y", "-nostdin", "-loglevel", "error"]
+        cmd += _ffmpeg_headers(headers)
+        if start:
+            cmd += ["-ss", "{:.3f}".format(start)]
+        if duration is not None:
+            cmd += ["-t", "{:.3f}".format(duration)]
+        tmp_audio = audio + ".part"
+        cmd += ["-i", source] + self.AUDIO_ARGS + [tmp_audio]
+        if not self.run_cmd(cmd) or not os.path.exists(tmp_audio):
+            if os.path.exists(tmp_audio):
+                os.remove(tmp_audio)
+            return None
+        os.rename(tmp_audio, audio)
+        return audio
 
     def test(self):
         filename = "/home/sunlf/Documents/ScorePulse.xlsx"
-        workbook = xlrd.open_workbook(filename)
-        sheet = workbook.sheet_by_name(u'Sheet1')
-        colspan = {}
-        for item in sheet.merged_cells:
-            for row in range(item[0], item[1]):
-                for col in range(item[2], item[3]):
-                    # 合并单元格的首格是有值的，所以在这里进行了去重
-                    if (row, col) != (item[0], item[2]):
-                        colspan.update({(row, col): (item[0], item[2])})
-
-        num_rows = sheet.nrows
-        for i in range(1, num_rows):
-            row = sheet.row_values(i)
-            for j in range(len(row)):
-                if not row[j]:
-                    pos = colspan.get((i, j))
-                    if pos is not None:
-                        row[j] = sheet.cell_value(*colspan.get((i, j)))
+        rows = u_sheet.iter_rows(filename, u'Sheet1')
+        next(rows)
+        for i, row in enumerate(rows, 1):
             print i, row
+
+
+def _ffmpeg_headers(headers):
+    """ffmpeg -headers option for a format's http_headers"""
+    lines = "".join(
+        "{}: {}\r\n".format(key, value) for key, value in (headers or {}).items()
+        if key.lower() != "accept-encoding")
+    return ["-headers", lines] if lines else []
+
+
+def clip_window(start_time, end_time):
+    """(start, duration) in seconds of a row's Start/End cells, duration
+    None means up to the end; None for rows without either.
+
+    Cells are text ("1:02:03", "90", "1:30.5"), seconds, or Excel times
+    which xlrd returns as a fraction of a day.
+    """
+    start = _cell_seconds(start_time)
+    end = _cell_seconds(end_time)
+    if start is None and end is None:
+        return None
+    start = start or 0.0
+    if end is not None and end <= start:
+        raise ValueError("End {!r} is not after Start {!r}".format(end_time, start_time))
+    return start, None if end is None else end - start
+
+
+def _cell_seconds(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, long, float)):
+        return round(value * 86400.0, 3) if 0 < value < 1 else float(value)
+    from youtube_dl.utils import parse_duration
+    seconds = parse_duration(value.strip())
+    if seconds is None:
+        raise ValueError("invalid time {!r}".format(value))
+    return seconds
+
+
+class StageStats(object):
+    """Busy time and row counts per pipeline stage"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.order = []
+        self.begin = time.time()
+
+    def start(self):
+        self.begin = time.time()
+
+    def add(self, stage, elapsed):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = [0, 0.0]
+                self.order.append(stage)
+            self.stages[stage][0] += 1
+            self.stages[stage][1] += elapsed
+
+    def report(self):
+        wall = max(time.time() - self.begin, 1e-6)
+        print "Info: pipeline finished in {:.1f}s".format(wall)
+        for stage in self.order:
+            count, busy = self.stages[stage]
+            print "Info: stage {:<10} rows={:<6} busy={:.1f}s throughput={:.2f} rows/min".format(
+                stage, count, busy, count * 60.0 / wall)
+
+
+class ExtractionStats(object):
+    """Time, calls and bytes per extraction phase, summed over the
+    records of youtube_dl's ExtractionProfiler"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.urls = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def add(self, record):
+        with self.lock:
+            self.urls += 1
+            self.seconds += record["time"]
+            if not record["ok"]:
+                self.failed += 1
+            for phase, total in record["phases"].items():
+                entry = self.phases.setdefault(phase, [0.0, 0, 0])
+                entry[0] += total["time"]
+                entry[1] += total["calls"]
+                entry[2] += total["bytes"]
+
+    def report(self):
+        if not self.urls:
+            return
+        print "Info: extracted {} urls ({} failed) in {:.1f}s".format(
+            self.urls, self.failed, self.seconds)
+        for phase, (seconds, calls, nbytes) in sorted(
+                self.phases.items(), key=lambda item: -item[1][0]):
+            print "Info: extraction {:<10} time={:.1f}s ({:.0%}) calls={:<6} bytes={}".format(
+                phase, seconds, seconds / max(self.seconds, 1e-6), calls, nbytes)
+
+
+def _align_stage(handler, index, sp_path, media_path, is_audio, start_time, end_time):
+    """Process pool entry: extract_audio + rundata for one downloaded row,
+    media_path already is the wav if is_audio"""
+    timings = []
+    tmp_csv = None
+    try:
+        if is_audio:
+            tp_path = media_path
+        else:
+            start = time.time()
+            tp_path = handler.extract_audio(media_path, start_time, end_time)
+            timings.append(("audio", time.time() - start))
+        start = time.time()
+        tmp_csv = handler.rundata(sp_path, tp_path, index)
+        timings.append(("align", time.time() - start))
+    except Exception as ex:
+        print "Error: align stage failed, index={}, error={}".format(index, ex)
+    return index, tmp_csv, timings
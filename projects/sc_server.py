@@ -1,16 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import json
+import time
+import bisect
 import getpass
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from optparse import OptionParser
 import tornado.ioloop
 import tornado.web
+from tornado import gen, locks
+from tornado.concurrent import Future
+from tornado.process import Subprocess
 
 SERVER_PROT = 9701
+# git pulls running at once, over all workspaces
+MAX_PULLS = 4
+RESOLVE_WORKERS = 4
+RESOLVE_TTL = 600
+RESOLVE_CACHE_SIZE = 1024
 
 
 class ScriptHandler(object):
-    """部署virtualenv"""
+    """代码更新webhook和/resolve服务"""
     def __init__(self):
         pass
 
@@ -29,35 +43,385 @@ class ScriptHandler(object):
                           default=False,
                           help="Set server port.")
 
+        parser.add_option("", "--max-pulls",
+                          action="store",
+                          dest="max_pulls",
+                          type="int",
+                          default=MAX_PULLS,
+                          help="Number of git pulls running at once.")
+
+        parser.add_option("", "--resolve-workers",
+                          action="store",
+                          dest="resolve_workers",
+                          type="int",
+                          default=RESOLVE_WORKERS,
+                          help="Number of threads running /resolve extractions.")
+
+        parser.add_option("", "--resolve-ttl",
+                          action="store",
+                          dest="resolve_ttl",
+                          type="float",
+                          default=RESOLVE_TTL,
+                          help="Seconds a /resolve result is served from memory.")
+
+        parser.add_option("", "--resolve-cache-size",
+                          action="store",
+                          dest="resolve_cache_size",
+                          type="int",
+                          default=RESOLVE_CACHE_SIZE,
+                          help="Number of /resolve results kept in memory.")
+
         (options, args) = parser.parse_args(argv)
 
         if options.start:
             port = int(options.port) if options.port else SERVER_PROT
-            self.start_server(port)
+            service = ResolveService(max(options.resolve_workers, 1), options.resolve_ttl,
+                                     max(options.resolve_cache_size, 0))
+            self.start_server(port, max(options.max_pulls, 1), service)
 
-    def start_server(self, port):
-        app = tornado.web.Application(self.app_list())
+    def start_server(self, port, max_pulls=MAX_PULLS, service=None):
+        app = tornado.web.Application(self.app_list(PullManager(max_pulls),
+                                                    service or ResolveService()))
         app.listen(port)
         print "Server listening on {}......".format(port)
         tornado.ioloop.IOLoop.current().start()
 
-    def app_list(self):
+    def app_list(self, manager, service):
         return [
-            (r"/pull/code/(.*)", PullCodeHandler),
+            (r"/pull/status", PullStatusHandler, dict(manager=manager)),
+            (r"/pull/code/(.*)", PullCodeHandler, dict(manager=manager)),
+            (r"/resolve", ResolveHandler, dict(service=service)),
+            (r"/metrics", MetricsHandler, dict(service=service)),
         ]
 
 
+class PullState(object):
+    """Pull bookkeeping of one workspace"""
+    def __init__(self):
+        # Future of the pull in flight, which may still wait for a slot
+        self.current = None
+        self.running = False
+        # Future of the follow-up pull, shared by every request that came
+        # in while a pull was running
+        self.queued = None
+        self.waiters = 0
+        self.pulls = 0
+        self.coalesced = 0
+        self.last_duration = None
+        self.last_exit = None
+        self.last_finished = None
+
+    def status(self):
+        return {
+            "running": self.running,
+            "waiting_slot": self.current is not None and not self.running,
+            "queued": self.queued is not None,
+            "queue_depth": int(self.current is not None) + int(self.queued is not None),
+            "waiters": self.waiters,
+            "pulls": self.pulls,
+            "coalesced": self.coalesced,
+            "last_duration": self.last_duration,
+            "last_exit": self.last_exit,
+            "last_finished": self.last_finished,
+        }
+
+
+class PullManager(object):
+    """Runs `git pull` as subprocesses off the IOLoop.
+
+    A workspace has at most one pull in flight and one queued: requests
+    coming in while a pull runs share the queued one, which starts when
+    the running pull is done, and requests coming in while it waits for
+    one of the max_pulls slots join it.  So every request is answered by
+    a pull that started after it arrived.
+    """
+    def __init__(self, max_pulls=MAX_PULLS):
+        self.max_pulls = max_pulls
+        self.slots = locks.Semaphore(max_pulls)
+        self.states = {}
+
+    @gen.coroutine
+    def pull(self, workspace):
+        """Exit status of a pull of workspace"""
+        state = self.states.get(workspace)
+        if state is None:
+            state = self.states[workspace] = PullState()
+        if state.current is not None and not state.running:
+            state.coalesced += 1
+            future = state.current
+        elif state.queued is not None:
+            state.coalesced += 1
+            future = state.queued
+        else:
+            future = Future()
+            if state.current is not None:
+                state.queued = future
+            else:
+                self._run(workspace, state, future)
+        state.waiters += 1
+        try:
+            ret = yield future
+        finally:
+            state.waiters -= 1
+        raise gen.Return(ret)
+
+    @gen.coroutine
+    def _run(self, workspace, state, future):
+        state.current = future
+        try:
+            while True:
+                with (yield self.slots.acquire()):
+                    state.running = True
+                    start = time.time()
+                    try:
+                        proc = Subprocess(["git", "pull"], cwd=workspace)
+                        ret = yield proc.wait_for_exit(raise_error=False)
+                    except Exception as ex:
+                        print "Error: cannot run git pull in {}, error={}".format(workspace, ex)
+                        ret = -1
+                    state.pulls += 1
+                    state.last_duration = round(time.time() - start, 3)
+                    state.last_exit = ret
+                    state.last_finished = time.time()
+                    state.running = False
+                future.set_result(ret)
+                if state.queued is None:
+                    break
+                future = state.current = state.queued
+                state.queued = None
+        finally:
+            state.current = None
+            state.running = False
+
+    def status(self):
+        return {
+            "max_pulls": self.max_pulls,
+            "running": sum(state.running for state in self.states.values()),
+            "workspaces": dict((workspace, state.status())
+                               for workspace, state in self.states.items()),
+        }
+
+
 class PullCodeHandler(tornado.web.RequestHandler):
+    def initialize(self, manager):
+        self.manager = manager
+
+    @gen.coroutine
     def post(self, path):
         workspace = self._get_workspace(path)
+        if not os.path.isdir(workspace):
+            raise tornado.web.HTTPError(404)
         print workspace
-        os.chdir(workspace)
-        cmd = "git pull"
-        os.system(cmd)
+        ret = yield self.manager.pull(workspace)
+        if ret != 0:
+            self.set_status(500)
+            self.write("git pull exited with {}".format(ret))
+            return
         self.write("ok")
-        self.finish()
 
     def _get_workspace(self, name):
         user = getpass.getuser()
         return "/home/{}/workspace/{}".format(user, name)
 
+
+class PullStatusHandler(tornado.web.RequestHandler):
+    def initialize(self, manager):
+        self.manager = manager
+
+    def get(self):
+        self.write(self.manager.status())
+
+
+class Histogram(object):
+    """Latency counts per bucket, upper bounds in seconds"""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def snapshot(self):
+        """Cumulative counts like a Prometheus histogram, keyed by bound"""
+        with self.lock:
+            buckets = collections.OrderedDict()
+            total = 0
+            for bound, count in zip(self.BUCKETS + ("+Inf",), self.counts):
+                total += count
+                buckets[str(bound)] = total
+            return {"buckets": buckets, "count": self.count, "sum": round(self.sum, 6)}
+
+
+class TTLCache(object):
+    """LRU dict whose entries expire ttl seconds after they were put.
+    Only used on the IOLoop thread."""
+    def __init__(self, ttl=RESOLVE_TTL, size=RESOLVE_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            return None
+        self.entries[key] = entry
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = (time.time() + self.ttl, value)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+def _error_text(ex):
+    try:
+        return unicode(ex)
+    except UnicodeDecodeError:
+        return str(ex).decode("utf-8", "replace")
+
+
+def _default_resolver():
+    # youtube_dl is only imported by servers that get /resolve requests
+    from youtube_dl import Resolver
+    return Resolver(["--quiet", "--no-warnings"])
+
+
+class ResolveService(object):
+    """YoutubeDL extraction off the IOLoop for /resolve.
+
+    Extractions run on `workers` threads, each with its own warm Resolver
+    made by resolver_factory (a Resolver is not thread-safe).  Requests
+    for a url and format already being extracted wait for that
+    extraction, and results are served from a TTLCache afterwards.
+    """
+    def __init__(self, workers=RESOLVE_WORKERS, ttl=RESOLVE_TTL, cache_size=RESOLVE_CACHE_SIZE,
+                 resolver_factory=_default_resolver):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers)
+        self.resolver_factory = resolver_factory
+        self.resolvers = threading.local()
+        self.cache = TTLCache(ttl, cache_size)
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.extract_latency = Histogram()
+
+    def resolver(self):
+        resolver = getattr(self.resolvers, "resolver", None)
+        if resolver is None:
+            resolver = self.resolvers.resolver = self.resolver_factory()
+        return resolver
+
+    @gen.coroutine
+    def resolve(self, url, format_spec=None):
+        """Format dict chosen for url, see youtube_dl.Resolver.resolve"""
+        start = time.time()
+        key = (url, format_spec)
+        try:
+            result = self.cache.get(key)
+            if result is not None:
+                self.hits += 1
+                raise gen.Return(result)
+            future = self.inflight.get(key)
+            if future is None:
+                self.misses += 1
+                with self.lock:
+                    self.queued += 1
+                future = self.inflight[key] = tornado.ioloop.IOLoop.current().run_in_executor(
+                    self.executor, self._extract, url, format_spec)
+                future.add_done_callback(lambda f: self._extracted(key, f))
+            else:
+                self.coalesced += 1
+            result = yield future
+            raise gen.Return(result)
+        finally:
+            self.latency.observe(time.time() - start)
+
+    def _extract(self, url, format_spec):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        start = time.time()
+        try:
+            return self.resolver().resolve(url, format_spec)
+        finally:
+            self.extract_latency.observe(time.time() - start)
+            with self.lock:
+                self.running -= 1
+
+    def _extracted(self, key, future):
+        self.inflight.pop(key, None)
+        if future.exception() is not None:
+            self.errors += 1
+        elif future.result() is not None:
+            self.cache.put(key, future.result())
+
+    def metrics(self):
+        requests = self.hits + self.misses + self.coalesced
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queued,
+            "running": self.running,
+            "inflight": len(self.inflight),
+            "requests": requests,
+            "errors": self.errors,
+            "cache": {
+                "size": len(self.cache.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round(float(self.hits) / requests, 4) if requests else None,
+            },
+            "latency": self.latency.snapshot(),
+            "extract_latency": self.extract_latency.snapshot(),
+        }
+
+
+class ResolveHandler(tornado.web.RequestHandler):
+    """GET /resolve?url=URL[&format=SPEC], the chosen format as json"""
+    def initialize(self, service):
+        self.service = service
+
+    @gen.coroutine
+    def get(self):
+        url = self.get_argument("url")
+        format_spec = self.get_argument("format", None)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        try:
+            result = yield self.service.resolve(url, format_spec)
+        except Exception as ex:
+            self.set_status(502)
+            self.write(json.dumps({"error": _error_text(ex)}))
+            return
+        if result is None:
+            self.set_status(404)
+            self.write(json.dumps({"error": "no format found for {}".format(url)}))
+            return
+        self.write(json.dumps(result, default=str))
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def get(self):
+        self.write(self.service.metrics())
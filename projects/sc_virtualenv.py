@@ -18,13 +18,13 @@ class ScriptHandler(object):
                           action="store_true",
                           dest="build_env",
                           default=False,
-                          help="部署virtualenv和virtualenvwrapper环境。")
+                          help=u"部署virtualenv和virtualenvwrapper环境。")
 
         parser.add_option("", "--show-cmd",
                           action="store_true",
                           dest="show_cmd",
                           default=False,
-                          help="显示virtualenv的操作命令。")
+                          help=u"显示virtualenv的操作命令。")
 
         (options, args) = parser.parse_args(argv)
 
@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+#
+# Generate youtube_dl/extractor/lazy_extractors.py so that importing
+# youtube_dl does not load every extractor module. Re-run after changing
+# any extractor.
+
+cd "$(dirname "$0")/.."
+rm -f youtube_dl/extractor/lazy_extractors.py youtube_dl/extractor/lazy_extractors.pyc
+python devscripts/make_lazy_extractors.py youtube_dl/extractor/lazy_extractors.py
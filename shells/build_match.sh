@@ -2,6 +2,7 @@
 #
 
 start(){
+    /home/thenextshine/workspace/scripts/shells/build_lazy_extractors.sh
     python /home/thenextshine/workspace/scripts/main.py match -e /home/thenextshine/match_home/ScorePulse.xlsx -w /home/thenextshine/match_home/sp -o /home/thenextshine/match_home/
 }
 
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Startup budget of main.py's subcommands, see devscripts/bench_commands.py.
+
+    python -m unittest discover -s tests
+"""
+from __future__ import print_function
+
+import os
+from os.path import dirname as dirn
+import sys
+import unittest
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "devscripts"))
+
+import bench_commands
+
+
+class Report(object):
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.append(data)
+
+
+@unittest.skipIf(sys.version_info[0] > 2, "main.py runs under Python 2")
+class BenchCommandsTest(unittest.TestCase):
+    def bench(self, rounds=3):
+        report = Report()
+        stdout, sys.stdout = sys.stdout, report
+        try:
+            return bench_commands.main(rounds), "".join(report.lines)
+        finally:
+            sys.stdout = stdout
+
+    def test_within_budget(self):
+        status, report = self.bench()
+        self.assertEqual(status, 0, report)
+
+    def test_over_budget(self):
+        budget = bench_commands.DEFAULT_BUDGET
+        bench_commands.DEFAULT_BUDGET = 0
+        try:
+            status, report = self.bench(1)
+        finally:
+            bench_commands.DEFAULT_BUDGET = budget
+        self.assertEqual(status, 1, report)
+        self.assertIn("over budget", report)
+
+    def test_heavy_import(self):
+        # main itself must never load them, "server" is allowed tornado
+        self.assertEqual(bench_commands.run_once(["-h"])["heavy"], [])
+        self.assertNotIn("youtube_dl", bench_commands.run_once(["server", "-h"])["heavy"])
+        allowed = bench_commands.ALLOWED_MODULES
+        bench_commands.ALLOWED_MODULES = {}
+        try:
+            status, report = self.bench(1)
+        finally:
+            bench_commands.ALLOWED_MODULES = allowed
+        self.assertEqual(status, 1, report)
+        self.assertIn("imports tornado", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
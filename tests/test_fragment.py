@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Tests of youtube_dl's in-memory fragment downloads, against a local
+HLS server.
+
+    python -m unittest discover -s tests
+"""
+from __future__ import unicode_literals
+
+import os
+from os.path import dirname as dirn
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import zlib
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from youtube_dl import YoutubeDL
+from youtube_dl.compat import compat_http_server
+from youtube_dl.downloader.hls import HlsFD
+from youtube_dl.utils import DownloadError
+
+FRAGMENTS = 6
+
+
+def fragment_data(index):
+    return bytes(bytearray([index])) * (20000 + index)
+
+
+def gzip_data(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class HlsHandler(compat_http_server.BaseHTTPRequestHandler):
+    """Serves a playlist of FRAGMENTS fragments at /<name>.m3u8, whose
+    fragments are at /<name>-<index>.ts.  Fragments are gzipped when the
+    client accepts it, those of the "gone" playlist are 404s and the third
+    one of the "broken" playlist is a 500."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, code, body, headers=()):
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        mobj = re.match(r"^/(\w+)\.m3u8$", self.path)
+        if mobj:
+            lines = ["#EXTM3U", "#EXT-X-MEDIA-SEQUENCE:0"]
+            for index in range(FRAGMENTS):
+                lines += ["#EXTINF:1.0,", "%s-%d.ts" % (mobj.group(1), index)]
+            lines.append("#EXT-X-ENDLIST")
+            self.send_body(200, "\n".join(lines).encode("utf-8"))
+            return
+        mobj = re.match(r"^/(\w+)-(\d+)\.ts$", self.path)
+        if not mobj or mobj.group(1) == "gone":
+            self.send_body(404, b"gone")
+            return
+        if mobj.group(1) == "broken" and mobj.group(2) == "2":
+            self.send_body(500, b"broken")
+            return
+        data = fragment_data(int(mobj.group(2)))
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            self.send_body(200, gzip_data(data), [("Content-Encoding", "gzip")])
+        else:
+            self.send_body(200, data)
+
+
+class ThreadingServer(compat_http_server.HTTPServer):
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self._handle, args=(request, client_address))
+        thread.daemon = True
+        thread.start()
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+
+class HlsFragmentTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingServer(("127.0.0.1", 0), HlsHandler)
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.base = "http://127.0.0.1:%d/" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def download(self, playlist, **params):
+        params = dict({"quiet": True, "fragment_retries": 0}, **params)
+        ydl = YoutubeDL(params)
+        filename = os.path.join(self.tmp, "%s.ts" % playlist)
+        fd = HlsFD(ydl, ydl.params)
+        return fd.download(filename, {"url": self.base + "%s.m3u8" % playlist}), filename
+
+    def read(self, filename):
+        with open(filename, "rb") as fp:
+            return fp.read()
+
+    def test_gzipped_fragments(self):
+        expected = b"".join(fragment_data(index) for index in range(FRAGMENTS))
+        for workers in (1, 3):
+            ok, filename = self.download("seq%d" % workers, concurrent_fragment_downloads=workers)
+            self.assertTrue(ok)
+            self.assertEqual(self.read(filename), expected)
+
+    def test_no_fragment_downloaded(self):
+        for workers in (1, 3):
+            self.assertRaises(
+                DownloadError, self.download, "gone",
+                concurrent_fragment_downloads=workers)
+            self.assertFalse(os.path.exists(os.path.join(self.tmp, "gone.ts")))
+
+    def test_failed_fragment_aborts(self):
+        # Unlike an unavailable fragment, one whose download fails is not
+        # skipped
+        for workers in (1, 3):
+            self.assertRaises(
+                DownloadError, self.download, "broken",
+                concurrent_fragment_downloads=workers, skip_unavailable_fragments=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
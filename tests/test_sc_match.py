@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""Tests of the Start/End window handling of projects.sc_match.
+
+    python -m unittest discover -s tests
+
+split_wav runs against a local HTTP server with range support, with
+ffmpeg when one is found ($FFMPEG, /usr/bin/ffmpeg or the PATH), and
+always with FAKE_FFMPEG, which reads the window of a wav the way ffmpeg
+seeks in it.
+"""
+from __future__ import print_function
+
+import os
+from os.path import dirname as dirn
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+import wave
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from projects.sc_match import ScriptHandler, clip_window
+from youtube_dl.compat import compat_http_server
+from youtube_dl.utils import check_executable
+
+
+def find_ffmpeg():
+    for path in (os.environ.get("FFMPEG"), "/usr/bin/ffmpeg", "ffmpeg"):
+        if path and check_executable(path, ["-version"]):
+            return path
+    return None
+
+
+FFMPEG = find_ffmpeg()
+
+FAKE_FFMPEG = r"""#!%s
+# ffmpeg [-headers H] [-ss S] [-t T] -i URL ... OUT, for a 16 bit wav URL
+import struct, sys, wave
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+
+args = sys.argv[1:]
+source = args[args.index("-i") + 1]
+# Input options only, those after -i apply to the output
+options = {}
+for i, arg in enumerate(args[:args.index("-i")]):
+    if arg in ("-headers", "-ss", "-t"):
+        options[arg] = args[i + 1]
+headers = dict(line.split(": ", 1) for line in options.get("-headers", "").split("\r\n") if line)
+
+
+def fetch(first, last=""):
+    request = Request(source, headers=dict(headers, Range="bytes=%%d-%%s" %% (first, last)))
+    return urlopen(request).read()
+
+
+header = fetch(0, 43)
+channels, rate, byte_rate, block_align = struct.unpack("<HIIH", header[22:34])
+start = 44 + int(float(options.get("-ss", 0)) * rate) * block_align
+if "-t" in options:
+    data = fetch(start, start + int(float(options["-t"]) * rate) * block_align - 1)
+else:
+    data = fetch(start)
+writer = wave.open(args[-1], "wb")
+writer.setnchannels(channels)
+writer.setsampwidth(block_align // channels)
+writer.setframerate(rate)
+writer.writeframes(data)
+writer.close()
+""" % sys.executable
+
+
+class ClipWindowTest(unittest.TestCase):
+    def test_text(self):
+        self.assertEqual(clip_window("1:30", "2:00.5"), (90.0, 30.5))
+        self.assertEqual(clip_window(u"1:02:03", u"1:02:13"), (3723.0, 10.0))
+        self.assertEqual(clip_window("90", "100"), (90.0, 10.0))
+
+    def test_seconds(self):
+        self.assertEqual(clip_window(10, 25), (10.0, 15.0))
+        self.assertEqual(clip_window(10.5, 12), (10.5, 1.5))
+
+    def test_fraction_of_day(self):
+        # xlrd returns Excel times as a fraction of a day
+        self.assertEqual(clip_window(1 / 1440.0, 3 / 1440.0), (60.0, 120.0))
+        self.assertEqual(clip_window(30 / 86400.0, None), (30.0, None))
+
+    def test_open_ends(self):
+        self.assertEqual(clip_window(None, "30"), (0.0, 30.0))
+        self.assertEqual(clip_window("1:00", ""), (60.0, None))
+        self.assertIsNone(clip_window(None, ""))
+        self.assertIsNone(clip_window("", None))
+
+    def test_end_not_after_start(self):
+        self.assertRaises(ValueError, clip_window, "2:00", "1:00")
+        self.assertRaises(ValueError, clip_window, 30, 30)
+        self.assertRaises(ValueError, clip_window, "1:00", 1 / 1440.0)
+
+    def test_invalid_text(self):
+        self.assertRaises(ValueError, clip_window, "soon", None)
+
+
+class RangeHandler(compat_http_server.BaseHTTPRequestHandler):
+    """Serves server.data at any path, honouring Range, and records the
+    ranges asked for, the X-Test headers and the bytes sent"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        header = self.headers.get("Range")
+        self.server.headers.append(self.headers.get("X-Test"))
+        if header:
+            first, _, last = header.split("=", 1)[1].partition("-")
+            start = int(first)
+            if last:
+                end = min(int(last), end)
+            self.server.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, len(data)))
+        else:
+            self.server.ranges.append((0, end))
+            self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        pos = start
+        try:
+            while pos <= end:
+                chunk = data[pos:min(pos + 64 * 1024, end + 1)]
+                self.wfile.write(chunk)
+                pos += len(chunk)
+        except (IOError, OSError):
+            self.close_connection = True
+        finally:
+            self.server.sent.append(pos - start)
+
+
+class ThreadingServer(compat_http_server.HTTPServer):
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self._handle, args=(request, client_address))
+        thread.daemon = True
+        thread.start()
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+
+class WavServerTest(unittest.TestCase):
+    """Serves a 200 s wav to split_wav"""
+    RATE = 44100
+    SECONDS = 200
+    # 16 bit stereo
+    BYTE_RATE = RATE * 4
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        source = os.path.join(cls.tmp, "source.wav")
+        writer = wave.open(source, "wb")
+        writer.setnchannels(2)
+        writer.setsampwidth(2)
+        writer.setframerate(cls.RATE)
+        # A second of a sawtooth, repeated
+        second = b"".join(struct.pack("<hh", (i * 37) % 20000, (i * 53) % 20000) for i in range(cls.RATE))
+        writer.writeframes(second * cls.SECONDS)
+        writer.close()
+        with open(source, "rb") as fp:
+            data = fp.read()
+        cls.server = ThreadingServer(("127.0.0.1", 0), RangeHandler)
+        cls.server.data = data
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        cls.url = "http://127.0.0.1:%d/source.wav" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.server.ranges = []
+        self.server.sent = []
+        self.server.headers = []
+        self.handler = ScriptHandler()
+
+    def duration(self, path):
+        reader = wave.open(path, "rb")
+        try:
+            return reader.getnframes() / float(reader.getframerate())
+        finally:
+            reader.close()
+
+
+@unittest.skipIf(FFMPEG is None, "ffmpeg not found")
+class SplitWavTest(WavServerTest):
+    def setUp(self):
+        super(SplitWavTest, self).setUp()
+        self.handler.ffmpeg = FFMPEG
+
+    def test_window(self):
+        audio = os.path.join(self.tmp, "window.wav")
+        self.assertEqual(self.handler.split_wav(self.url, (150.0, 5.0), audio), audio)
+        self.assertAlmostEqual(self.duration(audio), 5.0, delta=0.05)
+        self.assertFalse(os.path.exists(audio + ".part"))
+        # ffmpeg seeks to the window with a range request ...
+        offset = 150 * self.BYTE_RATE
+        self.assertTrue(any(abs(start - offset) < self.BYTE_RATE for start, _ in self.server.ranges),
+                        self.server.ranges)
+        # ... instead of reading everything before it
+        self.assertLess(sum(self.server.sent), len(self.server.data) // 2, self.server.sent)
+
+    def test_up_to_the_end(self):
+        audio = os.path.join(self.tmp, "tail.wav")
+        self.assertEqual(self.handler.split_wav(self.url, (190.0, None), audio), audio)
+        self.assertAlmostEqual(self.duration(audio), 10.0, delta=0.05)
+
+    def test_failure_leaves_nothing(self):
+        audio = os.path.join(self.tmp, "missing.wav")
+        self.assertIsNone(self.handler.split_wav("http://127.0.0.1:1/source.wav", (1.0, 1.0), audio))
+        self.assertFalse(os.path.exists(audio))
+        self.assertFalse(os.path.exists(audio + ".part"))
+
+
+class SplitWavRangeTest(WavServerTest):
+    """split_wav with FAKE_FFMPEG: the window is read with range requests
+    at its byte offsets only if -ss/-t are given as input options"""
+    def setUp(self):
+        super(SplitWavRangeTest, self).setUp()
+        self.handler.ffmpeg = os.path.join(self.tmp, "ffmpeg")
+        with open(self.handler.ffmpeg, "w") as fp:
+            fp.write(FAKE_FFMPEG)
+        os.chmod(self.handler.ffmpeg, 0o755)
+
+    def test_window(self):
+        audio = os.path.join(self.tmp, "window.wav")
+        self.assertEqual(self.handler.split_wav(self.url, (150.0, 5.0), audio, {"X-Test": "1"}), audio)
+        start = 44 + 150 * self.BYTE_RATE
+        self.assertEqual(self.server.ranges, [(0, 43), (start, start + 5 * self.BYTE_RATE - 1)])
+        self.assertEqual(self.server.headers, ["1", "1"])
+        self.assertEqual(self.duration(audio), 5.0)
+        with open(audio, "rb") as fp:
+            self.assertEqual(fp.read()[44:], self.server.data[start:start + 5 * self.BYTE_RATE])
+        self.assertFalse(os.path.exists(audio + ".part"))
+
+    def test_up_to_the_end(self):
+        audio = os.path.join(self.tmp, "tail.wav")
+        self.assertEqual(self.handler.split_wav(self.url, (190.5, None), audio), audio)
+        start = 44 + int(190.5 * self.RATE) * 4
+        self.assertEqual(self.server.ranges, [(0, 43), (start, len(self.server.data) - 1)])
+        self.assertEqual(self.duration(audio), 9.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
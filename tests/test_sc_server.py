@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Tests of the /resolve and /metrics endpoints of projects.sc_server,
+with a stub resolver instead of youtube_dl.
+
+    python -m unittest discover -s tests
+"""
+from __future__ import print_function
+
+import json
+import os
+from os.path import dirname as dirn
+import sys
+import threading
+import unittest
+
+ROOT = dirn(dirn(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tornado.web
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from projects.sc_server import PullManager, ResolveService, ScriptHandler
+from youtube_dl.compat import compat_urllib_parse_urlencode
+
+
+class StubResolver(object):
+    """Resolves http://example.com/<name> to {"url": <name>.m4a}, raises
+    for "broken", finds nothing for "missing" and waits for release
+    before resolving "slow"."""
+    def __init__(self, calls, release):
+        self.calls = calls
+        self.release = release
+
+    def resolve(self, url, format_spec=None):
+        self.calls.append((url, format_spec))
+        name = url.rsplit("/", 1)[-1]
+        if name == "broken":
+            raise ValueError("Unsupported URL: " + url)
+        if name == "missing":
+            return None
+        if name == "slow":
+            self.release.wait(5)
+        return {"url": "http://cdn.example.com/%s.m4a" % name, "format_id": format_spec or "best"}
+
+
+class ResolveServiceTest(AsyncHTTPTestCase):
+    TTL = 0.5
+
+    def get_app(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.service = ResolveService(
+            workers=2, ttl=self.TTL,
+            resolver_factory=lambda: StubResolver(self.calls, self.release))
+        return tornado.web.Application(ScriptHandler().app_list(PullManager(), self.service))
+
+    def tearDown(self):
+        self.release.set()
+        self.service.executor.shutdown()
+        super(ResolveServiceTest, self).tearDown()
+
+    def resolve(self, name, format_spec=None):
+        query = {"url": "http://example.com/" + name}
+        if format_spec:
+            query["format"] = format_spec
+        return self.http_client.fetch(
+            self.get_url("/resolve?" + compat_urllib_parse_urlencode(query)), raise_error=False)
+
+    def metrics(self):
+        return json.loads(self.fetch("/metrics").body.decode("utf-8"))
+
+    @gen_test
+    def test_cache_hit_and_expiry(self):
+        first = yield self.resolve("a")
+        self.assertEqual(first.code, 200)
+        self.assertEqual(json.loads(first.body.decode("utf-8"))["url"], "http://cdn.example.com/a.m4a")
+        second = yield self.resolve("a")
+        self.assertEqual(second.body, first.body)
+        self.assertEqual(len(self.calls), 1)
+        # Another format is another entry
+        yield self.resolve("a", "bestaudio")
+        self.assertEqual(len(self.calls), 2)
+        yield gen.sleep(self.TTL + 0.1)
+        yield self.resolve("a")
+        self.assertEqual(len(self.calls), 3)
+
+    @gen_test
+    def test_coalescing(self):
+        requests = [self.resolve("slow") for _ in range(3)]
+        # Let all of them reach the service before the extraction ends
+        yield gen.sleep(0.2)
+        self.release.set()
+        responses = yield requests
+        self.assertEqual([response.code for response in responses], [200] * 3)
+        self.assertEqual(self.calls, [("http://example.com/slow", None)])
+        self.assertEqual(self.service.coalesced, 2)
+        self.assertEqual(self.service.inflight, {})
+
+    def test_missing_url(self):
+        self.assertEqual(self.fetch("/resolve").code, 400)
+        self.assertEqual(self.calls, [])
+
+    def test_errors(self):
+        response = self.fetch("/resolve?url=http://example.com/broken")
+        self.assertEqual(response.code, 502)
+        self.assertIn("Unsupported URL", json.loads(response.body.decode("utf-8"))["error"])
+        response = self.fetch("/resolve?url=http://example.com/missing")
+        self.assertEqual(response.code, 404)
+        self.assertIn("no format found", json.loads(response.body.decode("utf-8"))["error"])
+        # Neither is cached
+        self.fetch("/resolve?url=http://example.com/broken")
+        self.fetch("/resolve?url=http://example.com/missing")
+        self.assertEqual(len(self.calls), 4)
+
+    def test_metrics(self):
+        self.fetch("/resolve?url=http://example.com/a")
+        self.fetch("/resolve?url=http://example.com/a")
+        self.fetch("/resolve?url=http://example.com/broken")
+        metrics = self.metrics()
+        self.assertEqual(metrics["workers"], 2)
+        self.assertEqual(metrics["requests"], 3)
+        self.assertEqual(metrics["errors"], 1)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(metrics["inflight"], 0)
+        cache = metrics["cache"]
+        self.assertEqual((cache["size"], cache["hits"], cache["misses"], cache["coalesced"]), (1, 1, 2, 0))
+        self.assertEqual(cache["hit_rate"], round(1 / 3.0, 4))
+        self.assertEqual(metrics["latency"]["count"], 3)
+        self.assertEqual(metrics["latency"]["buckets"]["+Inf"], 3)
+        self.assertEqual(metrics["extract_latency"]["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
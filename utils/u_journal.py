@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import threading
+
+
+class Journal(object):
+    """Append-only json-lines progress log, one fsynced line per event.
+
+    Later lines win, so the state of a key is its last recorded entry.
+    A torn last line (crash during write) is cut off on load, so that
+    the next entry starts on a line of its own.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+        self.fp = open(path, "a")
+
+    def load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, "rb+") as fp:
+            # End of the last complete line
+            end = 0
+            for line in fp:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["key"]] = entry
+            fp.truncate(end)
+        return entries
+
+    def get(self, key, url=None):
+        entry = self.entries.get(key)
+        if entry is not None and url is not None and entry.get("url") != url:
+            # The sheet changed under this row, do not trust the old entry.
+            return None
+        return entry
+
+    def record(self, key, **fields):
+        fields["key"] = key
+        line = json.dumps(fields, sort_keys=True)
+        with self.lock:
+            self.entries[key] = fields
+            self.fp.write(line + "\n")
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+        return fields
+
+    def close(self):
+        with self.lock:
+            self.fp.close()
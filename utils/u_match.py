@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+import collections
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def load_transform(path):
+    """step_size, block_size and the parameter bindings of a
+    sonic-annotator transform file such as configs/tp_match_sp.txt"""
+    with open(path) as fp:
+        text = fp.read()
+    config = {}
+    for key in ("step_size", "block_size"):
+        m = re.search(r'vamp:%s\s*"(\d+)"' % key, text)
+        if m:
+            config[key] = int(m.group(1))
+    for name, value in re.findall(
+            r'vamp:identifier\s*"(\w+)"\s*\]\s*;\s*vamp:value\s*"([^"]+)"', text):
+        config[name] = float(value)
+    return config
+
+
+def read_wav(path):
+    """Mono float32 samples in [-1, 1] and the sample rate of a PCM or
+    float wav (WAVE_FORMAT_EXTENSIBLE included)"""
+    with open(path, "rb") as fp:
+        data = fp.read()
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("not a wav file: {}".format(path))
+    pos = 12
+    fmt = None
+    samples = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        body = data[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt ":
+            fmt = struct.unpack("<HHIIHH", body[:16])
+            if fmt[0] == 0xFFFE:
+                # The real format tag starts the SubFormat GUID
+                fmt = (struct.unpack("<H", body[24:26])[0],) + fmt[1:]
+        elif chunk_id == b"data":
+            # Streamed wavs may carry a bogus size, body then runs to EOF
+            samples = body
+            break
+        pos += 8 + size + (size & 1)
+    if fmt is None or samples is None:
+        raise ValueError("no fmt/data chunk in {}".format(path))
+    tag, channels, rate, _, _, bits = fmt
+    width = bits // 8
+    samples = samples[:len(samples) // (width * channels) * width * channels]
+    if tag == 3 and width == 4:
+        out = np.frombuffer(samples, "<f4").astype(np.float32)
+    elif tag != 1:
+        raise ValueError("unsupported wav format {} in {}".format(tag, path))
+    elif width == 1:
+        out = (np.frombuffer(samples, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        out = np.frombuffer(samples, "<i2").astype(np.float32) / 32768
+    elif width == 3:
+        raw = np.frombuffer(samples, np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints[ints >= 1 << 23] -= 1 << 24
+        out = ints.astype(np.float32) / (1 << 23)
+    elif width == 4:
+        out = np.frombuffer(samples, "<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError("unsupported sample width {} in {}".format(width, path))
+    if channels > 1:
+        out = out.reshape(-1, channels).mean(axis=1)
+    return out, rate
+
+
+class MatchAligner(object):
+    """MATCH style alignment in NumPy, an in-process replacement for
+    sonic-annotator running the match vamp plugin.
+
+    Frames of block_size samples every step_size samples are mapped to
+    energy bands, linear up to where bins are a semitone apart and one per
+    semitone above, turned into half-wave rectified differences
+    (usespecdiff) and normalised to sum 1 (framenorm).  Frames quieter
+    than silencethreshold (RMS) are zeroed.  The distance is half the
+    Manhattan distance and a diagonal step costs diagonalweight times it,
+    as in MATCH.
+
+    The path is found by multiscale DTW: a full DTW on frames pooled down
+    to at most COARSE_FRAMES, then one at full resolution inside a band of
+    RADIUS pooled frames around the coarse path.
+
+    Features of every input are cached, in memory and as .npz files in
+    cache_dir, keyed by path, size, mtime and the feature parameters, so
+    a reference is only analysed once for all its performances.
+    """
+
+    COARSE_FRAMES = 1500
+    RADIUS = 2
+    MEMORY_CACHE = 8
+    # Rows of the cost matrix computed per numpy call
+    BLOCK_ROWS = 64
+
+    def __init__(self, config, cache_dir=None):
+        if np is None:
+            raise ImportError("the numpy aligner needs numpy")
+        self.step = int(config.get("step_size", 882))
+        self.block = int(config.get("block_size", 2048))
+        self.tuning = config.get("freq1", 440.0)
+        self.specdiff = bool(config.get("usespecdiff", 1))
+        self.framenorm = bool(config.get("framenorm", 1))
+        self.silence = config.get("silencethreshold", 0.01)
+        self.diagonal = config.get("diagonalweight", 2.0)
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.memory = collections.OrderedDict()
+        self.window = np.hamming(self.block).astype(np.float32)
+        self.band_maps = {}
+
+    def band_starts(self, rate):
+        """First FFT bin of every feature band at sample rate rate"""
+        starts = self.band_maps.get(rate)
+        if starts is None:
+            bin_width = float(rate) / self.block
+            crossover = int(2 / (2 ** (1 / 12.0) - 1))
+            crossover_midi = int(round(math.log(crossover * bin_width / self.tuning, 2) * 12 + 69))
+            bands = []
+            for i in range(self.block // 2 + 1):
+                if i < crossover:
+                    bands.append(i)
+                else:
+                    midi = min(math.log(i * bin_width / self.tuning, 2) * 12 + 69, 127)
+                    bands.append(crossover + int(round(midi)) - crossover_midi)
+            bands = np.array(bands)
+            starts = self.band_maps[rate] = np.flatnonzero(np.diff(np.concatenate(([-1], bands))))
+        return starts
+
+    def cache_key(self, path):
+        st = os.stat(path)
+        params = (os.path.abspath(path), st.st_size, int(st.st_mtime), self.step, self.block,
+                  self.tuning, self.specdiff, self.framenorm, self.silence)
+        return hashlib.sha1(repr(params).encode("utf-8")).hexdigest()
+
+    def features(self, path):
+        """(frames x bands float32 features, sample rate) of a wav file"""
+        key = self.cache_key(path)
+        with self.lock:
+            cached = self.memory.pop(key, None)
+            if cached is not None:
+                self.memory[key] = cached
+                return cached
+        cache_file = None
+        cached = None
+        if self.cache_dir:
+            cache_file = os.path.join(self.cache_dir, key + ".npz")
+            if os.path.exists(cache_file):
+                try:
+                    with np.load(cache_file) as npz:
+                        cached = npz["features"], int(npz["rate"])
+                except Exception:
+                    cached = None
+        if cached is None:
+            samples, rate = read_wav(path)
+            cached = self.compute_features(samples, rate), rate
+            if cache_file is not None:
+                if not os.path.exists(self.cache_dir):
+                    os.makedirs(self.cache_dir)
+                tmp = "{}.{}.tmp".format(cache_file, os.getpid())
+                with open(tmp, "wb") as fp:
+                    np.savez(fp, features=cached[0], rate=rate)
+                os.rename(tmp, cache_file)
+        with self.lock:
+            self.memory[key] = cached
+            while len(self.memory) > self.MEMORY_CACHE:
+                self.memory.popitem(last=False)
+        return cached
+
+    def compute_features(self, samples, rate, chunk=2048):
+        if len(samples) < self.block:
+            samples = np.concatenate((samples, np.zeros(self.block - len(samples), np.float32)))
+        count = 1 + (len(samples) - self.block) // self.step
+        frames = np.lib.stride_tricks.as_strided(
+            samples, shape=(count, self.block),
+            strides=(samples.strides[0] * self.step, samples.strides[0]))
+        starts = self.band_starts(rate)
+        out = np.empty((count, len(starts)), np.float32)
+        loud = np.empty(count, bool)
+        for first in range(0, count, chunk):
+            block = frames[first:first + chunk]
+            loud[first:first + chunk] = np.sqrt((block * block).mean(axis=1)) >= self.silence
+            spectrum = np.abs(np.fft.rfft(block * self.window, axis=1))
+            out[first:first + chunk] = np.add.reduceat(spectrum, starts, axis=1)
+        if self.specdiff:
+            out[1:] = np.maximum(out[1:] - out[:-1], 0)
+        out[~loud] = 0
+        if self.framenorm:
+            out = self.normalise(out)
+        return out
+
+    @staticmethod
+    def normalise(features):
+        sums = features.sum(axis=1)
+        sums[sums == 0] = 1
+        return features / sums[:, None]
+
+    def pool(self, features, factor):
+        pooled = np.add.reduceat(features, np.arange(0, len(features), factor), axis=0)
+        return self.normalise(pooled) if self.framenorm else pooled / factor
+
+    def dtw(self, a, b, lo, hi):
+        """Cheapest path from (0, 0) to (len(a) - 1, len(b) - 1) through
+        cells lo[i] <= j < hi[i] of every row i, as (i, j) arrays.
+
+        A row depends on itself only through horizontal steps, so it is
+        D[j] = C[j] + min(k <= j) of (A[k] - C[k]) with C the running sum
+        of the row's costs and A the best entry from the previous row: a
+        cumulative minimum instead of a Python loop over the columns.
+        """
+        rows = len(a)
+        diagonal = self.diagonal
+        moves = []
+        prev = None
+        prev_lo = prev_hi = 0
+        for first in range(0, rows, self.BLOCK_ROWS):
+            last = min(first + self.BLOCK_ROWS, rows)
+            col_lo, col_hi = lo[first], hi[last - 1]
+            costs = 0.5 * np.abs(a[first:last, None, :] - b[None, col_lo:col_hi, :]).sum(axis=2)
+            for i in range(first, last):
+                row_lo, row_hi = lo[i], hi[i]
+                d = costs[i - first, row_lo - col_lo:row_hi - col_lo].astype(np.float64)
+                up = np.full(len(d), np.inf)
+                diag = np.full(len(d), np.inf)
+                if prev is None:
+                    diag[0] = 0 if row_lo == 0 else np.inf
+                else:
+                    s, e = max(row_lo, prev_lo), min(row_hi, prev_hi)
+                    if s < e:
+                        up[s - row_lo:e - row_lo] = prev[s - prev_lo:e - prev_lo]
+                    s, e = max(row_lo, prev_lo + 1), min(row_hi, prev_hi + 1)
+                    if s < e:
+                        diag[s - row_lo:e - row_lo] = prev[s - 1 - prev_lo:e - 1 - prev_lo]
+                from_diag = diag + diagonal * d
+                from_up = up + d
+                best = np.minimum(from_diag, from_up)
+                cum = np.cumsum(d)
+                offset = best - cum
+                running = np.minimum.accumulate(offset)
+                row = cum + running
+                move = np.where(from_diag <= from_up, 0, 1).astype(np.int8)
+                move[offset > running] = 2
+                moves.append(move)
+                prev, prev_lo, prev_hi = row, row_lo, row_hi
+        i, j = rows - 1, len(b) - 1
+        path_i, path_j = [i], [j]
+        while i > 0 or j > 0:
+            move = moves[i][j - lo[i]]
+            if move == 0:
+                i -= 1
+                j -= 1
+            elif move == 1:
+                i -= 1
+            else:
+                j -= 1
+            path_i.append(i)
+            path_j.append(j)
+        return np.array(path_i[::-1]), np.array(path_j[::-1])
+
+    def align_features(self, a, b):
+        """Path between feature sequences a and b as (i, j) arrays"""
+        factor = max(1, int(math.ceil(max(len(a), len(b)) / float(self.COARSE_FRAMES))))
+        if factor == 1:
+            return self.dtw(a, b, [0] * len(a), [len(b)] * len(a))
+        ca, cb = self.pool(a, factor), self.pool(b, factor)
+        ci, cj = self.dtw(ca, cb, [0] * len(ca), [len(cb)] * len(ca))
+        lo = np.full(len(ca), len(cb), int)
+        hi = np.zeros(len(ca), int)
+        np.minimum.at(lo, ci, cj)
+        np.maximum.at(hi, ci, cj + 1)
+        lo = np.clip((lo - self.RADIUS) * factor, 0, len(b))
+        hi = np.clip((hi + self.RADIUS) * factor, 0, len(b))
+        rows = np.arange(len(a)) // factor
+        return self.dtw(a, b, lo[rows].tolist(), hi[rows].tolist())
+
+    def align(self, reference, performance):
+        """b_a mapping of performance onto reference: performance times
+        and the reference times they align with, in seconds"""
+        a, rate_a = self.features(reference)
+        b, rate_b = self.features(performance)
+        path_i, path_j = self.align_features(a, b)
+        # One point per performance frame, where the path first reaches it
+        first = np.flatnonzero(np.diff(np.concatenate(([-1], path_j))))
+        return (path_j[first] * self.step / float(rate_b),
+                path_i[first] * self.step / float(rate_a))
+
+    def align_to_csv(self, reference, performance, csv):
+        """Write the b_a path the way sonic-annotator's csv writer does"""
+        times, values = self.align(reference, performance)
+        tmp = csv + ".tmp"
+        with open(tmp, "w") as fp:
+            for t, v in zip(times, values):
+                fp.write("{:.9f},{:g}\n".format(t, v))
+        os.rename(tmp, csv)
+        return csv
@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import os
+import re
+import sys
+import tempfile
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+PY2 = sys.version_info[0] == 2
+text_type = unicode if PY2 else str  # noqa: F821
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_ROW = _MAIN_NS + "row"
+_CELL = _MAIN_NS + "c"
+_VALUE = _MAIN_NS + "v"
+_TEXT = _MAIN_NS + "t"
+_RUN = _MAIN_NS + "r"
+_INLINE = _MAIN_NS + "is"
+_STRING_ITEM = _MAIN_NS + "si"
+
+_DIGITS = "0123456789"
+_REF_RE = re.compile(r"([A-Z]+)(\d+)")
+_SHEET_DATA_RE = re.compile(br"<(\w+:)?sheetData\b[^>]*?(/?)>")
+_DIMENSION_RE = re.compile(br'<(?:\w+:)?dimension\b[^>]*?\bref="([^"]*)"')
+_ROOT_RE = re.compile(br"<(?:\w+:)?worksheet\b[^>]*>")
+_XMLNS_RE = re.compile(br'\bxmlns(?::\w+)?="[^"]*"')
+_MERGE_RE = re.compile(br'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Z]+\d+):([A-Z]+\d+)"')
+# Characters XML 1.0 cannot carry
+_ILLEGAL_XML_RE = re.compile(u"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_XML_SPECIAL_RE = re.compile(u"[&<>\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+XLS_MAX_ROWS = 65536
+
+
+def _col_index(letters, _cache={}):
+    col = _cache.get(letters)
+    if col is None:
+        col = 0
+        for ch in letters:
+            col = col * 26 + ord(ch) - 64
+        col = _cache[letters] = col - 1
+    return col
+
+
+def _col_letters(col):
+    letters = ""
+    col += 1
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _ref(ref):
+    """(row, col) of a cell reference such as B12"""
+    m = _REF_RE.match(ref)
+    return int(m.group(2)) - 1, _col_index(m.group(1))
+
+
+class MergedCells(object):
+    """Fills merged cells with the value of their first cell.
+
+    Ranges are (rlo, rhi, clo, chi) like xlrd's merged_cells.  Rows must
+    be handed to fill in increasing order: a range becomes active on its
+    first row, which is where its value is taken from, and is dropped
+    after its last one, so every row only looks at the ranges covering it
+    instead of a dict holding every merged cell of the sheet.  Rows before
+    fill_from are returned as they are.
+    """
+
+    def __init__(self, ranges, fill_from=0):
+        # Popped from the end, smallest first row first
+        self.pending = sorted(ranges, reverse=True)
+        self.active = []
+        self.fill_from = fill_from
+
+    def fill(self, index, values):
+        pending = self.pending
+        while pending and pending[-1][0] <= index:
+            rlo, rhi, clo, chi = pending.pop()
+            # A range whose first row was skipped has no value to spread
+            value = values[clo] if rlo == index and clo < len(values) else u""
+            self.active.append((rlo, rhi, clo, chi, value))
+        if self.active and index >= self.fill_from:
+            self.active = [item for item in self.active if item[1] > index]
+            for rlo, rhi, clo, chi, value in self.active:
+                for col in range(clo, min(chi, len(values))):
+                    # 合并单元格的首格是有值的，所以在这里进行了去重
+                    if not values[col] and (index, col) != (rlo, clo):
+                        values[col] = value
+        return values
+
+
+def iter_rows(path, sheet_name=u"Sheet1", fill_from=1):
+    """Rows of a sheet as lists of cell values like xlrd's row_values,
+    header included, merged cells from row fill_from on (the header is
+    left alone) filled with their first cell's value.
+
+    xlsx files are parsed as a stream, only the shared strings and the
+    merged ranges stay in memory.  Other files go through xlrd.
+    """
+    if zipfile.is_zipfile(path):
+        return _xlsx_rows(path, sheet_name, fill_from)
+    return _xlrd_rows(path, sheet_name, fill_from)
+
+
+def _xlrd_rows(path, sheet_name, fill_from):
+    import xlrd
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    sheet = workbook.sheet_by_name(sheet_name)
+    merged = MergedCells(sheet.merged_cells, fill_from)
+    for i in range(sheet.nrows):
+        yield merged.fill(i, sheet.row_values(i))
+
+
+def _xlsx_sheet(zf, sheet_name):
+    """Archive paths of the worksheet called sheet_name and of the shared
+    strings (None if there are none)"""
+    workbook = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    rels = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    shared = None
+    for rel in rels:
+        target = rel.get("Target")
+        target = target[1:] if target.startswith("/") else "xl/" + target
+        targets[rel.get("Id")] = target
+        if rel.get("Type", "").endswith("/sharedStrings"):
+            shared = target
+    for sheet in workbook.iter(_MAIN_NS + "sheet"):
+        if sheet.get("name") == sheet_name:
+            return targets[sheet.get(_REL_NS + "id")], shared
+    raise ValueError(u"No sheet named {}".format(sheet_name))
+
+
+def _text(elem):
+    """Text of a shared or inline string, rich text runs joined and
+    phonetic runs left out"""
+    parts = []
+    for child in elem:
+        if child.tag == _TEXT:
+            parts.append(child.text or u"")
+        elif child.tag == _RUN:
+            parts.append(child.findtext(_TEXT) or u"")
+    return u"".join(parts)
+
+
+def _shared_strings(zf, member):
+    strings = []
+    if member is None or member not in zf.namelist():
+        return strings
+    fp = zf.open(member)
+    try:
+        for _, elem in ElementTree.iterparse(fp):
+            if elem.tag == _STRING_ITEM:
+                strings.append(text_type(_text(elem)))
+                elem.clear()
+    finally:
+        fp.close()
+    return strings
+
+
+def _merged_ranges(zf, member, chunk_size=1024 * 1024):
+    """Merged ranges of a worksheet.  They follow the cell data, so the
+    raw xml is scanned for them before the rows are parsed"""
+    ranges = []
+    fp = zf.open(member)
+    try:
+        tail = b""
+        while True:
+            chunk = fp.read(chunk_size)
+            buf = tail + chunk
+            # A tag cut by the chunk boundary is completed by the next chunk
+            cut = buf.rfind(b"<") if chunk else len(buf)
+            if cut < 0:
+                cut = len(buf)
+            for m in _MERGE_RE.finditer(buf, 0, cut):
+                (rlo, clo), (rlast, clast) = _ref(m.group(1).decode()), _ref(m.group(2).decode())
+                ranges.append((rlo, rlast + 1, clo, clast + 1))
+            tail = buf[cut:]
+            if not chunk:
+                return ranges
+    finally:
+        fp.close()
+
+
+def _cell_value(cell, strings):
+    kind = cell.get("t")
+    if kind == "inlineStr":
+        inline = cell.find(_INLINE)
+        return text_type(_text(inline)) if inline is not None else u""
+    text = cell.findtext(_VALUE)
+    if text is None:
+        return u""
+    if kind == "s":
+        return strings[int(text)]
+    if kind == "b":
+        return int(text)
+    if kind in ("str", "e"):
+        return text_type(text)
+    return float(text)
+
+
+def _row_batches(fp, chunk_size=256 * 1024):
+    """Column count of the sheet's dimension (0 if it has none), then
+    lists of parsed row elements.
+
+    The rows are cut out of the raw xml at row end tags and parsed a
+    batch at a time, which keeps the per element work in C: iterparse
+    costs a Python level event for every cell and value element.
+    """
+    buf = b""
+    while True:
+        m = _SHEET_DATA_RE.search(buf)
+        if m is not None:
+            break
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            yield 0
+            return
+        buf += chunk
+    head = buf[:m.start()]
+    dimension = _DIMENSION_RE.search(head)
+    last = dimension.group(1).decode().split(":")[-1] if dimension else ""
+    yield _ref(last)[1] + 1 if _REF_RE.match(last) else 0
+    if m.group(2):
+        # <sheetData/>
+        return
+    root = _ROOT_RE.search(head)
+    namespaces = b" ".join(_XMLNS_RE.findall(root.group(0))) if root else b""
+    wrap = b"<rows " + namespaces + b">"
+    row_end = b"</" + (m.group(1) or b"") + b"row>"
+    buf = buf[m.end():]
+    while True:
+        chunk = fp.read(chunk_size)
+        buf += chunk
+        cut = buf.rfind(row_end)
+        if cut >= 0:
+            cut += len(row_end)
+            yield list(ElementTree.fromstring(wrap + buf[:cut] + b"</rows>"))
+            buf = buf[cut:]
+        if not chunk:
+            return
+
+
+def _xlsx_rows(path, sheet_name, fill_from):
+    with zipfile.ZipFile(path) as zf:
+        member, shared = _xlsx_sheet(zf, sheet_name)
+        strings = _shared_strings(zf, shared)
+        merged = MergedCells(_merged_ranges(zf, member), fill_from)
+        next_row = 0
+        fp = zf.open(member)
+        try:
+            batches = _row_batches(fp)
+            ncols = next(batches)
+            for batch in batches:
+                for elem in batch:
+                    if elem.tag != _ROW:
+                        continue
+                    r = elem.get("r")
+                    index = int(r) - 1 if r else next_row
+                    # Rows without cells are left out of the xml
+                    while next_row < index:
+                        yield merged.fill(next_row, [u""] * ncols)
+                        next_row += 1
+                    values = []
+                    for cell in elem:
+                        if cell.tag != _CELL:
+                            continue
+                        ref = cell.get("r")
+                        col = _col_index(ref.rstrip(_DIGITS)) if ref else len(values)
+                        if col > len(values):
+                            values.extend([u""] * (col - len(values)))
+                        value = _cell_value(cell, strings)
+                        if col == len(values):
+                            values.append(value)
+                        else:
+                            values[col] = value
+                    if len(values) < ncols:
+                        values.extend([u""] * (ncols - len(values)))
+                    ncols = len(values)
+                    yield merged.fill(index, values)
+                    next_row = index + 1
+        finally:
+            fp.close()
+
+
+def open_writer(path, sheet_name=u"Sheet1"):
+    """Row writer for path, by extension: .csv, .xlsx or .xls"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return CsvWriter(path)
+    if ext == ".xlsx":
+        return XlsxWriter(path, sheet_name)
+    if ext == ".xls":
+        return XlsWriter(path, sheet_name)
+    raise ValueError(u"unsupported result type {}".format(path))
+
+
+class CsvWriter(object):
+    """utf-8 csv (with a BOM so Excel detects it), every row is on disk
+    once writerow returns"""
+
+    def __init__(self, path):
+        self.path = path
+        if PY2:
+            self.fp = open(path, "wb")
+            self.fp.write(b"\xef\xbb\xbf")
+        else:
+            self.fp = io.open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.fp)
+
+    def writerow(self, values):
+        if PY2:
+            values = [v.encode("utf-8") if isinstance(v, unicode) else v  # noqa: F821
+                      for v in values]
+        self.writer.writerow(values)
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+class XlsxWriter(object):
+    """Writes an xlsx with inline strings.  Rows go to a temporary sheet
+    file as they come, close zips it up with the other parts, so the rows
+    are never all in memory"""
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>')
+    ROOT_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>')
+    WORKBOOK = (
+        u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        u'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        u'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        u'<sheets><sheet name="{}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+    WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>')
+
+    def __init__(self, path, sheet_name=u"Sheet1"):
+        self.path = path
+        self.sheet_name = sheet_name
+        self.rows = 0
+        self.merges = []
+        self.letters = []
+        fd, self.sheet_path = tempfile.mkstemp(
+            suffix=".xml", dir=os.path.dirname(os.path.abspath(path)))
+        self.fp = os.fdopen(fd, "wb")
+        self.fp.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                      b'<sheetData>')
+
+    def cell(self, ref, value):
+        if value.__class__ is not text_type:
+            if isinstance(value, bool):
+                return u'<c r="' + ref + u'" t="b"><v>' + (u"1" if value else u"0") + u"</v></c>"
+            if isinstance(value, (int, float)) or (PY2 and isinstance(value, long)):  # noqa: F821
+                return u'<c r="' + ref + u'"><v>' + text_type(repr(value)) + u"</v></c>"
+            if value is None:
+                return u""
+            value = value.decode("utf-8") if isinstance(value, bytes) else text_type(value)
+        if not value:
+            return u""
+        if _XML_SPECIAL_RE.search(value):
+            value = escape(_ILLEGAL_XML_RE.sub(u"", value))
+        if value[:1].isspace() or value[-1:].isspace():
+            return u'<c r="' + ref + u'" t="inlineStr"><is><t xml:space="preserve">' + value + u"</t></is></c>"
+        return u'<c r="' + ref + u'" t="inlineStr"><is><t>' + value + u"</t></is></c>"
+
+    def writerow(self, values):
+        letters = self.letters
+        while len(letters) < len(values):
+            letters.append(_col_letters(len(letters)))
+        self.rows += 1
+        number = text_type(self.rows)
+        parts = [u'<row r="{}">'.format(number)]
+        for col, value in enumerate(values):
+            parts.append(self.cell(letters[col] + number, value))
+        parts.append(u"</row>")
+        self.fp.write(u"".join(parts).encode("utf-8"))
+
+    def merge(self, rlo, rhi, clo, chi):
+        """Merge rows rlo..rhi-1 x columns clo..chi-1, like xlrd's merged_cells"""
+        self.merges.append(u"{}{}:{}{}".format(_col_letters(clo), rlo + 1, _col_letters(chi - 1), rhi))
+
+    def close(self):
+        try:
+            self.fp.write(b"</sheetData>")
+            if self.merges:
+                self.fp.write(u'<mergeCells count="{}">{}</mergeCells>'.format(
+                    len(self.merges),
+                    u"".join(u'<mergeCell ref="{}"/>'.format(ref) for ref in self.merges)
+                ).encode("utf-8"))
+            self.fp.write(b"</worksheet>")
+            self.fp.close()
+            tmp = self.path + ".tmp"
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+                zf.writestr("_rels/.rels", self.ROOT_RELS)
+                zf.writestr("xl/workbook.xml", self.WORKBOOK.format(
+                    escape(self.sheet_name, {'"': "&quot;"})).encode("utf-8"))
+                zf.writestr("xl/_rels/workbook.xml.rels", self.WORKBOOK_RELS)
+                zf.write(self.sheet_path, "xl/worksheets/sheet1.xml")
+            os.rename(tmp, self.path)
+        finally:
+            if not self.fp.closed:
+                self.fp.close()
+            os.remove(self.sheet_path)
+
+
+class XlsWriter(object):
+    """xlwt writer.  xlwt only saves whole workbooks, rows are flushed
+    into their packed record form every FLUSH_ROWS rows to keep that
+    small, and an xls sheet holds at most XLS_MAX_ROWS rows"""
+
+    FLUSH_ROWS = 1000
+
+    def __init__(self, path, sheet_name=u"Sheet1"):
+        import xlwt
+        self.path = path
+        self.workbook = xlwt.Workbook()
+        self.sheet = self.workbook.add_sheet(sheet_name, cell_overwrite_ok=True)
+        self.rows = 0
+
+    def writerow(self, values):
+        if self.rows >= XLS_MAX_ROWS:
+            raise ValueError("xls sheets hold at most {} rows, write xlsx or csv".format(XLS_MAX_ROWS))
+        for col, value in enumerate(values):
+            self.sheet.write(self.rows, col, value)
+        self.rows += 1
+        if self.rows % self.FLUSH_ROWS == 0:
+            self.sheet.flush_row_data()
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+class OrderedWriter(object):
+    """Hands rows put in any order to writer in key order: a row is
+    written once every row with a smaller key is.  Keys are consecutive
+    from first_key."""
+
+    def __init__(self, writer, first_key=0):
+        self.writer = writer
+        self.next_key = first_key
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def put(self, key, values):
+        with self.lock:
+            self.pending[key] = values
+            while self.next_key in self.pending:
+                self.writer.writerow(self.pending.pop(self.next_key))
+                self.next_key += 1
+
+    def close(self):
+        with self.lock:
+            # Only left over if a key was never put
+            for key in sorted(self.pending):
+                self.writer.writerow(self.pending.pop(key))
+            self.writer.close()
@@ -1,14 +1,45 @@
 # -*- coding: utf-8 -*-
+import os
 import re
+import tempfile
+import threading
 import time
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Guards the per process setup, see IdWorker._ensure_process
+_process_lock = threading.Lock()
+
 
 class IdWorker(object):
-    def __init__(self, worker_id=1, data_center_id=2):
+    """Snowflake ids: milliseconds since twepoch, data center id, worker id
+    and a sequence within the millisecond.
+
+    Thread safe.  Without a worker_id every process takes the first free
+    worker id of the data center: the one whose lock file in lock_dir it
+    can flock (released when the process exits), or pid % 32 where there
+    is no fcntl.  A forked child takes its own on first use.  When the
+    sequence of a millisecond runs out, or the clock goes backwards, it
+    sleeps until the clock reaches the next (or the last used) millisecond.
+    """
+    # User agents remembered as valid
+    MAX_USER_AGENTS = 1024
+
+    def __init__(self, worker_id=None, data_center_id=2, lock_dir=None):
         self.worker_id = worker_id
         self.data_center_id = data_center_id
+        self.auto_worker_id = worker_id is None
+        self.lock_dir = lock_dir or os.path.join(
+            tempfile.gettempdir(), "snowflake-{}".format(data_center_id))
+        self.lock_file = None
+        self.pid = None
+        self.lock = threading.Lock()
 
         self.user_agent_parser = re.compile("^[a-zA-Z][a-zA-Z\-0-9]*$")
+        self.valid_user_agents = set()
 
         # stats
         self.ids_generated = 0
@@ -30,9 +61,11 @@ class IdWorker(object):
         self.sequence_mask = -1L ^ (-1L << self.sequence_bits)
 
         self.last_timestamp = -1L
+        # data center and worker id bits of every id
+        self.node_bits = 0L
 
         # Sanity check for worker_id
-        if self.worker_id > self.max_worker_id or self.worker_id < 0:
+        if not self.auto_worker_id and (self.worker_id > self.max_worker_id or self.worker_id < 0):
             raise Exception(
                 "worker_id", "worker id can't be greater than %i or less than 0" % self.max_worker_id)
 
@@ -40,53 +73,128 @@ class IdWorker(object):
             raise Exception(
                 "data_center_id", "data center id can't be greater than %i or less than 0" % self.max_data_center_id)
 
+    def _ensure_process(self):
+        """Worker id setup, once per process"""
+        pid = os.getpid()
+        if pid == self.pid:
+            return
+        with _process_lock:
+            if pid == self.pid:
+                return
+            if self.pid is not None:
+                # Forked, the parent's lock may have been held by another thread
+                self.lock = threading.Lock()
+            if self.auto_worker_id:
+                self.worker_id = self._allocate_worker_id()
+            self.node_bits = (self.data_center_id << self.data_center_id_shift) | \
+                (self.worker_id << self.worker_id_shift)
+            self.pid = pid
+
+    def _allocate_worker_id(self):
+        if self.lock_file is not None:
+            # Inherited through fork, the lock stays with the parent's copy
+            self.lock_file.close()
+            self.lock_file = None
+        if fcntl is None:
+            return os.getpid() % (self.max_worker_id + 1)
+        try:
+            os.makedirs(self.lock_dir)
+        except OSError:
+            if not os.path.isdir(self.lock_dir):
+                raise
+        for worker_id in range(self.max_worker_id + 1):
+            try:
+                fp = open(os.path.join(self.lock_dir, "worker-{}.lock".format(worker_id)), "a+")
+            except IOError:
+                # Left by another user, taken as far as we can tell
+                continue
+            try:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                fp.close()
+                continue
+            fp.truncate(0)
+            fp.write("{}\n".format(os.getpid()))
+            fp.flush()
+            self.lock_file = fp
+            return worker_id
+        raise Exception(
+            "worker_id", "all %i worker ids in %s are taken" % (self.max_worker_id + 1, self.lock_dir))
+
     def _time_gen(self):
         return long(int(time.time() * 1000))
 
-    def _till_next_millis(self, last_timestamp):
-        timestamp = self._time_gen()
-        while last_timestamp <= timestamp:
-            timestamp = self._time_gen()
-
-        return timestamp
+    def _wait_until(self, timestamp):
+        """Sleep until the clock reaches timestamp, returns the clock then"""
+        now = self._time_gen()
+        while now < timestamp:
+            time.sleep((timestamp - now) / 1000.0)
+            now = self._time_gen()
+        return now
 
-    def _next_id(self):
-        timestamp = self._time_gen()
-
-        if self.last_timestamp > timestamp:
-
-            raise Exception(
-                "Clock moved backwards. Refusing to generate id for %i milliseocnds" % self.last_timestamp)
-
-        if self.last_timestamp == timestamp:
-            self.sequence = (self.sequence + 1) & self.sequence_mask
-            if self.sequence == 0:
-                timestamp = self._till_next_millis(self.last_timestamp)
-        else:
-            self.sequence = 0
-
-        self.last_timestamp = timestamp
-
-        new_id = ((timestamp - self.twepoch) << self.timestamp_left_shift) | (self.data_center_id <<
-                                                                              self.data_center_id_shift) | (self.worker_id << self.worker_id_shift) | self.sequence
-        self.ids_generated += 1
-        return new_id
+    def _till_next_millis(self, last_timestamp):
+        return self._wait_until(last_timestamp + 1)
 
     def _valid_user_agent(self, user_agent):
-        return self.user_agent_parser.search(user_agent) is not None
+        if user_agent in self.valid_user_agents:
+            return True
+        if self.user_agent_parser.search(user_agent) is None:
+            return False
+        if len(self.valid_user_agents) < self.MAX_USER_AGENTS:
+            self.valid_user_agents.add(user_agent)
+        return True
 
     def get_worker_id(self):
+        self._ensure_process()
         return self.worker_id
 
     def get_timestamp(self):
         return self._time_gen()
 
+    def _reserve(self, count):
+        """First id and count of a run of at most count ids, with self.lock
+        held"""
+        timestamp = self._time_gen()
+        if timestamp < self.last_timestamp:
+            # Clock moved backwards, wait for it to catch up
+            timestamp = self._wait_until(self.last_timestamp)
+        if timestamp == self.last_timestamp:
+            first = self.sequence + 1
+            if first > self.sequence_mask:
+                timestamp = self._till_next_millis(self.last_timestamp)
+                first = 0
+        else:
+            first = 0
+        count = min(count, self.sequence_mask + 1 - first)
+        self.sequence = first + count - 1
+        self.last_timestamp = timestamp
+        return ((timestamp - self.twepoch) << self.timestamp_left_shift) | self.node_bits | first, count
+
     def get_id(self, useragent="snowflake2017"):
-        if not self._valid_user_agent(useragent):
+        if useragent not in self.valid_user_agents and not self._valid_user_agent(useragent):
             raise Exception("valid user agent")
-        new_id = self._next_id()
+        if self.pid != os.getpid():
+            self._ensure_process()
+        with self.lock:
+            new_id = self._reserve(1)[0]
+            self.ids_generated += 1
         return new_id
 
+    def get_ids(self, n, useragent="snowflake2017"):
+        """n increasing ids, a millisecond's free sequence numbers are
+        taken at once"""
+        if useragent not in self.valid_user_agents and not self._valid_user_agent(useragent):
+            raise Exception("valid user agent")
+        if self.pid != os.getpid():
+            self._ensure_process()
+        ids = []
+        with self.lock:
+            while len(ids) < n:
+                first, count = self._reserve(n - len(ids))
+                ids.extend(range(first, first + count))
+            self.ids_generated += n
+        return ids
+
     def get_datacenter_id(self):
         return self.data_center_id
 
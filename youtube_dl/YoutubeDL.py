@@ -60,6 +60,7 @@ from .utils import (
     format_bytes,
     formatSeconds,
     GeoRestrictedError,
+    HTTPConnectionPool,
     int_or_none,
     ISO3166Utils,
     locked_file,
@@ -92,9 +93,11 @@ from .utils import (
     YoutubeDLCookieProcessor,
     YoutubeDLHandler,
 )
-from .cache import Cache
+from .cache import Cache, ResolvedURLCache
 from .extractor import get_info_extractor, gen_extractor_classes, _LAZY_LOADER
+from .extractor.dispatch import ExtractorIndex
 from .extractor.openload import PhantomJSwrapper
+from .profiler import ExtractionProfiler
 
 
 from .version import __version__
@@ -123,12 +126,18 @@ class YoutubeDL(object):
     _num_downloads = None
     _screen_file = None
 
+    # The smallest audio-only format that is still good enough to match
+    # against, then the smallest mp4 with audio
+    DEFAULT_RESOLVE_FORMAT = 'worstaudio[abr>=?96]/bestaudio/worst[ext=mp4]/best'
+
     def __init__(self, params=None, auto_init=True):
         """Create a FileDownloader object with the given options."""
         if params is None:
             params = {}
         self._ies = []
         self._ies_instances = {}
+        self._ies_index = None
+        self._format_selectors = {}
         self._pps = []
         self._progress_hooks = []
         self._download_retcode = 0
@@ -141,6 +150,11 @@ class YoutubeDL(object):
         }
         self.params.update(params)
         self.cache = Cache(self)
+        self.resolved_cache = ResolvedURLCache(self)
+        self.profiler = None
+        if self.params.get('profile_file') or self.params.get('profile_hooks'):
+            self.profiler = ExtractionProfiler(
+                self.params.get('profile_file'), self.params.get('profile_hooks', []))
 
         def check_deprecated(param, option, suggestion):
             if self.params.get(param) is not None:
@@ -235,6 +249,10 @@ class YoutubeDL(object):
 
     def add_info_extractor(self, ie):
         """Add an InfoExtractor object to the end of the list."""
+        # An instance of an already listed class matches nothing new, the
+        # dispatch index stays valid.
+        if isinstance(ie, type) or type(ie) not in self._ies:
+            self._ies_index = None
         self._ies.append(ie)
         if not isinstance(ie, type):
             self._ies_instances[ie.ie_key()] = ie
@@ -256,6 +274,13 @@ class YoutubeDL(object):
 
 
 
+    def _suitable_ies(self, url):
+        """The first suitable extractor for url, as a list"""
+        if self._ies_index is None:
+            self._ies_index = ExtractorIndex(self._ies)
+        ie = self._ies_index.first_suitable(url)
+        return [] if ie is None else [ie]
+
     def add_default_info_extractors(self):
         """
         Add the InfoExtractors returned by gen_extractors to the end of the list
@@ -351,6 +376,8 @@ class YoutubeDL(object):
 
         if self.params.get('cookiefile') is not None:
             self.cookiejar.save(ignore_discard=True, ignore_expires=True)
+        if self.connection_pool is not None:
+            self.connection_pool.close()
 
     def trouble(self, message=None, tb=None):
         """Determine action to take when a download problem appears.
@@ -458,14 +485,34 @@ class YoutubeDL(object):
             info_dict.setdefault(key, value)
 
     def extract_info(self, url, download=False, ie_key=None, extra_info={},
-                     process=True, force_generic_extractor=False):
-        myurl = ""
+                     process=True, force_generic_extractor=False, format_spec=None):
+        """Resolve url to the format dict chosen by format_spec.
+
+        See select_format for format_spec.  The result has url,
+        http_headers, protocol, ext and whatever else the extractor knows
+        (filesize, abr, acodec, ...), or requested_formats for a merge.
+        Errors are reported through report_error, None is returned when
+        they are ignored.
+
+        With the profile_file or profile_hooks params, every call (not the
+        ones it makes for url results) is profiled, see ExtractionProfiler.
+        """
+        profiler = self.profiler
+        if profiler is not None and not profiler.active:
+            with profiler.extraction(url) as record:
+                res = self.extract_info(
+                    url, download, ie_key, extra_info, process,
+                    force_generic_extractor, format_spec)
+                record['ok'] = res is not None
+            return res
+        res = None
+        format_spec = format_spec or self.params.get('format') or self.DEFAULT_RESOLVE_FORMAT
         if not ie_key and force_generic_extractor:
             ie_key = 'Generic'
         if ie_key:
             ies = [self.get_info_extractor(ie_key)]
         else:
-            ies = self._ies
+            ies = self._suitable_ies(url)
         for ie in ies:
             if not ie.suitable(url):
                 continue
@@ -473,14 +520,24 @@ class YoutubeDL(object):
             if not ie.working():
                 self.report_warning('The program functionality for this site has been marked as broken, '
                                     'and will probably not work.')
+            cache_key = self.resolved_cache.make_key(ie, url, format_spec)
+            cached = self.resolved_cache.get(cache_key)
+            if cached is not None:
+                res = cached
+                break
             try:
                 ie_result = ie.extract(url)
                 if ie_result is None:  # Finished already (backwards compatibility; listformats and friends should be moved here)
                     break
-                for mydic in ie_result["formats"]:
-                    if mydic["ext"] == "mp4" and mydic["acodec"] != "none":
-                        myurl = mydic["url"]
-                        break
+                if ie_result.get('_type') in ('url', 'url_transparent'):
+                    res = self.extract_info(
+                        ie_result['url'], ie_key=ie_result.get('ie_key'),
+                        format_spec=format_spec)
+                else:
+                    res = self.select_format(ie_result, format_spec)
+                if res is not None:
+                    first = (res.get('requested_formats') or [res])[0]
+                    self.resolved_cache.put(cache_key, ie, res, first['url'])
                 break
             except GeoRestrictedError as e:
                 msg = e.msg
@@ -503,7 +560,8 @@ class YoutubeDL(object):
                     raise
         else:
             self.report_error('no suitable InfoExtractor for URL %s' % url)
-        return myurl
+        return res
+
     def add_default_extra_info(self, ie_result, ie, url):
         self.add_extra_info(ie_result, {
             'extractor': ie.IE_NAME,
@@ -757,7 +815,7 @@ class YoutubeDL(object):
                 comparison_value = m.group('value')
                 str_op = STR_OPERATORS[m.group('op')]
                 if m.group('negation'):
-                    op = lambda attr, value: not str_op
+                    op = lambda attr, value: not str_op(attr, value)
                 else:
                     op = str_op
 
@@ -770,6 +828,232 @@ class YoutubeDL(object):
                 return m.group('none_inclusive')
             return op(actual_value, comparison_value)
         return _filter
+
+    def build_format_selector(self, format_spec):
+        def syntax_error(note, start):
+            message = (
+                'Invalid format specification: '
+                '{0}\n\t{1}\n\t{2}^'.format(note, format_spec, ' ' * start[1]))
+            return SyntaxError(message)
+
+        PICKFIRST = 'PICKFIRST'
+        MERGE = 'MERGE'
+        SINGLE = 'SINGLE'
+        GROUP = 'GROUP'
+        FormatSelector = collections.namedtuple('FormatSelector', ['type', 'selector', 'filters'])
+
+        def _parse_filter(tokens):
+            filter_parts = []
+            for type, string, start, _, _ in tokens:
+                if type == tokenize.OP and string == ']':
+                    return ''.join(filter_parts)
+                else:
+                    filter_parts.append(string)
+
+        def _remove_unused_ops(tokens):
+            # Remove operators that we don't use and join them with the surrounding strings
+            # for example: 'mp4' '-' 'baseline' '-' '16x9' is converted to 'mp4-baseline-16x9'
+            ALLOWED_OPS = ('/', '+', ',', '(', ')')
+            last_string, last_start, last_end, last_line = None, None, None, None
+            for type, string, start, end, line in tokens:
+                if type == tokenize.OP and string == '[':
+                    if last_string:
+                        yield tokenize.NAME, last_string, last_start, last_end, last_line
+                        last_string = None
+                    yield type, string, start, end, line
+                    # everything inside brackets will be handled by _parse_filter
+                    for type, string, start, end, line in tokens:
+                        yield type, string, start, end, line
+                        if type == tokenize.OP and string == ']':
+                            break
+                elif type == tokenize.OP and string in ALLOWED_OPS:
+                    if last_string:
+                        yield tokenize.NAME, last_string, last_start, last_end, last_line
+                        last_string = None
+                    yield type, string, start, end, line
+                elif type in [tokenize.NAME, tokenize.NUMBER, tokenize.OP]:
+                    if not last_string:
+                        last_string = string
+                        last_start = start
+                        last_end = end
+                    else:
+                        last_string += string
+            if last_string:
+                yield tokenize.NAME, last_string, last_start, last_end, last_line
+
+        def _parse_format_selection(tokens, inside_merge=False, inside_choice=False, inside_group=False):
+            selectors = []
+            current_selector = None
+            for type, string, start, _, _ in tokens:
+                # ENCODING is only defined in python 3.x
+                if type == getattr(tokenize, 'ENCODING', None):
+                    continue
+                elif type in [tokenize.NAME, tokenize.NUMBER]:
+                    current_selector = FormatSelector(SINGLE, string, [])
+                elif type == tokenize.OP:
+                    if string == ')':
+                        if not inside_group:
+                            # ')' will be handled by the parentheses group
+                            tokens.restore_last_token()
+                        break
+                    elif inside_merge and string in ['/', ',']:
+                        tokens.restore_last_token()
+                        break
+                    elif inside_choice and string == ',':
+                        tokens.restore_last_token()
+                        break
+                    elif string == ',':
+                        if not current_selector:
+                            raise syntax_error('"," must follow a format selector', start)
+                        selectors.append(current_selector)
+                        current_selector = None
+                    elif string == '/':
+                        if not current_selector:
+                            raise syntax_error('"/" must follow a format selector', start)
+                        first_choice = current_selector
+                        second_choice = _parse_format_selection(tokens, inside_choice=True)
+                        current_selector = FormatSelector(PICKFIRST, (first_choice, second_choice), [])
+                    elif string == '[':
+                        if not current_selector:
+                            current_selector = FormatSelector(SINGLE, 'best', [])
+                        format_filter = _parse_filter(tokens)
+                        current_selector.filters.append(format_filter)
+                    elif string == '(':
+                        if current_selector:
+                            raise syntax_error('Unexpected "("', start)
+                        group = _parse_format_selection(tokens, inside_group=True)
+                        current_selector = FormatSelector(GROUP, group, [])
+                    elif string == '+':
+                        video_selector = current_selector
+                        audio_selector = _parse_format_selection(tokens, inside_merge=True)
+                        if not video_selector or not audio_selector:
+                            raise syntax_error('"+" must be between two format selectors', start)
+                        current_selector = FormatSelector(MERGE, (video_selector, audio_selector), [])
+                    else:
+                        raise syntax_error('Operator not recognized: "{0}"'.format(string), start)
+                elif type == tokenize.ENDMARKER:
+                    break
+            if current_selector:
+                selectors.append(current_selector)
+            return selectors
+
+        def _build_selector_function(selector):
+            if isinstance(selector, list):
+                fs = [_build_selector_function(s) for s in selector]
+
+                def selector_function(ctx):
+                    for f in fs:
+                        for format in f(ctx):
+                            yield format
+                return selector_function
+            elif selector.type == GROUP:
+                selector_function = _build_selector_function(selector.selector)
+            elif selector.type == PICKFIRST:
+                fs = [_build_selector_function(s) for s in selector.selector]
+
+                def selector_function(ctx):
+                    for f in fs:
+                        picked_formats = list(f(ctx))
+                        if picked_formats:
+                            return picked_formats
+                    return []
+            elif selector.type == SINGLE:
+                format_spec = selector.selector
+
+                def selector_function(ctx):
+                    formats = list(ctx['formats'])
+                    if not formats:
+                        return
+                    if format_spec == 'all':
+                        for f in formats:
+                            yield f
+                    elif format_spec in ['best', 'worst', None]:
+                        format_idx = 0 if format_spec == 'worst' else -1
+                        audiovideo_formats = [
+                            f for f in formats
+                            if f.get('vcodec') != 'none' and f.get('acodec') != 'none']
+                        if audiovideo_formats:
+                            yield audiovideo_formats[format_idx]
+                        # for extractors with incomplete formats (audio only (soundcloud)
+                        # or video only (imgur)) we will fallback to best/worst
+                        # {video,audio}-only format
+                        elif ctx['incomplete_formats']:
+                            yield formats[format_idx]
+                    elif format_spec in ['bestaudio', 'worstaudio']:
+                        audio_formats = [
+                            f for f in formats
+                            if f.get('vcodec') == 'none']
+                        if audio_formats:
+                            yield audio_formats[0 if format_spec == 'worstaudio' else -1]
+                    elif format_spec in ['bestvideo', 'worstvideo']:
+                        video_formats = [
+                            f for f in formats
+                            if f.get('acodec') == 'none']
+                        if video_formats:
+                            yield video_formats[0 if format_spec == 'worstvideo' else -1]
+                    else:
+                        extensions = ['mp4', 'flv', 'webm', '3gp', 'm4a', 'mp3', 'ogg', 'aac', 'wav']
+                        if format_spec in extensions:
+                            filter_f = lambda f: f['ext'] == format_spec
+                        else:
+                            filter_f = lambda f: f['format_id'] == format_spec
+                        matches = list(filter(filter_f, formats))
+                        if matches:
+                            yield matches[-1]
+            elif selector.type == MERGE:
+                def _merge(formats_info):
+                    format_1, format_2 = [f['format_id'] for f in formats_info]
+                    # The first format must contain the video and the
+                    # second the audio
+                    if formats_info[0].get('vcodec') == 'none':
+                        self.report_error('The first format must '
+                                          'contain the video, try using '
+                                          '"-f %s+%s"' % (format_2, format_1))
+                        return
+                    # Formats must be opposite (video+audio)
+                    if formats_info[0].get('acodec') == 'none' and formats_info[1].get('acodec') == 'none':
+                        self.report_error(
+                            'Both formats %s and %s are video-only, you must specify "-f video+audio"'
+                            % (format_1, format_2))
+                        return
+                    output_ext = (
+                        formats_info[0]['ext']
+                        if self.params.get('merge_output_format') is None
+                        else self.params['merge_output_format'])
+                    return {
+                        'requested_formats': formats_info,
+                        'format': '%s+%s' % (formats_info[0].get('format'),
+                                             formats_info[1].get('format')),
+                        'format_id': '%s+%s' % (formats_info[0].get('format_id'),
+                                                formats_info[1].get('format_id')),
+                        'width': formats_info[0].get('width'),
+                        'height': formats_info[0].get('height'),
+                        'resolution': formats_info[0].get('resolution'),
+                        'fps': formats_info[0].get('fps'),
+                        'vcodec': formats_info[0].get('vcodec'),
+                        'vbr': formats_info[0].get('vbr'),
+                        'stretched_ratio': formats_info[0].get('stretched_ratio'),
+                        'acodec': formats_info[1].get('acodec'),
+                        'abr': formats_info[1].get('abr'),
+                        'ext': output_ext,
+                    }
+                video_selector, audio_selector = map(_build_selector_function, selector.selector)
+
+                def selector_function(ctx):
+                    for pair in itertools.product(video_selector(ctx), audio_selector(ctx)):
+                        yield _merge(pair)
+
+            filters = [self._build_format_filter(f) for f in selector.filters]
+
+            def final_selector(ctx):
+                # Filters only narrow down the list, the format dicts
+                # themselves are never modified
+                ctx_copy = dict(ctx)
+                for _filter in filters:
+                    ctx_copy['formats'] = list(filter(_filter, ctx_copy['formats']))
+                return selector_function(ctx_copy)
+            return final_selector
+
         stream = io.BytesIO(format_spec.encode('utf-8'))
         try:
             tokens = list(_remove_unused_ops(compat_tokenize_tokenize(stream.readline)))
@@ -799,6 +1083,79 @@ class YoutubeDL(object):
         parsed_selector = _parse_format_selection(iter(TokenIterator(tokens)))
         return _build_selector_function(parsed_selector)
 
+    def select_format(self, info_dict, format_spec=None):
+        """Format of the video result info_dict chosen by format_spec.
+
+        format_spec uses the -f grammar and defaults to the format param,
+        then DEFAULT_RESOLVE_FORMAT.  Formats are completed with format_id,
+        ext, protocol and http_headers first; with several selectors
+        ("a,b") the first selected format is returned.
+        """
+        formats = info_dict.get('formats')
+        if formats is None:
+            # Single format results carry the format fields themselves
+            formats = [info_dict]
+        if not formats:
+            raise ExtractorError('No video formats found!')
+
+        for i, format in enumerate(formats):
+            if 'url' not in format:
+                raise ExtractorError('Missing "url" key in result (index %d)' % i)
+            format['url'] = sanitize_url(format['url'])
+            if format.get('format_id') is None:
+                format['format_id'] = compat_str(i)
+            else:
+                # Sanitize format_id from characters used in format selector expression
+                format['format_id'] = re.sub(r'[\s,/+\[\]()]', '_', format['format_id'])
+            if format.get('format') is None:
+                format['format'] = '{id} - {res}{note}'.format(
+                    id=format['format_id'],
+                    res=self.format_resolution(format),
+                    note=' ({0})'.format(format['format_note']) if format.get('format_note') is not None else '',
+                )
+            if format.get('ext') is None:
+                format['ext'] = determine_ext(format['url']).lower()
+            if format.get('protocol') is None:
+                format['protocol'] = determine_protocol(format)
+            full_format_info = info_dict.copy()
+            full_format_info.update(format)
+            format['http_headers'] = self._calc_headers(full_format_info)
+
+        format_spec = format_spec or self.params.get('format') or self.DEFAULT_RESOLVE_FORMAT
+        format_selector = self._format_selectors.get(format_spec)
+        if format_selector is None:
+            format_selector = self._format_selectors[format_spec] = self.build_format_selector(format_spec)
+        # Extractors that only have audio or only video formats can still
+        # fall back to best/worst
+        incomplete_formats = (
+            all(f.get('vcodec') == 'none' for f in formats) or
+            all(f.get('acodec') == 'none' for f in formats))
+        ctx = {
+            'formats': formats,
+            'incomplete_formats': incomplete_formats,
+        }
+        for format in format_selector(ctx):
+            if format is not None:
+                return format
+        raise ExtractorError('requested format not available', expected=True)
+
+    @staticmethod
+    def format_resolution(format, default='unknown'):
+        if format.get('vcodec') == 'none':
+            return 'audio only'
+        if format.get('resolution') is not None:
+            return format['resolution']
+        if format.get('height') is not None:
+            if format.get('width') is not None:
+                res = '%sx%s' % (format['width'], format['height'])
+            else:
+                res = '%sp' % format['height']
+        elif format.get('width') is not None:
+            res = '%dx?' % format['width']
+        else:
+            res = default
+        return res
+
     def _calc_headers(self, info_dict):
         res = std_headers.copy()
 
@@ -1014,8 +1371,15 @@ class YoutubeDL(object):
         proxy_handler = PerRequestProxyHandler(proxies)
 
         debuglevel = 1 if self.params.get('debug_printtraffic') else 0
-        https_handler = make_HTTPS_handler(self.params, debuglevel=debuglevel)
-        ydlh = YoutubeDLHandler(self.params, debuglevel=debuglevel)
+        pool_size = self.params.get('http_pool_size')
+        if pool_size is None:
+            pool_size = 4
+        # Keep-alive connections shared by the http and https handlers
+        self.connection_pool = HTTPConnectionPool(pool_size) if pool_size > 0 else None
+        https_handler = make_HTTPS_handler(
+            self.params, debuglevel=debuglevel, connection_pool=self.connection_pool)
+        ydlh = YoutubeDLHandler(
+            self.params, debuglevel=debuglevel, connection_pool=self.connection_pool)
         data_handler = compat_urllib_request_DataHandler()
         file_handler = compat_urllib_request.FileHandler()
         def file_open(*args, **kwargs):
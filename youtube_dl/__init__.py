@@ -10,6 +10,7 @@ import io
 import os
 import random
 import sys
+import time
 from youtube_dl.options import (
     parseOpts,
 )
@@ -42,7 +43,8 @@ from youtube_dl.extractor.adobepass import MSO_INFO
 from youtube_dl.YoutubeDL import YoutubeDL
 path = os.path.realpath(os.path.abspath(__file__))
 sys.path.insert(0, os.path.dirname(os.path.dirname(path)))
-def _real_main(myurl,argv=None):
+def _build_ydl_opts(argv=None):
+    """Parse youtube-dl command line arguments into YoutubeDL params"""
     # Compatibility fixes for Windows
     if sys.platform == 'win32':
         # https://github.com/rg3/youtube-dl/issues/820
@@ -155,6 +157,11 @@ def _real_main(myurl,argv=None):
         if numeric_limit is None:
             parser.error('invalid max_filesize specified')
         opts.max_filesize = numeric_limit
+    if opts.cache_max_size is not None:
+        numeric_limit = FileDownloader.parse_bytes(opts.cache_max_size)
+        if numeric_limit is None:
+            parser.error('invalid cache max size specified')
+        opts.cache_max_size = numeric_limit
     if opts.sleep_interval is not None:
         if opts.sleep_interval < 0:
             parser.error('sleep interval must be positive or 0')
@@ -181,6 +188,12 @@ def _real_main(myurl,argv=None):
         opts.retries = parse_retries(opts.retries)
     if opts.fragment_retries is not None:
         opts.fragment_retries = parse_retries(opts.fragment_retries)
+    if opts.concurrent_fragment_downloads is not None and opts.concurrent_fragment_downloads < 1:
+        parser.error('concurrent fragments must be positive')
+    if opts.http_connections is not None and opts.http_connections < 1:
+        parser.error('http connections must be positive')
+    if opts.http_pool_size is not None and opts.http_pool_size < 0:
+        parser.error('http pool size must not be negative')
     if opts.buffersize is not None:
         numeric_buffersize = FileDownloader.parse_bytes(opts.buffersize)
         if numeric_buffersize is None:
@@ -332,9 +345,11 @@ def _real_main(myurl,argv=None):
         'fragment_retries': opts.fragment_retries,
         'skip_unavailable_fragments': opts.skip_unavailable_fragments,
         'keep_fragments': opts.keep_fragments,
+        'concurrent_fragment_downloads': opts.concurrent_fragment_downloads,
         'buffersize': opts.buffersize,
         'noresizebuffer': opts.noresizebuffer,
         'http_chunk_size': opts.http_chunk_size,
+        'http_connections': opts.http_connections,
         'continuedl': opts.continue_dl,
         'noprogress': opts.noprogress,
         'progress_with_newline': opts.progress_with_newline,
@@ -373,6 +388,12 @@ def _real_main(myurl,argv=None):
         'max_views': opts.max_views,
         'daterange': date,
         'cachedir': opts.cachedir,
+        'cache_backend': opts.cache_backend,
+        'cache_max_size': opts.cache_max_size,
+        'cache_max_age': opts.cache_max_age,
+        'resolve_cache': opts.resolve_cache,
+        'resolve_cache_ttl': opts.resolve_cache_ttl,
+        'resolve_cache_size': opts.resolve_cache_size,
         'youtube_print_sig_code': opts.youtube_print_sig_code,
         'age_limit': opts.age_limit,
         'download_archive': download_archive_fn,
@@ -383,6 +404,7 @@ def _real_main(myurl,argv=None):
         'socket_timeout': opts.socket_timeout,
         'bidi_workaround': opts.bidi_workaround,
         'debug_printtraffic': opts.debug_printtraffic,
+        'profile_file': opts.profile_file,
         'prefer_ffmpeg': opts.prefer_ffmpeg,
         'include_ads': opts.include_ads,
         'default_search': opts.default_search,
@@ -394,6 +416,7 @@ def _real_main(myurl,argv=None):
         'postprocessors': postprocessors,
         'fixup': opts.fixup,
         'source_address': opts.source_address,
+        'http_pool_size': opts.http_pool_size,
         'call_home': opts.call_home,
         'sleep_interval': opts.sleep_interval,
         'max_sleep_interval': opts.max_sleep_interval,
@@ -416,12 +439,88 @@ def _real_main(myurl,argv=None):
         'autonumber': opts.autonumber if opts.autonumber is True else None,
         'usetitle': opts.usetitle if opts.usetitle is True else None,
     }
-    url = " "
-    with YoutubeDL(ydl_opts) as ydl:
-        url = ydl.extract_info(myurl)
-    return url
+    return ydl_opts
+
+
+class Resolver(object):
+    """Resolve download URLs with one long-lived YoutubeDL.
+
+    Options are parsed and the YoutubeDL (opener, cookie jar, extractor
+    list) is built once, so extractor instances and their player and
+    signature caches stay warm across resolve() calls.  A Resolver is not
+    thread-safe, use one per thread.
+    """
+
+    def __init__(self, argv=None, params=None):
+        ydl_opts = _build_ydl_opts(argv)
+        if params is not None:
+            ydl_opts.update(params)
+        self.ydl = YoutubeDL(ydl_opts)
+        self.ydl.__enter__()
+
+    def resolve(self, url, format_spec=None):
+        """Return the format dict chosen for url (see YoutubeDL.select_format),
+        raise DownloadError on failure"""
+        return self.ydl.extract_info(url, format_spec=format_spec)
+
+    def resolve_many(self, urls):
+        """Resolve every url in order, failed ones resolve to None"""
+        results = []
+        for url in urls:
+            try:
+                results.append(self.resolve(url))
+            except DownloadError:
+                results.append(None)
+        return results
+
+    def close(self):
+        self.ydl.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _real_main(myurl, argv=None):
+    with Resolver(argv) as resolver:
+        return resolver.resolve(myurl)
+
+
+def benchmark_resolver(urls, argv=None, rounds=3):
+    """Time resolution of urls: construction, the first (cold) call and
+    the following warm calls on the same Resolver.
+    """
+    start = time.time()
+    resolver = Resolver(argv)
+    setup = time.time() - start
+    timings = []
+    with resolver:
+        for _ in range(rounds):
+            for url in urls:
+                start = time.time()
+                try:
+                    resolver.resolve(url)
+                except DownloadError:
+                    pass
+                timings.append(time.time() - start)
+    warm = timings[1:]
+    result = {
+        'setup': setup,
+        'first': timings[0] if timings else None,
+        'warm_mean': sum(warm) / len(warm) if warm else None,
+        'warm_min': min(warm) if warm else None,
+    }
+    write_string('setup %(setup).3fs, first %(first).3fs, warm mean %(warm_mean).3fs, '
+                 'warm min %(warm_min).3fs\n' % result, out=sys.stdout)
+    return result
+
 
 if __name__ == '__main__':
-    print(_real_main("https://www.youtube.com/watch?v=dTCcegIiKXE"))
+    if sys.argv[1:2] == ['--benchmark']:
+        benchmark_resolver(sys.argv[2:] or ["https://www.youtube.com/watch?v=dTCcegIiKXE"], argv=['-q'])
+    else:
+        print(_real_main("https://www.youtube.com/watch?v=dTCcegIiKXE")['url'])
 
-__all__ = ['main', 'YoutubeDL', 'gen_extractors', 'list_extractors']
+__all__ = ['main', 'YoutubeDL', 'Resolver', 'gen_extractors', 'list_extractors']
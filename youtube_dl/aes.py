@@ -2,7 +2,11 @@ from __future__ import unicode_literals
 
 from math import ceil
 
-from .compat import compat_b64decode
+from .compat import (
+    compat_b64decode,
+    compat_struct_pack,
+    compat_struct_unpack,
+)
 from .utils import bytes_to_intlist, intlist_to_bytes
 
 BLOCK_SIZE_BYTES = 16
@@ -203,6 +207,239 @@ def aes_decrypt_text(data, password, key_size_bytes):
     return plaintext
 
 
+# Table driven implementation working on 32 bit big endian words, used for
+# whole media fragments.  Each round is a few table lookups per column
+# (T-boxes) instead of the byte oriented steps above.
+
+_TBOXES = None
+
+
+def _ror8(word):
+    return ((word >> 8) | (word << 24)) & 0xFFFFFFFF
+
+
+def _tboxes():
+    global _TBOXES
+    if _TBOXES is None:
+        te0, td0 = [], []
+        for x in range(256):
+            s, si = SBOX[x], SBOX_INV[x]
+            te0.append(
+                (rijndael_mul(s, 2) << 24) | (s << 16) | (s << 8) | rijndael_mul(s, 3))
+            td0.append(
+                (rijndael_mul(si, 0xE) << 24) | (rijndael_mul(si, 0x9) << 16)
+                | (rijndael_mul(si, 0xD) << 8) | rijndael_mul(si, 0xB))
+        te = [te0]
+        td = [td0]
+        for _ in range(3):
+            te.append([_ror8(w) for w in te[-1]])
+            td.append([_ror8(w) for w in td[-1]])
+        # Last round tables, the S-boxes already shifted into place
+        sbox = [[s << shift for s in SBOX] for shift in (24, 16, 8, 0)]
+        sbox_inv = [[s << shift for s in SBOX_INV] for shift in (24, 16, 8, 0)]
+        _TBOXES = tuple(te), tuple(td), tuple(sbox), tuple(sbox_inv)
+    return _TBOXES
+
+
+def _round_keys(key):
+    """Encryption and (equivalent inverse cipher) decryption round keys of key
+    as lists of words, and the number of rounds"""
+    if len(key) not in (16, 24, 32):
+        raise ValueError('AES key must be either 16, 24, or 32 bytes long')
+    te, td, _, _ = _tboxes()
+    nk = len(key) // 4
+    rounds = nk + 6
+    ek = list(compat_struct_unpack('>%dI' % nk, key))
+    for i in range(nk, 4 * (rounds + 1)):
+        t = ek[i - 1]
+        if i % nk == 0:
+            t = ((SBOX[(t >> 16) & 0xFF] << 24) | (SBOX[(t >> 8) & 0xFF] << 16)
+                 | (SBOX[t & 0xFF] << 8) | SBOX[t >> 24]) ^ (RCON[i // nk] << 24)
+        elif nk > 6 and i % nk == 4:
+            t = ((SBOX[t >> 24] << 24) | (SBOX[(t >> 16) & 0xFF] << 16)
+                 | (SBOX[(t >> 8) & 0xFF] << 8) | SBOX[t & 0xFF])
+        ek.append(ek[i - nk] ^ t)
+
+    td0, td1, td2, td3 = td
+    dk = []
+    for r in range(rounds, -1, -1):
+        words = ek[4 * r:4 * r + 4]
+        if 0 < r < rounds:
+            words = [
+                td0[SBOX[w >> 24]] ^ td1[SBOX[(w >> 16) & 0xFF]]
+                ^ td2[SBOX[(w >> 8) & 0xFF]] ^ td3[SBOX[w & 0xFF]]
+                for w in words]
+        dk.extend(words)
+    return ek, dk, rounds
+
+
+def _block_encrypter(ek, rounds):
+    (te0, te1, te2, te3), _, (s0, s1, s2, s3), _ = _tboxes()
+    last = 4 * rounds
+    middle = [tuple(ek[k:k + 4]) for k in range(4, last, 4)]
+
+    def encrypt_block(w0, w1, w2, w3):
+        w0 ^= ek[0]
+        w1 ^= ek[1]
+        w2 ^= ek[2]
+        w3 ^= ek[3]
+        for k0, k1, k2, k3 in middle:
+            w0, w1, w2, w3 = (
+                te0[w0 >> 24] ^ te1[(w1 >> 16) & 0xFF] ^ te2[(w2 >> 8) & 0xFF] ^ te3[w3 & 0xFF] ^ k0,
+                te0[w1 >> 24] ^ te1[(w2 >> 16) & 0xFF] ^ te2[(w3 >> 8) & 0xFF] ^ te3[w0 & 0xFF] ^ k1,
+                te0[w2 >> 24] ^ te1[(w3 >> 16) & 0xFF] ^ te2[(w0 >> 8) & 0xFF] ^ te3[w1 & 0xFF] ^ k2,
+                te0[w3 >> 24] ^ te1[(w0 >> 16) & 0xFF] ^ te2[(w1 >> 8) & 0xFF] ^ te3[w2 & 0xFF] ^ k3)
+        return (
+            s0[w0 >> 24] ^ s1[(w1 >> 16) & 0xFF] ^ s2[(w2 >> 8) & 0xFF] ^ s3[w3 & 0xFF] ^ ek[last],
+            s0[w1 >> 24] ^ s1[(w2 >> 16) & 0xFF] ^ s2[(w3 >> 8) & 0xFF] ^ s3[w0 & 0xFF] ^ ek[last + 1],
+            s0[w2 >> 24] ^ s1[(w3 >> 16) & 0xFF] ^ s2[(w0 >> 8) & 0xFF] ^ s3[w1 & 0xFF] ^ ek[last + 2],
+            s0[w3 >> 24] ^ s1[(w0 >> 16) & 0xFF] ^ s2[(w1 >> 8) & 0xFF] ^ s3[w2 & 0xFF] ^ ek[last + 3])
+    return encrypt_block
+
+
+def _block_decrypter(dk, rounds):
+    _, (td0, td1, td2, td3), _, (s0, s1, s2, s3) = _tboxes()
+    last = 4 * rounds
+    middle = [tuple(dk[k:k + 4]) for k in range(4, last, 4)]
+
+    def decrypt_block(w0, w1, w2, w3):
+        w0 ^= dk[0]
+        w1 ^= dk[1]
+        w2 ^= dk[2]
+        w3 ^= dk[3]
+        for k0, k1, k2, k3 in middle:
+            w0, w1, w2, w3 = (
+                td0[w0 >> 24] ^ td1[(w3 >> 16) & 0xFF] ^ td2[(w2 >> 8) & 0xFF] ^ td3[w1 & 0xFF] ^ k0,
+                td0[w1 >> 24] ^ td1[(w0 >> 16) & 0xFF] ^ td2[(w3 >> 8) & 0xFF] ^ td3[w2 & 0xFF] ^ k1,
+                td0[w2 >> 24] ^ td1[(w1 >> 16) & 0xFF] ^ td2[(w0 >> 8) & 0xFF] ^ td3[w3 & 0xFF] ^ k2,
+                td0[w3 >> 24] ^ td1[(w2 >> 16) & 0xFF] ^ td2[(w1 >> 8) & 0xFF] ^ td3[w0 & 0xFF] ^ k3)
+        return (
+            s0[w0 >> 24] ^ s1[(w3 >> 16) & 0xFF] ^ s2[(w2 >> 8) & 0xFF] ^ s3[w1 & 0xFF] ^ dk[last],
+            s0[w1 >> 24] ^ s1[(w0 >> 16) & 0xFF] ^ s2[(w3 >> 8) & 0xFF] ^ s3[w2 & 0xFF] ^ dk[last + 1],
+            s0[w2 >> 24] ^ s1[(w1 >> 16) & 0xFF] ^ s2[(w0 >> 8) & 0xFF] ^ s3[w3 & 0xFF] ^ dk[last + 2],
+            s0[w3 >> 24] ^ s1[(w2 >> 16) & 0xFF] ^ s2[(w1 >> 8) & 0xFF] ^ s3[w0 & 0xFF] ^ dk[last + 3])
+    return decrypt_block
+
+
+def _to_words(data):
+    return compat_struct_unpack('>%dI' % (len(data) // 4), data)
+
+
+def _from_words(words):
+    return compat_struct_pack('>%dI' % len(words), *words)
+
+
+class AES(object):
+    """
+    Pure Python stand-in for the part of pycrypto's Crypto.Cipher.AES we use:
+    AES.new(key, AES.MODE_CBC, iv) and AES.new(key, AES.MODE_CTR, iv) objects
+    with encrypt and decrypt methods taking and returning bytes.  Like
+    pycrypto's, the objects are stateful, consecutive calls continue the
+    stream.  For CTR iv is the initial 16-Byte counter block, incremented as
+    a 128-Bit big endian integer.
+    """
+    MODE_CBC = 2
+    MODE_CTR = 6
+    block_size = BLOCK_SIZE_BYTES
+
+    def __init__(self, key, mode, iv):
+        if mode not in (self.MODE_CBC, self.MODE_CTR):
+            raise ValueError('Unsupported AES mode %r' % mode)
+        if iv is None or len(iv) != BLOCK_SIZE_BYTES:
+            raise ValueError('IV must be 16 bytes long')
+        self.mode = mode
+        self._ek, self._dk, self._rounds = _round_keys(key)
+        self._state = _to_words(iv)
+        self._encrypt_block = _block_encrypter(self._ek, self._rounds)
+        self._keystream = b''
+
+    @classmethod
+    def new(cls, key, mode, iv=None):
+        return cls(key, mode, iv)
+
+    def _check_cbc_length(self, data):
+        if len(data) % BLOCK_SIZE_BYTES:
+            raise ValueError('Data must be padded to 16 byte boundary in CBC mode')
+
+    def encrypt(self, data):
+        if self.mode == self.MODE_CTR:
+            return self._ctr(data)
+        self._check_cbc_length(data)
+        encrypt_block = self._encrypt_block
+        p0, p1, p2, p3 = self._state
+        words = _to_words(data)
+        out = []
+        for i in range(0, len(words), 4):
+            p0, p1, p2, p3 = encrypt_block(
+                words[i] ^ p0, words[i + 1] ^ p1, words[i + 2] ^ p2, words[i + 3] ^ p3)
+            out.extend((p0, p1, p2, p3))
+        self._state = (p0, p1, p2, p3)
+        return _from_words(out)
+
+    def decrypt(self, data):
+        if self.mode == self.MODE_CTR:
+            return self._ctr(data)
+        self._check_cbc_length(data)
+        decrypt_block = _block_decrypter(self._dk, self._rounds)
+        words = self._state + _to_words(data)
+        out = []
+        for i in range(4, len(words), 4):
+            d0, d1, d2, d3 = decrypt_block(words[i], words[i + 1], words[i + 2], words[i + 3])
+            out.extend((
+                d0 ^ words[i - 4], d1 ^ words[i - 3], d2 ^ words[i - 2], d3 ^ words[i - 1]))
+        self._state = words[-4:]
+        return _from_words(out)
+
+    def _ctr(self, data):
+        size = len(data)
+        padded = size + -size % 4
+        keystream = self._keystream
+        needed = padded - len(keystream)
+        if needed > 0:
+            encrypt_block = self._encrypt_block
+            c0, c1, c2, c3 = self._state
+            blocks = []
+            for _ in range((needed + BLOCK_SIZE_BYTES - 1) // BLOCK_SIZE_BYTES):
+                blocks.extend(encrypt_block(c0, c1, c2, c3))
+                c3 = (c3 + 1) & 0xFFFFFFFF
+                if not c3:
+                    c2 = (c2 + 1) & 0xFFFFFFFF
+                    if not c2:
+                        c1 = (c1 + 1) & 0xFFFFFFFF
+                        if not c1:
+                            c0 = (c0 + 1) & 0xFFFFFFFF
+            self._state = (c0, c1, c2, c3)
+            keystream += _from_words(blocks)
+        self._keystream = keystream[size:]
+        words = _to_words(data + b'\0' * (padded - size))
+        stream = _to_words(keystream[:padded])
+        return _from_words([x ^ y for x, y in zip(words, stream)])[:size]
+
+
+def aes_cbc_decrypt_bytes(data, key, iv):
+    """
+    Decrypt with aes in CBC mode, without removing any padding
+
+    @param {bytes} data        cipher, a multiple of 16 Bytes long
+    @param {bytes} key         16/24/32-Byte cipher key
+    @param {bytes} iv          16-Byte IV
+    @returns {bytes}           decrypted data
+    """
+    return AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+
+
+def aes_ctr_decrypt_bytes(data, key, iv):
+    """
+    Decrypt (or encrypt) with aes in counter mode
+
+    @param {bytes} data        cipher
+    @param {bytes} key         16/24/32-Byte cipher key
+    @param {bytes} iv          16-Byte initial counter block
+    @returns {bytes}           decrypted data
+    """
+    return AES.new(key, AES.MODE_CTR, iv).decrypt(data)
+
+
 RCON = (0x8d, 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1b, 0x36)
 SBOX = (0x63, 0x7C, 0x77, 0x7B, 0xF2, 0x6B, 0x6F, 0xC5, 0x30, 0x01, 0x67, 0x2B, 0xFE, 0xD7, 0xAB, 0x76,
         0xCA, 0x82, 0xC9, 0x7D, 0xFA, 0x59, 0x47, 0xF0, 0xAD, 0xD4, 0xA2, 0xAF, 0x9C, 0xA4, 0x72, 0xC0,
@@ -358,4 +595,6 @@ def inc(data):
     return data
 
 
-__all__ = ['aes_encrypt', 'key_expansion', 'aes_ctr_decrypt', 'aes_cbc_decrypt', 'aes_decrypt_text']
+__all__ = [
+    'AES', 'aes_encrypt', 'key_expansion', 'aes_ctr_decrypt', 'aes_cbc_decrypt',
+    'aes_cbc_decrypt_bytes', 'aes_ctr_decrypt_bytes', 'aes_decrypt_text']
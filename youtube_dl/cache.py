@@ -1,23 +1,260 @@
 from __future__ import unicode_literals
 
+import collections
+import contextlib
 import errno
+import hashlib
 import io
 import json
 import os
 import re
 import shutil
+import socket
+import threading
+import time
 import traceback
 
-from .compat import compat_getenv
+try:
+    import sqlite3
+except ImportError:  # Python built without sqlite
+    sqlite3 = None
+
+from .compat import (
+    compat_getenv,
+    compat_str,
+)
 from .utils import (
     expand_path,
     write_json_file,
 )
 
 
+class JSONDirCacheBackend(object):
+    """One JSON file per key, <root>/<section>/<key>.json"""
+
+    name = 'json'
+
+    def __init__(self, root):
+        self.root = root
+
+    def describe(self, section, key):
+        return os.path.join(self.root, section, '%s.json' % key)
+
+    def version(self, section):
+        # Files are replaced by rename, which bumps the directory mtime
+        try:
+            st = os.stat(os.path.join(self.root, section))
+        except OSError:
+            return None
+        return getattr(st, 'st_mtime_ns', st.st_mtime)
+
+    def load(self, section, key):
+        try:
+            with io.open(self.describe(section, key), 'r', encoding='utf-8') as cachef:
+                return cachef.read()
+        except IOError:
+            return None  # No cache available
+
+    def store(self, section, key, data):
+        fn = self.describe(section, key)
+        try:
+            os.makedirs(os.path.dirname(fn))
+        except OSError as ose:
+            if ose.errno != errno.EEXIST:
+                raise
+        write_json_file(data, fn)
+
+    def items(self):
+        """(section, key, text, mtime) of every entry"""
+        if not os.path.isdir(self.root):
+            return
+        for section in sorted(os.listdir(self.root)):
+            sdir = os.path.join(self.root, section)
+            if not _NAME_RE.match(section) or not os.path.isdir(sdir):
+                continue
+            for fn in sorted(os.listdir(sdir)):
+                key, ext = os.path.splitext(fn)
+                if ext != '.json' or not _NAME_RE.match(key):
+                    continue
+                text = self.load(section, key)
+                if text is not None:
+                    yield section, key, text, os.path.getmtime(os.path.join(sdir, fn))
+
+    def evict(self, max_size=None, max_age=None, section=None, max_entries=None):
+        """Only max_entries is supported: drop the least recently written
+        entries of section beyond that many"""
+        if not max_entries:
+            return
+        sdir = os.path.join(self.root, section)
+        try:
+            names = [fn for fn in os.listdir(sdir) if fn.endswith('.json')]
+        except OSError:
+            return
+        if len(names) <= max_entries:
+            return
+        mtimes = {}
+        for fn in names:
+            try:
+                mtimes[fn] = os.path.getmtime(os.path.join(sdir, fn))
+            except OSError:
+                pass
+        for fn in sorted(mtimes, key=mtimes.get)[:len(mtimes) - max_entries]:
+            try:
+                os.remove(os.path.join(sdir, fn))
+            except OSError:
+                pass
+
+    def close(self):
+        pass
+
+
+class SQLiteCacheBackend(object):
+    """All sections in one sqlite database, <root>/cache.sqlite3.
+
+    Writes are single transactions, so parallel processes never see a
+    half written entry; busy writers wait up to _TIMEOUT seconds for the
+    lock.  The rollback journal is kept since WAL does not work on NFS.
+    A new database imports the entries of the JSON directory layout found
+    in the same root; the JSON files are left alone.
+    """
+
+    name = 'sqlite'
+    _FILENAME = 'cache.sqlite3'
+    _TIMEOUT = 30
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, self._FILENAME)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            try:
+                os.makedirs(self.root)
+            except OSError as ose:
+                if ose.errno != errno.EEXIST:
+                    raise
+            conn = sqlite3.connect(self.path, timeout=self._TIMEOUT, check_same_thread=False)
+            conn.isolation_level = None  # transactions are explicit
+            with self._transaction(conn):
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS entries ('
+                    'section TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, '
+                    'size INTEGER NOT NULL, mtime REAL NOT NULL, '
+                    'PRIMARY KEY (section, key))')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+                if conn.execute("SELECT 1 FROM meta WHERE name = 'migrated'").fetchone() is None:
+                    self._migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _migrate(self, conn):
+        for section, key, text, mtime in JSONDirCacheBackend(self.root).items():
+            conn.execute(
+                'INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?)',
+                (section, key, text, len(text), mtime))
+        conn.execute("INSERT INTO meta VALUES ('migrated', ?)", (compat_str(time.time()),))
+
+    def describe(self, section, key):
+        return '%s [%s/%s]' % (self.path, section, key)
+
+    def version(self, section):
+        # Changes whenever another connection commits
+        with self._lock:
+            return self._connect().execute('PRAGMA data_version').fetchone()[0]
+
+    def load(self, section, key):
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT data FROM entries WHERE section = ? AND key = ?',
+                (section, key)).fetchone()
+        return row[0] if row else None
+
+    def store(self, section, key, data):
+        text = json.dumps(data)
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                    (section, key, text, len(text), time.time()))
+
+    def evict(self, max_size=None, max_age=None, section=None, max_entries=None):
+        """Drop entries older than max_age seconds, then the least recently
+        written ones until the data takes at most max_size bytes, and those
+        of section beyond max_entries"""
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                if max_entries:
+                    count = conn.execute(
+                        'SELECT COUNT(*) FROM entries WHERE section = ?', (section,)).fetchone()[0]
+                    if count > max_entries:
+                        conn.execute(
+                            'DELETE FROM entries WHERE section = ? AND key IN ('
+                            'SELECT key FROM entries WHERE section = ? ORDER BY mtime LIMIT ?)',
+                            (section, section, count - max_entries))
+                if max_age:
+                    conn.execute('DELETE FROM entries WHERE mtime < ?', (time.time() - max_age,))
+                if max_size:
+                    total = conn.execute('SELECT SUM(size) FROM entries').fetchone()[0] or 0
+                    if total <= max_size:
+                        return
+                    rows = conn.execute(
+                        'SELECT section, key, size FROM entries ORDER BY mtime').fetchall()
+                    for section, key, size in rows:
+                        if total <= max_size:
+                            break
+                        conn.execute(
+                            'DELETE FROM entries WHERE section = ? AND key = ?', (section, key))
+                        total -= size
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_NAME_RE = re.compile(r'^[a-zA-Z0-9_.-]+$')
+_BACKENDS = {'json': JSONDirCacheBackend}
+if sqlite3 is not None:
+    _BACKENDS['sqlite'] = SQLiteCacheBackend
+DEFAULT_BACKEND = 'sqlite' if sqlite3 is not None else 'json'
+
+
 class Cache(object):
+    """The youtube-dl cache: JSON documents by section and key.
+
+    Documents are kept in a backend selected with the cache_backend param
+    ('sqlite' or 'json') and the last cache_memory_size ones used are
+    kept in memory as well.  A memory hit is only trusted while the
+    backend reports the same version for its section, so writes of other
+    processes are seen.  cache_max_size (bytes) and cache_max_age
+    (seconds) bound the sqlite backend.
+    """
+
+    _MEMORY_SIZE = 256
+
     def __init__(self, ydl):
         self._ydl = ydl
+        self._backend = None
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._stats = {}
 
     def _get_root_dir(self):
         res = self._ydl.params.get('cachedir')
@@ -26,56 +263,117 @@ class Cache(object):
             res = os.path.join(cache_root, 'youtube-dl')
         return expand_path(res)
 
-    def _get_cache_fn(self, section, key, dtype):
-        assert re.match(r'^[a-zA-Z0-9_.-]+$', section), \
-            'invalid section %r' % section
-        assert re.match(r'^[a-zA-Z0-9_.-]+$', key), 'invalid key %r' % key
-        return os.path.join(
-            self._get_root_dir(), section, '%s.%s' % (key, dtype))
+    def _get_backend(self):
+        if self._backend is None:
+            name = self._ydl.params.get('cache_backend') or DEFAULT_BACKEND
+            if name not in _BACKENDS:
+                raise ValueError('unsupported cache backend %r' % name)
+            self._backend = _BACKENDS[name](self._get_root_dir())
+        return self._backend
 
     @property
     def enabled(self):
         return self._ydl.params.get('cachedir') is not False
 
+    def _count(self, section, what):
+        counts = self._stats.setdefault(section, {
+            'memory_hits': 0, 'hits': 0, 'misses': 0, 'stores': 0, 'errors': 0})
+        counts[what] += 1
+
+    def stats(self):
+        """Per section counters of memory hits, backend hits, misses,
+        stores and errors"""
+        with self._lock:
+            return dict((k, dict(v)) for k, v in self._stats.items())
+
     def store(self, section, key, data, dtype='json'):
         assert dtype in ('json',)
+        assert _NAME_RE.match(section), 'invalid section %r' % section
+        assert _NAME_RE.match(key), 'invalid key %r' % key
 
         if not self.enabled:
             return
 
-        fn = self._get_cache_fn(section, key, dtype)
+        backend = self._get_backend()
         try:
-            try:
-                os.makedirs(os.path.dirname(fn))
-            except OSError as ose:
-                if ose.errno != errno.EEXIST:
-                    raise
-            write_json_file(data, fn)
+            backend.store(section, key, data)
+            version = backend.version(section)
+            with self._lock:
+                self._count(section, 'stores')
+                self._remember((section, key), (version, json.dumps(data)))
+            max_size = self._ydl.params.get('cache_max_size')
+            max_age = self._ydl.params.get('cache_max_age')
+            if max_size or max_age:
+                backend.evict(max_size, max_age)
         except Exception:
             tb = traceback.format_exc()
+            with self._lock:
+                self._count(section, 'errors')
+            self._ydl.report_warning(
+                'Writing cache to %r failed: %s' % (backend.describe(section, key), tb))
+
+    def trim(self, section, max_entries):
+        """Drop the least recently written entries of section beyond
+        max_entries"""
+        if not self.enabled:
+            return
+        backend = self._get_backend()
+        try:
+            backend.evict(section=section, max_entries=max_entries)
+        except Exception:
+            with self._lock:
+                self._count(section, 'errors')
             self._ydl.report_warning(
-                'Writing cache to %r failed: %s' % (fn, tb))
+                'Trimming cache section %s failed: %s' % (section, traceback.format_exc()))
+
+    def _remember(self, mkey, value):
+        memory = self._memory
+        memory.pop(mkey, None)
+        memory[mkey] = value
+        size = self._ydl.params.get('cache_memory_size', self._MEMORY_SIZE)
+        while len(memory) > size:
+            memory.popitem(last=False)
 
     def load(self, section, key, dtype='json', default=None):
         assert dtype in ('json',)
+        assert _NAME_RE.match(section), 'invalid section %r' % section
+        assert _NAME_RE.match(key), 'invalid key %r' % key
 
         if not self.enabled:
             return default
 
-        cache_fn = self._get_cache_fn(section, key, dtype)
+        mkey = (section, key)
+        backend = self._get_backend()
         try:
-            try:
-                with io.open(cache_fn, 'r', encoding='utf-8') as cachef:
-                    return json.load(cachef)
-            except ValueError:
-                try:
-                    file_size = os.path.getsize(cache_fn)
-                except (OSError, IOError) as oe:
-                    file_size = str(oe)
-                self._ydl.report_warning(
-                    'Cache retrieval from %s failed (%s)' % (cache_fn, file_size))
-        except IOError:
-            pass  # No cache available
+            version = backend.version(section)
+            with self._lock:
+                cached = self._memory.get(mkey)
+                if cached is not None and cached[0] == version and version is not None:
+                    self._memory.pop(mkey)
+                    self._memory[mkey] = cached
+                    self._count(section, 'memory_hits')
+                    return json.loads(cached[1])
+            text = backend.load(section, key)
+            if text is None:
+                with self._lock:
+                    self._count(section, 'misses')
+                return default
+            res = json.loads(text)
+            with self._lock:
+                self._count(section, 'hits')
+                self._remember(mkey, (version, text))
+            return res
+        except ValueError:
+            with self._lock:
+                self._count(section, 'errors')
+            self._ydl.report_warning(
+                'Cache retrieval from %s failed (invalid JSON)' % backend.describe(section, key))
+        except Exception:
+            with self._lock:
+                self._count(section, 'errors')
+            self._ydl.report_warning(
+                'Cache retrieval from %s failed: %s' % (
+                    backend.describe(section, key), traceback.format_exc()))
 
         return default
 
@@ -90,7 +388,121 @@ class Cache(object):
 
         self._ydl.to_screen(
             'Removing cache dir %s .' % cachedir, skip_eol=True)
+        if self._backend is not None:
+            self._backend.close()
+        with self._lock:
+            self._memory.clear()
         if os.path.exists(cachedir):
             self._ydl.to_screen('.', skip_eol=True)
             shutil.rmtree(cachedir)
         self._ydl.to_screen('.')
+
+
+class ResolvedURLCache(object):
+    """Resolved formats keyed by extractor key, video id and format spec.
+
+    Each entry is a document of the youtube-dl cache, at most
+    resolve_cache_size of them with the least recently used dropped first
+    (a hit marks an entry used again at most every _TOUCH_INTERVAL
+    seconds).  An entry expires at the expire= timestamp embedded in the
+    URL (googlevideo), otherwise after the extractor's _RESOLVE_CACHE_TTL
+    or the resolve_cache_ttl param; URLs with neither are not cached.
+    Entries are only reused on the host that resolved them since stream
+    URLs are often bound to the client IP.
+    """
+
+    _SECTION = 'resolved'
+    # A hit has to stay valid at least this long for the download to start
+    _MIN_VALIDITY = 300
+    _DEFAULT_SIZE = 1000
+    _TOUCH_INTERVAL = 3600
+
+    def __init__(self, ydl):
+        self._ydl = ydl
+        self._lock = threading.Lock()
+        self._host = socket.gethostname()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+
+    @property
+    def enabled(self):
+        return self._ydl.params.get('resolve_cache', True) and self._ydl.cache.enabled
+
+    @property
+    def size(self):
+        return self._ydl.params.get('resolve_cache_size') or self._DEFAULT_SIZE
+
+    @staticmethod
+    def url_expiry(url):
+        m = re.search(r'[?&/]expire[=/](\d+)', url)
+        return int(m.group(1)) if m else None
+
+    @staticmethod
+    def make_key(ie, url, format_spec=None):
+        # YoutubeIE has no id group and exposes extract_id() instead
+        match_id = getattr(ie, 'extract_id', None) or ie._match_id
+        try:
+            key = '%s:%s' % (ie.ie_key(), match_id(url))
+        except Exception:  # no id group in _VALID_URL
+            return None
+        # Each format spec resolves to its own format
+        return key if format_spec is None else '%s %s' % (key, format_spec)
+
+    @staticmethod
+    def _doc_key(key):
+        # Cache keys are restricted to _NAME_RE
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _count(self, what):
+        with self._lock:
+            setattr(self, what, getattr(self, what) + 1)
+
+    def get(self, key):
+        """The result cached for key, a copy of it, or None"""
+        if key is None or not self.enabled:
+            return None
+        doc_key = self._doc_key(key)
+        entry = self._ydl.cache.load(self._SECTION, doc_key)
+        if not entry or entry.get('key') != key or entry.get('host') != self._host:
+            self._count('misses')
+            return None
+        now = time.time()
+        if entry['expires'] - self._MIN_VALIDITY < now:
+            self._count('expired')
+            self._count('misses')
+            return None
+        if entry['atime'] + self._TOUCH_INTERVAL < now:
+            entry['atime'] = now
+            self._ydl.cache.store(self._SECTION, doc_key, entry)
+        self._count('hits')
+        return entry['result']
+
+    def put(self, key, ie, result, url):
+        if key is None or not result or not self.enabled:
+            return
+        expires = self.url_expiry(url)
+        if expires is None:
+            ttl = getattr(ie, '_RESOLVE_CACHE_TTL', None) or self._ydl.params.get('resolve_cache_ttl')
+            if not ttl:
+                return
+            expires = time.time() + ttl
+        self._ydl.cache.store(self._SECTION, self._doc_key(key), {
+            'key': key,
+            'result': result,
+            'expires': expires,
+            'host': self._host,
+            'atime': time.time(),
+        })
+        self._ydl.cache.trim(self._SECTION, self.size)
+        self._count('stores')
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'stores': self.stores,
+            }
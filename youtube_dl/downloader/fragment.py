@@ -1,14 +1,23 @@
 from __future__ import division, unicode_literals
 
+import collections
+import errno
+import itertools
 import os
+import socket
 import time
 import json
+from multiprocessing.pool import ThreadPool
 
 from .common import FileDownloader
 from .http import HttpFD
+from ..compat import compat_urllib_error
 from ..utils import (
+    ContentTooShortError,
+    DownloadError,
     error_to_compat_str,
     encodeFilename,
+    int_or_none,
     sanitize_open,
     sanitized_Request,
 )
@@ -30,7 +39,11 @@ class FragmentFD(FileDownloader):
     skip_unavailable_fragments:
                         Skip unavailable fragments (DASH and hlsnative only)
     keep_fragments:     Keep downloaded fragments on disk after downloading is
-                        finished
+                        finished. Otherwise fragments are read into memory and
+                        appended without touching the disk
+    concurrent_fragment_downloads:
+                        Number of fragments to download at once (DASH and
+                        hlsnative only), they are still appended in order
 
     For each incomplete fragment download youtube-dl keeps on disk a special
     bookkeeping file with download state and metadata (in future such files will
@@ -47,12 +60,21 @@ class FragmentFD(FileDownloader):
             current_fragment:
                 Dictionary with current (being downloaded) fragment data:
                 index:  0-based index of current fragment among all fragments
+                offset: Size of the destination file up to that fragment,
+                        anything after it is downloaded again
             fragment_count:
                 Total count of fragments
 
+    The file is rewritten every _CHECKPOINT_FRAGMENTS fragments or
+    _CHECKPOINT_INTERVAL seconds, whichever comes first.
+
     This feature is experimental and file format may change in future.
     """
 
+    _CHECKPOINT_FRAGMENTS = 16
+    _CHECKPOINT_INTERVAL = 5
+    _FRAGMENT_BLOCK_SIZE = 64 * 1024
+
     def report_retry_fragment(self, err, frag_index, count, retries):
         self.to_screen(
             '[download] Got server HTTP error: %s. Retrying fragment %d (attempt %d of %s)...'
@@ -77,7 +99,9 @@ class FragmentFD(FileDownloader):
         assert 'ytdl_corrupt' not in ctx
         stream, _ = sanitize_open(self.ytdl_filename(ctx['filename']), 'r')
         try:
-            ctx['fragment_index'] = json.loads(stream.read())['downloader']['current_fragment']['index']
+            current_fragment = json.loads(stream.read())['downloader']['current_fragment']
+            ctx['fragment_index'] = current_fragment['index']
+            ctx['ytdl_offset'] = current_fragment.get('offset')
         except Exception:
             ctx['ytdl_corrupt'] = True
         finally:
@@ -88,37 +112,250 @@ class FragmentFD(FileDownloader):
         downloader = {
             'current_fragment': {
                 'index': ctx['fragment_index'],
+                'offset': ctx['fragment_offset'],
             },
         }
         if ctx.get('fragment_count') is not None:
             downloader['fragment_count'] = ctx['fragment_count']
         frag_index_stream.write(json.dumps({'downloader': downloader}))
         frag_index_stream.close()
+        ctx['ytdl_written'] = time.time()
+        ctx['unsaved_frags'] = 0
+
+    def _checkpoint_ytdl_file(self, ctx):
+        ctx['unsaved_frags'] += 1
+        if (ctx['unsaved_frags'] >= self._CHECKPOINT_FRAGMENTS or
+                time.time() - ctx['ytdl_written'] >= self._CHECKPOINT_INTERVAL):
+            # The .ytdl file must not get ahead of the data
+            ctx['dest_stream'].flush()
+            self._write_ytdl_file(ctx)
 
     def _download_fragment(self, ctx, frag_url, info_dict, headers=None):
-        fragment_filename = '%s-Frag%d' % (ctx['tmpfilename'], ctx['fragment_index'])
-        success = ctx['dl'].download(fragment_filename, {
+        if ctx['direct']:
+            success, frag_content = self._read_fragment(
+                frag_url, info_dict, headers, ctx['frag_progress_hook'])
+            frag_sanitized = None
+        else:
+            success, frag_content, frag_sanitized = self._download_fragment_file(
+                ctx['dl'], '%s-Frag%d' % (ctx['tmpfilename'], ctx['fragment_index']),
+                frag_url, info_dict, headers)
+        if success:
+            ctx['fragment_filename_sanitized'] = frag_sanitized
+        return success, frag_content
+
+    def _read_fragment(self, frag_url, info_dict, headers=None, progress_hook=None):
+        """Download a fragment into memory, retrying like HttpFD does.
+
+        Returns a (success, content) tuple.
+        """
+        headers = dict(headers or info_dict.get('http_headers') or {})
+        # Like HttpFD, ask for the body as is: its length is checked against
+        # Content-Length
+        headers['Youtubedl-no-compression'] = 'True'
+        request = sanitized_Request(frag_url, None, headers)
+        retries = self.params.get('retries', 0)
+        count = 0
+        while count <= retries:
+            try:
+                return True, self._read_fragment_response(self.ydl.urlopen(request), progress_hook)
+            except compat_urllib_error.HTTPError as err:
+                if err.code < 500 or err.code >= 600:
+                    raise
+            except socket.timeout:
+                pass
+            except socket.error as err:
+                if err.errno not in (errno.ECONNRESET, errno.ETIMEDOUT):
+                    raise
+            except ContentTooShortError:
+                pass
+            count += 1
+        self.report_error('giving up after %s retries' % retries)
+        return False, None
+
+    def _read_fragment_response(self, urlh, progress_hook=None):
+        data_len = int_or_none(urlh.info().get('Content-length'))
+        chunks = []
+        byte_counter = 0
+        start = time.time()
+        while True:
+            data_block = urlh.read(self._FRAGMENT_BLOCK_SIZE)
+            if not data_block:
+                break
+            chunks.append(data_block)
+            byte_counter += len(data_block)
+            self.slow_down(start, None, byte_counter)
+            if progress_hook:
+                progress_hook({
+                    'status': 'downloading',
+                    'downloaded_bytes': byte_counter,
+                    'total_bytes': data_len,
+                    'speed': self.calc_speed(start, time.time(), byte_counter),
+                })
+        if data_len is not None and byte_counter != data_len:
+            raise ContentTooShortError(byte_counter, data_len)
+        if progress_hook:
+            progress_hook({
+                'status': 'finished',
+                'downloaded_bytes': byte_counter,
+                'total_bytes': byte_counter,
+            })
+        return b''.join(chunks)
+
+    def _download_fragment_file(self, dl, fragment_filename, frag_url, info_dict, headers=None):
+        success = dl.download(fragment_filename, {
             'url': frag_url,
             'http_headers': headers or info_dict.get('http_headers'),
         })
         if not success:
-            return False, None
+            return False, None, None
         down, frag_sanitized = sanitize_open(fragment_filename, 'rb')
-        ctx['fragment_filename_sanitized'] = frag_sanitized
         frag_content = down.read()
         down.close()
-        return True, frag_content
+        return True, frag_content, frag_sanitized
+
+    def _fetch_fragment(self, ctx, fragment, info_dict, dl, progress_hook=None):
+        """Download one fragment, retrying HTTP errors.
+
+        Returns a (content, filename) tuple, None if the fragment is to be
+        skipped or False if the download has failed.
+        """
+        fragment_retries = self.params.get('fragment_retries', 0)
+        frag_index = fragment['frag_index']
+        count = 0
+        while count <= fragment_retries:
+            try:
+                if ctx['direct']:
+                    success, frag_content = self._read_fragment(
+                        fragment['url'], info_dict, fragment.get('headers'),
+                        progress_hook)
+                    frag_sanitized = None
+                else:
+                    success, frag_content, frag_sanitized = self._download_fragment_file(
+                        dl, '%s-Frag%d' % (ctx['tmpfilename'], frag_index),
+                        fragment['url'], info_dict, fragment.get('headers'))
+                if not success:
+                    return False
+                return frag_content, frag_sanitized
+            except compat_urllib_error.HTTPError as err:
+                # Unavailable (possibly temporary) fragments may be served,
+                # and the same request often succeeds when retried (YouTube
+                # DASH 404s). First we try to retry then either skip or abort.
+                # See https://github.com/rg3/youtube-dl/issues/10165,
+                # https://github.com/rg3/youtube-dl/issues/10448).
+                count += 1
+                if count <= fragment_retries:
+                    self.report_retry_fragment(err, frag_index, count, fragment_retries)
+            except DownloadError:
+                # Don't retry fragment if error occurred during HTTP downloading
+                # itself since it has own retry settings
+                if fragment.get('skip_errors') and not fragment.get('fatal'):
+                    return None
+                raise
+        if not fragment.get('fatal'):
+            return None
+        self.report_error('giving up after %s fragment retries' % fragment_retries)
+        return False
+
+    def _append_fetched_fragment(self, ctx, fragment, result, decrypt):
+        if result is False:
+            return False
+        ctx['fragment_index'] = fragment['frag_index']
+        if result is None:
+            self.report_skip_fragment(fragment['frag_index'])
+            return True
+        frag_content, ctx['fragment_filename_sanitized'] = result
+        if decrypt:
+            frag_content = decrypt(fragment, frag_content)
+        self._append_fragment(ctx, frag_content)
+        return True
+
+    def download_and_append_fragments(self, ctx, fragments, info_dict, decrypt=None):
+        """Download fragments and append them to the destination in order.
+
+        fragments are dicts with frag_index (1-based), url and optionally
+        headers, fatal (abort instead of skipping when unavailable) and
+        skip_errors (skip rather than abort, unless fatal, when the HTTP
+        download itself fails); those up to ctx['fragment_index'] are
+        already done.  decrypt, if
+        given, is called with a fragment and its content and returns the
+        content to append.  With concurrent_fragment_downloads > 1 a
+        thread pool fetches that many fragments ahead of the one being
+        appended.  Returns False if the download has failed, which includes
+        every fragment having been skipped.
+        """
+        fragments = [f for f in fragments if f['frag_index'] > ctx['fragment_index']]
+        workers = self.params.get('concurrent_fragment_downloads') or 1
+        if workers > 1 and len(fragments) > 1:
+            if not self._download_fragments_concurrently(
+                    ctx, fragments, info_dict, decrypt, workers):
+                return False
+        else:
+            for fragment in fragments:
+                result = self._fetch_fragment(
+                    ctx, fragment, info_dict, ctx['dl'], ctx['frag_progress_hook'])
+                if not self._append_fetched_fragment(ctx, fragment, result, decrypt):
+                    return False
+        if fragments and not ctx['fragment_offset']:
+            self.report_error('unable to download any of %d fragments' % len(fragments))
+            return False
+        return True
+
+    def _download_fragments_concurrently(self, ctx, fragments, info_dict, decrypt, workers):
+        def fetch(fragment):
+            # The shared downloader's progress hook assumes one fragment at
+            # a time, progress is reported as fragments get appended instead
+            return self._fetch_fragment(
+                ctx, fragment, info_dict, self._make_fragment_downloader())
+
+        pool = ThreadPool(workers)
+        try:
+            fragments = iter(fragments)
+            # At most `workers` fragments are in flight or waiting in memory
+            pending = collections.deque(
+                (fragment, pool.apply_async(fetch, (fragment,)))
+                for fragment in itertools.islice(fragments, workers))
+            while pending:
+                fragment, async_result = pending.popleft()
+                result = async_result.get()
+                for next_fragment in itertools.islice(fragments, 1):
+                    pending.append((next_fragment, pool.apply_async(fetch, (next_fragment,))))
+                if result:
+                    ctx['frag_progress_hook']({
+                        'status': 'finished',
+                        'total_bytes': len(result[0]),
+                    })
+                if not self._append_fetched_fragment(ctx, fragment, result, decrypt):
+                    return False
+            return True
+        finally:
+            pool.terminate()
 
     def _append_fragment(self, ctx, frag_content):
         try:
             ctx['dest_stream'].write(frag_content)
-            ctx['dest_stream'].flush()
+            ctx['fragment_offset'] += len(frag_content)
+            if not self.__do_ytdl_file(ctx):
+                ctx['dest_stream'].flush()
         finally:
             if self.__do_ytdl_file(ctx):
-                self._write_ytdl_file(ctx)
-            if not self.params.get('keep_fragments', False):
-                os.remove(encodeFilename(ctx['fragment_filename_sanitized']))
-            del ctx['fragment_filename_sanitized']
+                self._checkpoint_ytdl_file(ctx)
+            frag_sanitized = ctx.pop('fragment_filename_sanitized')
+            if frag_sanitized is not None and not self.params.get('keep_fragments', False):
+                os.remove(encodeFilename(frag_sanitized))
+
+    def _make_fragment_downloader(self):
+        return HttpQuietDownloader(
+            self.ydl,
+            {
+                'continuedl': True,
+                'quiet': True,
+                'noprogress': True,
+                'ratelimit': self.params.get('ratelimit'),
+                'retries': self.params.get('retries', 0),
+                'nopart': self.params.get('nopart', False),
+                'test': self.params.get('test', False),
+            }
+        )
 
     def _prepare_frag_download(self, ctx):
         if 'live' not in ctx:
@@ -133,18 +370,7 @@ class FragmentFD(FileDownloader):
         self.to_screen(
             '[%s] Total fragments: %s' % (self.FD_NAME, total_frags_str))
         self.report_destination(ctx['filename'])
-        dl = HttpQuietDownloader(
-            self.ydl,
-            {
-                'continuedl': True,
-                'quiet': True,
-                'noprogress': True,
-                'ratelimit': self.params.get('ratelimit'),
-                'retries': self.params.get('retries', 0),
-                'nopart': self.params.get('nopart', False),
-                'test': self.params.get('test', False),
-            }
-        )
+        dl = self._make_fragment_downloader()
         tmpfilename = self.temp_name(ctx['filename'])
         open_mode = 'wb'
         resume_len = 0
@@ -158,13 +384,16 @@ class FragmentFD(FileDownloader):
         ctx.update({
             'tmpfilename': tmpfilename,
             'fragment_index': 0,
+            'fragment_offset': 0,
         })
 
         if self.__do_ytdl_file(ctx):
             if os.path.isfile(encodeFilename(self.ytdl_filename(ctx['filename']))):
                 self._read_ytdl_file(ctx)
+                offset = ctx.pop('ytdl_offset', None)
                 is_corrupt = ctx.get('ytdl_corrupt') is True
-                is_inconsistent = ctx['fragment_index'] > 0 and resume_len == 0
+                is_inconsistent = ctx['fragment_index'] > 0 and (
+                    resume_len == 0 or offset is not None and resume_len < offset)
                 if is_corrupt or is_inconsistent:
                     message = (
                         '.ytdl file is corrupt' if is_corrupt else
@@ -172,9 +401,17 @@ class FragmentFD(FileDownloader):
                     self.report_warning(
                         '%s. Restarting from the beginning...' % message)
                     ctx['fragment_index'] = resume_len = 0
+                    open_mode = 'wb'
                     if 'ytdl_corrupt' in ctx:
                         del ctx['ytdl_corrupt']
-                    self._write_ytdl_file(ctx)
+                elif offset is not None and resume_len > offset:
+                    # Drop what was appended after the last checkpoint, those
+                    # fragments are downloaded again
+                    with open(encodeFilename(tmpfilename), 'r+b') as tmpf:
+                        tmpf.truncate(offset)
+                    resume_len = offset
+                ctx['fragment_offset'] = resume_len
+                self._write_ytdl_file(ctx)
             else:
                 self._write_ytdl_file(ctx)
                 assert ctx['fragment_index'] == 0
@@ -183,6 +420,9 @@ class FragmentFD(FileDownloader):
 
         ctx.update({
             'dl': dl,
+            # Read fragments into memory instead of temporary files; test
+            # downloads rely on HttpFD fetching only the start of a fragment
+            'direct': not (self.params.get('keep_fragments', False) or self.params.get('test', False)),
             'dest_stream': dest_stream,
             'tmpfilename': tmpfilename,
             # Total complete fragments downloaded so far in bytes
@@ -242,6 +482,7 @@ class FragmentFD(FileDownloader):
             self._hook_progress(state)
 
         ctx['dl'].add_progress_hook(frag_progress_hook)
+        ctx['frag_progress_hook'] = frag_progress_hook
 
         return start
 
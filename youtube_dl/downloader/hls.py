@@ -4,15 +4,15 @@ import re
 import binascii
 try:
     from Crypto.Cipher import AES
-    can_decrypt_frag = True
 except ImportError:
-    can_decrypt_frag = False
+    # Slower, but fast enough for typical fragment bitrates
+    from ..aes import AES
+can_decrypt_frag = True
 
 from .fragment import FragmentFD
 from .external import FFmpegFD
 
 from ..compat import (
-    compat_urllib_error,
     compat_urlparse,
     compat_struct_pack,
 )
@@ -109,7 +109,6 @@ class HlsFD(FragmentFD):
 
         self._prepare_and_start_frag_download(ctx)
 
-        fragment_retries = self.params.get('fragment_retries', 0)
         skip_unavailable_fragments = self.params.get('skip_unavailable_fragments', True)
         test = self.params.get('test', False)
 
@@ -117,7 +116,7 @@ class HlsFD(FragmentFD):
         extra_param_to_segment_url = info_dict.get('extra_param_to_segment_url')
         if extra_param_to_segment_url:
             extra_query = compat_urlparse.parse_qs(extra_param_to_segment_url)
-        i = 0
+        fragments = []
         media_sequence = 0
         decrypt_info = {'METHOD': 'NONE'}
         byte_range = {}
@@ -130,54 +129,27 @@ class HlsFD(FragmentFD):
                     if ad_frag_next:
                         continue
                     frag_index += 1
-                    if frag_index <= ctx['fragment_index']:
-                        continue
                     frag_url = (
                         line
                         if re.match(r'^https?://', line)
                         else compat_urlparse.urljoin(man_url, line))
                     if extra_query:
                         frag_url = update_url_query(frag_url, extra_query)
-                    count = 0
                     headers = info_dict.get('http_headers', {})
                     if byte_range:
-                        headers['Range'] = 'bytes=%d-%d' % (byte_range['start'], byte_range['end'])
-                    while count <= fragment_retries:
-                        try:
-                            success, frag_content = self._download_fragment(
-                                ctx, frag_url, info_dict, headers)
-                            if not success:
-                                return False
-                            break
-                        except compat_urllib_error.HTTPError as err:
-                            # Unavailable (possibly temporary) fragments may be served.
-                            # First we try to retry then either skip or abort.
-                            # See https://github.com/rg3/youtube-dl/issues/10165,
-                            # https://github.com/rg3/youtube-dl/issues/10448).
-                            count += 1
-                            if count <= fragment_retries:
-                                self.report_retry_fragment(err, frag_index, count, fragment_retries)
-                    if count > fragment_retries:
-                        if skip_unavailable_fragments:
-                            i += 1
-                            media_sequence += 1
-                            self.report_skip_fragment(frag_index)
-                            continue
-                        self.report_error(
-                            'giving up after %s fragment retries' % fragment_retries)
-                        return False
-                    if decrypt_info['METHOD'] == 'AES-128':
-                        iv = decrypt_info.get('IV') or compat_struct_pack('>8xq', media_sequence)
-                        decrypt_info['KEY'] = decrypt_info.get('KEY') or self.ydl.urlopen(
-                            self._prepare_url(info_dict, decrypt_info['URI'])).read()
-                        frag_content = AES.new(
-                            decrypt_info['KEY'], AES.MODE_CBC, iv).decrypt(frag_content)
-                    self._append_fragment(ctx, frag_content)
+                        headers = dict(headers, Range='bytes=%d-%d' % (byte_range['start'], byte_range['end']))
+                    fragments.append({
+                        'frag_index': frag_index,
+                        'url': frag_url,
+                        'headers': headers,
+                        'decrypt_info': decrypt_info,
+                        'media_sequence': media_sequence,
+                        'fatal': not skip_unavailable_fragments,
+                    })
+                    media_sequence += 1
                     # We only download the first fragment during the test
                     if test:
                         break
-                    i += 1
-                    media_sequence += 1
                 elif line.startswith('#EXT-X-KEY'):
                     decrypt_url = decrypt_info.get('URI')
                     decrypt_info = parse_m3u8_attributes(line[11:])
@@ -205,6 +177,18 @@ class HlsFD(FragmentFD):
                 elif is_ad_fragment_end(line):
                     ad_frag_next = False
 
+        def decrypt_fragment(fragment, frag_content):
+            decrypt_info = fragment['decrypt_info']
+            if decrypt_info['METHOD'] != 'AES-128':
+                return frag_content
+            iv = decrypt_info.get('IV') or compat_struct_pack('>8xq', fragment['media_sequence'])
+            decrypt_info['KEY'] = decrypt_info.get('KEY') or self.ydl.urlopen(
+                self._prepare_url(info_dict, decrypt_info['URI'])).read()
+            return AES.new(decrypt_info['KEY'], AES.MODE_CBC, iv).decrypt(frag_content)
+
+        if not self.download_and_append_fragments(ctx, fragments, info_dict, decrypt_fragment):
+            return False
+
         self._finish_frag_download(ctx)
 
         return True
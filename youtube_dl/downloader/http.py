@@ -1,30 +1,56 @@
 from __future__ import unicode_literals
 
 import errno
+import json
 import os
 import socket
+import threading
 import time
 import random
 import re
 
 from .common import FileDownloader
 from ..compat import (
+    compat_http_client,
     compat_str,
     compat_urllib_error,
 )
 from ..utils import (
     ContentTooShortError,
     encodeFilename,
+    error_to_compat_str,
     int_or_none,
     sanitize_open,
     sanitized_Request,
+    write_json_file,
     write_xattr,
     XAttrMetadataError,
     XAttrUnavailableError,
 )
 
 
+class _RangeIgnored(Exception):
+    pass
+
+
 class HttpFD(FileDownloader):
+    """
+    Available options:
+
+    http_connections:   Download files of known size over up to this many
+                        connections at once, each fetching its own byte range
+                        into the .part file. The ranges and how much of each
+                        is done are kept in the .ytdl file:
+                        {"downloader": {"http_segments": {"total_bytes": N,
+                         "segments": [{"start": .., "end": .., "downloaded": ..}]}}}
+    """
+
+    # Ranges are not made smaller than this
+    _MIN_SEGMENT_SIZE = 1024 * 1024
+    _SEGMENT_BLOCK_SIZE = 64 * 1024
+    # Seconds between .ytdl checkpoints of a segmented download
+    _CHECKPOINT_INTERVAL = 2
+
     def real_download(self, filename, info_dict):
         url = info_dict['url']
 
@@ -62,6 +88,11 @@ class HttpFD(FileDownloader):
                 ctx.resume_len = os.path.getsize(
                     encodeFilename(ctx.tmpfilename))
 
+        if not is_test and ctx.tmpfilename != '-':
+            res = self._segmented_download(ctx, url, headers, info_dict)
+            if res is not None:
+                return res
+
         ctx.is_resume = ctx.resume_len > 0
 
         count = 0
@@ -352,3 +383,246 @@ class HttpFD(FileDownloader):
 
         self.report_error('giving up after %s retries' % retries)
         return False
+
+    def _load_segments(self, filename):
+        """Saved state of an interrupted segmented download, if any"""
+        ytdl_filename = encodeFilename(self.ytdl_filename(filename))
+        if not os.path.isfile(ytdl_filename):
+            return None
+        try:
+            with open(ytdl_filename) as f:
+                return json.load(f)['downloader']['http_segments']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _discard_segments(self, ctx):
+        """Remove a partial segmented download, the .part file is
+        preallocated and of no use to a single stream"""
+        for fn in (ctx.tmpfilename, self.ytdl_filename(ctx.filename)):
+            if os.path.isfile(encodeFilename(fn)):
+                os.remove(encodeFilename(fn))
+        ctx.resume_len = 0
+
+    def _save_segments(self, filename, total, segments, lock):
+        with lock:
+            state = [dict(seg) for seg in segments]
+        write_json_file({'downloader': {'http_segments': {
+            'total_bytes': total,
+            'segments': state,
+        }}}, self.ytdl_filename(filename))
+
+    def _probe_length(self, url, headers):
+        """Total size and Last-Modified header of url if the server honours
+        ranges, (None, None) otherwise"""
+        request = sanitized_Request(url, None, headers)
+        request.add_header('Range', 'bytes=0-0')
+        try:
+            data = self.ydl.urlopen(request)
+        except (compat_urllib_error.URLError, compat_http_client.HTTPException, socket.error):
+            # HTTP errors and timeouts alike, the single stream retries
+            return None, None
+        try:
+            content_range = data.headers.get('Content-Range') or ''
+            m = re.search(r'bytes 0-\d+/(\d+)', content_range)
+            if not m:
+                return None, None
+            return int(m.group(1)), data.info().get('last-modified', None)
+        finally:
+            data.close()
+
+    def _segmented_download(self, ctx, url, headers, info_dict):
+        """Download over several connections, one byte range each.
+
+        Returns None if it is not asked for, or not possible since the
+        server does not support ranges, to fall back to a single stream.
+        """
+        connections = self.params.get('http_connections') or 1
+        saved = self._load_segments(ctx.filename)
+        if connections < 2 and saved is None:
+            return None
+        total, last_modified = self._probe_length(url, headers)
+        if total is None:
+            if saved is not None:
+                self._discard_segments(ctx)
+            return None
+        min_data_len = self.params.get('min_filesize')
+        max_data_len = self.params.get('max_filesize')
+        if min_data_len is not None and total < min_data_len:
+            self.to_screen('\r[download] File is smaller than min-filesize (%s bytes < %s bytes). Aborting.' % (total, min_data_len))
+            return False
+        if max_data_len is not None and total > max_data_len:
+            self.to_screen('\r[download] File is larger than max-filesize (%s bytes > %s bytes). Aborting.' % (total, max_data_len))
+            return False
+
+        tmpfilename = ctx.tmpfilename
+        segments = None
+        if (saved is not None and saved.get('total_bytes') == total and
+                self.params.get('continuedl', True) and
+                os.path.isfile(encodeFilename(tmpfilename)) and
+                os.path.getsize(encodeFilename(tmpfilename)) == total):
+            segments = saved['segments']
+        if segments is None:
+            connections = min(connections, total // self._MIN_SEGMENT_SIZE)
+            if connections < 2:
+                if saved is not None:
+                    self._discard_segments(ctx)
+                return None
+            # A .part without segment state was written from its start by a
+            # single stream, unless it is of full size (preallocated, or
+            # complete): which it is cannot be told.
+            part_len = ctx.resume_len if saved is None and ctx.resume_len < total else 0
+            seg_size = total // connections
+            segments = []
+            for i in range(connections):
+                start = i * seg_size
+                end = (i + 1) * seg_size - 1 if i < connections - 1 else total - 1
+                segments.append({
+                    'start': start,
+                    'end': end,
+                    'downloaded': max(0, min(part_len - start, end - start + 1)),
+                })
+            # Preallocate, the segments are written in place
+            with open(encodeFilename(tmpfilename), 'r+b' if part_len else 'wb') as f:
+                f.truncate(total)
+        self.report_destination(ctx.filename)
+        if self.params.get('xattr_set_filesize', False):
+            try:
+                write_xattr(tmpfilename, 'user.ytdl.filesize', str(total).encode('utf-8'))
+            except (XAttrUnavailableError, XAttrMetadataError) as err:
+                self.report_error('unable to set filesize xattr: %s' % str(err))
+        resumed = sum(seg['downloaded'] for seg in segments)
+        if resumed:
+            self.report_resuming_byte(resumed)
+
+        lock = threading.Lock()
+        state = {
+            'downloaded': resumed,
+            'resumed': resumed,
+            'errors': [],
+            'stop': False,
+            'start': time.time(),
+        }
+
+        def run(seg):
+            try:
+                self._download_segment(url, headers, tmpfilename, seg, state, lock)
+            except Exception as e:
+                state['errors'].append(e)
+                state['stop'] = True
+
+        threads = [
+            threading.Thread(target=run, args=(seg,))
+            for seg in segments if seg['start'] + seg['downloaded'] <= seg['end']]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        self._save_segments(ctx.filename, total, segments, lock)
+        saved = time.time()
+        try:
+            alive = threads
+            while alive:
+                alive[0].join(0.2)
+                alive = [t for t in alive if t.is_alive()]
+                now = time.time()
+                downloaded = state['downloaded']
+                self._hook_progress({
+                    'status': 'downloading',
+                    'downloaded_bytes': downloaded,
+                    'total_bytes': total,
+                    'tmpfilename': tmpfilename,
+                    'filename': ctx.filename,
+                    'eta': self.calc_eta(state['start'], now, total - resumed, downloaded - resumed),
+                    'speed': self.calc_speed(state['start'], now, downloaded - resumed),
+                    'elapsed': now - ctx.start_time,
+                })
+                if now - saved >= self._CHECKPOINT_INTERVAL:
+                    self._save_segments(ctx.filename, total, segments, lock)
+                    saved = now
+        except BaseException:
+            state['stop'] = True
+            for t in threads:
+                t.join()
+            self._save_segments(ctx.filename, total, segments, lock)
+            raise
+
+        if state['errors']:
+            self._save_segments(ctx.filename, total, segments, lock)
+            err = state['errors'][0]
+            if isinstance(err, _RangeIgnored):
+                self._discard_segments(ctx)
+                return None
+            self.report_error('unable to download segment: %s' % error_to_compat_str(err))
+            return False
+
+        os.remove(encodeFilename(self.ytdl_filename(ctx.filename)))
+        self.try_rename(tmpfilename, ctx.filename)
+
+        # Update file modification time
+        if self.params.get('updatetime', True):
+            info_dict['filetime'] = self.try_utime(ctx.filename, last_modified)
+
+        self._hook_progress({
+            'downloaded_bytes': total,
+            'total_bytes': total,
+            'filename': ctx.filename,
+            'status': 'finished',
+            'elapsed': time.time() - ctx.start_time,
+        })
+        return True
+
+    def _download_segment(self, url, headers, tmpfilename, seg, state, lock):
+        """Fetch the rest of seg into its place in tmpfilename, retrying
+        like a single stream download does"""
+        retries = self.params.get('retries', 0)
+        count = 0
+        while not state['stop']:
+            start = seg['start'] + seg['downloaded']
+            if start > seg['end']:
+                return
+            request = sanitized_Request(url, None, headers)
+            request.add_header('Range', 'bytes=%d-%d' % (start, seg['end']))
+            try:
+                data = self.ydl.urlopen(request)
+                content_range = data.headers.get('Content-Range') or ''
+                m = re.search(r'bytes (\d+)-', content_range)
+                if not m or int(m.group(1)) != start:
+                    data.close()
+                    raise _RangeIgnored()
+                # Unbuffered, so that downloaded only counts bytes handed to the OS
+                with open(encodeFilename(tmpfilename), 'r+b', 0) as f:
+                    f.seek(start)
+                    while not state['stop']:
+                        left = seg['end'] + 1 - seg['start'] - seg['downloaded']
+                        if left <= 0:
+                            break
+                        block = data.read(min(self._SEGMENT_BLOCK_SIZE, left))
+                        if not block:
+                            break
+                        f.write(block)
+                        with lock:
+                            seg['downloaded'] += len(block)
+                            state['downloaded'] += len(block)
+                        self.slow_down(state['start'], None, state['downloaded'] - state['resumed'])
+                data.close()
+                if state['stop']:
+                    return
+                left = seg['end'] + 1 - seg['start'] - seg['downloaded']
+                if left > 0:
+                    raise ContentTooShortError(seg['downloaded'], seg['end'] + 1 - seg['start'])
+                return
+            except compat_urllib_error.HTTPError as err:
+                if err.code < 500 or err.code >= 600:
+                    raise
+                error = err
+            except socket.timeout as err:
+                error = err
+            except socket.error as err:
+                if err.errno not in (errno.ECONNRESET, errno.ETIMEDOUT):
+                    raise
+                error = err
+            except ContentTooShortError as err:
+                error = err
+            count += 1
+            if count > retries:
+                raise error
+            self.report_retry(error, count, retries)
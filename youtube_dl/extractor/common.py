@@ -34,6 +34,7 @@ from ..downloader.f4m import (
     get_base_url,
     remove_encrypted_media,
 )
+from ..profiler import profiled
 from ..utils import (
     NO_DEFAULT,
     age_restricted,
@@ -365,6 +366,8 @@ class InfoExtractor(object):
 
     _ready = False
     _downloader = None
+    # The downloader's ExtractionProfiler, None unless it profiles
+    _profiler = None
     _x_forwarded_for_ip = None
     _GEO_BYPASS = True
     _GEO_COUNTRIES = None
@@ -499,6 +502,7 @@ class InfoExtractor(object):
                         '[debug] Using fake IP %s (%s) as X-Forwarded-For.'
                         % (self._x_forwarded_for_ip, country.upper()))
 
+    @profiled('extract')
     def extract(self, url):
         """Extracts URL information and returns it in list of dicts."""
         try:
@@ -538,6 +542,7 @@ class InfoExtractor(object):
     def set_downloader(self, downloader):
         """Sets the downloader for this IE."""
         self._downloader = downloader
+        self._profiler = getattr(downloader, 'profiler', None)
 
     def _real_initialize(self):
         """Real initialization process. Redefine in subclasses."""
@@ -570,6 +575,7 @@ class InfoExtractor(object):
         else:
             assert False
 
+    @profiled('network')
     def _request_webpage(self, url_or_request, video_id, note=None, errnote=None, fatal=True, data=None, headers={}, query={}, expected_status=None):
         """
         Return the response handle.
@@ -625,6 +631,7 @@ class InfoExtractor(object):
                 self._downloader.report_warning(errmsg)
                 return False
 
+    @profiled('network')
     def _download_webpage_handle(self, url_or_request, video_id, note=None, errnote=None, fatal=True, encoding=None, data=None, headers={}, query={}, expected_status=None):
         """
         Return a tuple (page content as string, URL handle).
@@ -687,9 +694,12 @@ class InfoExtractor(object):
                 'Visit http://blocklist.rkn.gov.ru/ for a block reason.',
                 expected=True)
 
+    @profiled('network')
     def _webpage_read_content(self, urlh, url_or_request, video_id, note=None, errnote=None, fatal=True, prefix=None, encoding=None):
         content_type = urlh.headers.get('Content-Type', '')
         webpage_bytes = urlh.read()
+        if self._profiler is not None:
+            self._profiler.add_bytes(len(webpage_bytes))
         if prefix is not None:
             webpage_bytes = prefix + webpage_bytes
         if not encoding:
@@ -820,6 +830,7 @@ class InfoExtractor(object):
             expected_status=expected_status)
         return res if res is False else res[0]
 
+    @profiled('xml')
     def _parse_xml(self, xml_string, video_id, transform_source=None, fatal=True):
         if transform_source:
             xml_string = transform_source(xml_string)
@@ -870,6 +881,7 @@ class InfoExtractor(object):
             expected_status=expected_status)
         return res if res is False else res[0]
 
+    @profiled('json')
     def _parse_json(self, json_string, video_id, transform_source=None, fatal=True):
         if transform_source:
             json_string = transform_source(json_string)
@@ -951,6 +963,7 @@ class InfoExtractor(object):
             video_info['description'] = playlist_description
         return video_info
 
+    @profiled('regex')
     def _search_regex(self, pattern, string, name, default=NO_DEFAULT, fatal=True, flags=0, group=None):
         """
         Perform a regex search on the given string, using a single or a list of
@@ -985,6 +998,7 @@ class InfoExtractor(object):
             self._downloader.report_warning('unable to extract %s' % _name + bug_reports_message())
             return None
 
+    @profiled('regex')
     def _html_search_regex(self, pattern, string, name, default=NO_DEFAULT, fatal=True, flags=0, group=None):
         """
         Like _search_regex, but strips HTML tags and unescapes entities.
@@ -1072,6 +1086,7 @@ class InfoExtractor(object):
                     (?=[^>]+(?:itemprop|name|property|id|http-equiv)=(["\']?)%s\1)
                     [^>]+?content=(["\'])(?P<content>.*?)\2''' % re.escape(prop)
 
+    @profiled('regex')
     def _og_search_property(self, prop, html, name=None, **kargs):
         if not isinstance(prop, (list, tuple)):
             prop = [prop]
@@ -1103,6 +1118,7 @@ class InfoExtractor(object):
     def _og_search_url(self, html, **kargs):
         return self._og_search_property('url', html, **kargs)
 
+    @profiled('regex')
     def _html_search_meta(self, name, html, display_name=None, fatal=False, **kwargs):
         if not isinstance(name, (list, tuple)):
             name = [name]
@@ -1430,6 +1446,7 @@ class InfoExtractor(object):
         self.to_screen(msg)
         time.sleep(timeout)
 
+    @profiled('manifest')
     def _extract_f4m_formats(self, manifest_url, video_id, preference=None, f4m_id=None,
                              transform_source=lambda s: fix_xml_ampersands(s).strip(),
                              fatal=True, m3u8_id=None):
@@ -1448,6 +1465,7 @@ class InfoExtractor(object):
             manifest, manifest_url, video_id, preference=preference, f4m_id=f4m_id,
             transform_source=transform_source, fatal=fatal, m3u8_id=m3u8_id)
 
+    @profiled('manifest')
     def _parse_f4m_formats(self, manifest, manifest_url, video_id, preference=None, f4m_id=None,
                            transform_source=lambda s: fix_xml_ampersands(s).strip(),
                            fatal=True, m3u8_id=None):
@@ -1557,6 +1575,7 @@ class InfoExtractor(object):
             'format_note': 'Quality selection URL',
         }
 
+    @profiled('manifest')
     def _extract_m3u8_formats(self, m3u8_url, video_id, ext=None,
                               entry_protocol='m3u8', preference=None,
                               m3u8_id=None, note=None, errnote=None,
@@ -1577,6 +1596,7 @@ class InfoExtractor(object):
             m3u8_doc, m3u8_url, ext=ext, entry_protocol=entry_protocol,
             preference=preference, m3u8_id=m3u8_id, live=live)
 
+    @profiled('manifest')
     def _parse_m3u8_formats(self, m3u8_doc, m3u8_url, ext=None,
                             entry_protocol='m3u8', preference=None,
                             m3u8_id=None, live=False):
@@ -1983,6 +2003,7 @@ class InfoExtractor(object):
             })
         return entries
 
+    @profiled('manifest')
     def _extract_mpd_formats(self, mpd_url, video_id, mpd_id=None, note=None, errnote=None, fatal=True, formats_dict={}):
         res = self._download_xml_handle(
             mpd_url, video_id,
@@ -1998,6 +2019,7 @@ class InfoExtractor(object):
             mpd_doc, mpd_id=mpd_id, mpd_base_url=mpd_base_url,
             formats_dict=formats_dict, mpd_url=mpd_url)
 
+    @profiled('manifest')
     def _parse_mpd_formats(self, mpd_doc, mpd_id=None, mpd_base_url='', formats_dict={}, mpd_url=None):
         """
         Parse formats from MPD manifest.
@@ -2282,6 +2304,7 @@ class InfoExtractor(object):
                         self.report_warning('Unknown MIME type %s in DASH manifest' % mime_type)
         return formats
 
+    @profiled('manifest')
     def _extract_ism_formats(self, ism_url, video_id, ism_id=None, note=None, errnote=None, fatal=True):
         res = self._download_xml_handle(
             ism_url, video_id,
@@ -2294,6 +2317,7 @@ class InfoExtractor(object):
 
         return self._parse_ism_formats(ism_doc, urlh.geturl(), ism_id)
 
+    @profiled('manifest')
     def _parse_ism_formats(self, ism_doc, ism_url, ism_id=None):
         """
         Parse formats from ISM manifest.
@@ -0,0 +1,286 @@
+from __future__ import unicode_literals
+
+import time
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from ..compat import (
+    compat_chr,
+    compat_str,
+)
+from . import _LAZY_LOADER
+from .common import InfoExtractor
+
+# suitable() implementations that only match cls._VALID_URL
+_PLAIN_SUITABLE = set([InfoExtractor.suitable.__func__])
+if _LAZY_LOADER:
+    from .lazy_extractors import LazyLoadExtractor
+    _PLAIN_SUITABLE.add(LazyLoadExtractor.suitable.__func__)
+
+
+# Placeholders used when expanding a _VALID_URL into literal variants
+_WILD = 0  # any run of characters except '/'
+_WILD_SLASH = 1  # any run of characters
+_END = 2  # end of string
+_MAX_VARIANTS = 256
+_SCHEMES = ('http://', 'https://')
+
+_SLASH = ord('/')
+_NO_SLASH_CATEGORIES = frozenset(getattr(sre_constants, name) for name in (
+    'CATEGORY_DIGIT', 'CATEGORY_SPACE', 'CATEGORY_WORD', 'CATEGORY_LINEBREAK'))
+_SLASH_CATEGORIES = frozenset(getattr(sre_constants, name) for name in (
+    'CATEGORY_NOT_DIGIT', 'CATEGORY_NOT_SPACE', 'CATEGORY_NOT_WORD', 'CATEGORY_NOT_LINEBREAK'))
+_REPEATS = frozenset(getattr(sre_constants, name) for name in (
+    'MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(sre_constants, name))
+_ZERO_WIDTH = frozenset((sre_constants.ASSERT, sre_constants.ASSERT_NOT))
+_AT_END = frozenset((sre_constants.AT_END, sre_constants.AT_END_STRING))
+
+
+class _Unindexable(Exception):
+    pass
+
+
+def _product(left, right):
+    res = [a + b for a in left for b in right]
+    if len(res) > _MAX_VARIANTS:
+        raise _Unindexable()
+    return res
+
+
+def _class_matches_slash(items):
+    negate = False
+    found = False
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            found = found or av == _SLASH
+        elif op == sre_constants.RANGE:
+            found = found or av[0] <= _SLASH <= av[1]
+        elif op == sre_constants.CATEGORY and av in _NO_SLASH_CATEGORIES:
+            pass
+        elif op == sre_constants.CATEGORY and av in _SLASH_CATEGORIES:
+            found = True
+        else:
+            return True
+    return found != negate
+
+
+def _expand(seq):
+    """Expand a parsed pattern into tuples of literal characters and
+    placeholders, covering every string the pattern can match"""
+    variants = [()]
+    for op, av in seq:
+        if op == sre_constants.LITERAL:
+            node = [(compat_chr(av),)]
+        elif op == sre_constants.NOT_LITERAL:
+            node = [(_WILD_SLASH if av != _SLASH else _WILD,)]
+        elif op == sre_constants.IN:
+            chars = [a for o, a in av if o == sre_constants.LITERAL]
+            if len(chars) == len(av) and len(chars) <= 8:
+                node = [(compat_chr(c),) for c in chars]
+            else:
+                node = [(_WILD_SLASH if _class_matches_slash(av) else _WILD,)]
+        elif op == sre_constants.SUBPATTERN:
+            node = _expand(av[-1])
+        elif op == sre_constants.BRANCH:
+            node = [v for branch in av[1] for v in _expand(branch)]
+        elif op in _REPEATS:
+            node = _expand_repeat(*av)
+        elif op == sre_constants.AT:
+            node = [(_END,)] if av in _AT_END else [()]
+        elif op in _ZERO_WIDTH:
+            node = [()]
+        else:
+            node = [(_WILD_SLASH,)]
+        variants = _product(variants, node)
+    return variants
+
+
+def _expand_repeat(min_count, max_count, item):
+    if max_count == 0:
+        return [()]
+    item_variants = _expand(item)
+    if min_count == max_count == 1:
+        return item_variants
+    if (min_count, max_count) == (0, 1):
+        return [()] + item_variants
+    # Only the literal tail of the last repetition is kept, everything
+    # before it collapses into a placeholder.
+    slash = any(
+        t in ('/', _WILD_SLASH, _END) for v in item_variants for t in v)
+    wild = _WILD_SLASH if slash else _WILD
+    tails = set()
+    for v in item_variants:
+        tail = []
+        for t in reversed(v):
+            if not isinstance(t, compat_str):
+                break
+            tail.append(t)
+        tails.add((wild,) + tuple(reversed(tail)))
+    return ([()] if min_count == 0 else []) + sorted(tails, key=repr)
+
+
+def _variant_key(variant):
+    """Host suffix every http(s) URL matched by variant ends with.
+
+    None means the variant cannot match an http(s) URL at all.
+    """
+    prefix = []
+    for t in variant:
+        if not isinstance(t, compat_str):
+            break
+        prefix.append(t)
+    prefix = ''.join(prefix).lower()
+    pos = prefix.find('://')
+    if pos == -1:
+        if any(s.startswith(prefix) or prefix.startswith(s) for s in _SCHEMES):
+            raise _Unindexable()
+        return None
+    if prefix[:pos + 3] not in _SCHEMES:
+        return None
+    host = []
+    for t in variant[pos + 3:]:
+        if t == '/':
+            break
+        if t in (_WILD_SLASH, _END):
+            raise _Unindexable()
+        host.append(t)
+    else:
+        raise _Unindexable()
+    tail = []
+    for t in reversed(host):
+        if not isinstance(t, compat_str):
+            break
+        tail.append(t)
+    tail = ''.join(reversed(tail)).lower()
+    if len(tail) == len(host):
+        return tail
+    # The tail follows a placeholder, only whole labels are reliable.
+    dot = tail.find('.')
+    if dot == -1:
+        raise _Unindexable()
+    return tail[dot + 1:]
+
+
+_KEYS_CACHE = {}
+
+
+def extractor_host_keys(ie):
+    """Set of host suffixes one of which every http(s) URL suitable for ie
+    has, or None if ie's URL matching cannot be indexed"""
+    klass = ie if isinstance(ie, type) else type(ie)
+    if klass in _KEYS_CACHE:
+        return _KEYS_CACHE[klass]
+    keys = None
+    valid_url = getattr(klass, '_VALID_URL', None)
+    suitable = getattr(klass.suitable, '__func__', None)
+    if isinstance(valid_url, compat_str) and suitable in _PLAIN_SUITABLE:
+        try:
+            variants = _expand(sre_parse.parse(valid_url))
+            keys = frozenset(
+                k for k in map(_variant_key, variants) if k is not None)
+        except Exception:  # _Unindexable, or a pattern sre_parse chokes on
+            keys = None
+    _KEYS_CACHE[klass] = keys
+    return keys
+
+
+class ExtractorIndex(object):
+    """Candidate extractors for a URL, keyed on host.
+
+    candidates(url) returns, in their original order, the extractors that
+    can possibly be suitable for url: those whose _VALID_URL pins down a
+    host suffix the URL has, plus every extractor that could not be
+    indexed (custom suitable(), GenericIE, ...).  The first suitable one
+    among them is the same as with a scan over all extractors.
+    """
+
+    _MEMO_SIZE = 4096
+
+    def __init__(self, ies):
+        self._ies = list(ies)
+        self._by_key = {}
+        fallback = []
+        for pos, ie in enumerate(self._ies):
+            keys = extractor_host_keys(ie)
+            if keys is None:
+                fallback.append(pos)
+                continue
+            for key in keys:
+                self._by_key.setdefault(key, []).append(pos)
+        self._fallback = fallback
+        self._fallback_ies = [self._ies[pos] for pos in fallback]
+        self._memo = {}
+        self._first = {}
+
+    def candidates(self, url):
+        lower = url[:8].lower()
+        if lower.startswith('http://'):
+            rest = url[7:]
+        elif lower.startswith('https://'):
+            rest = url[8:]
+        else:
+            return self._ies
+        slash = rest.find('/')
+        if slash == -1:
+            return self._fallback_ies
+        host = rest[:slash].lower()
+        res = self._memo.get(host)
+        if res is None:
+            positions = set(self._fallback)
+            positions.update(self._by_key.get(host, ()))
+            dot = host.find('.')
+            while dot != -1:
+                positions.update(self._by_key.get(host[dot + 1:], ()))
+                dot = host.find('.', dot + 1)
+            res = [self._ies[pos] for pos in sorted(positions)]
+            if len(self._memo) >= self._MEMO_SIZE:
+                self._memo.clear()
+            self._memo[host] = res
+        return res
+
+    def first_suitable(self, url):
+        """First extractor suitable for url (memoized), None if there is none"""
+        try:
+            return self._first[url]
+        except KeyError:
+            pass
+        res = None
+        for ie in self.candidates(url):
+            if ie.suitable(url):
+                res = ie
+                break
+        if len(self._first) >= self._MEMO_SIZE:
+            self._first.clear()
+        self._first[url] = res
+        return res
+
+
+def benchmark_dispatch(ies, urls, rounds=20):
+    """URLs per second through an ExtractorIndex, cold (fresh index, no
+    compiled regexes) and warm, and through a linear suitable() scan."""
+    def rate(func, passes):
+        start = time.time()
+        for _ in range(passes):
+            for url in urls:
+                func(url)
+        return len(urls) * passes / max(time.time() - start, 1e-9)
+
+    def scan(url):
+        for ie in ies:
+            if ie.suitable(url):
+                return ie
+
+    start = time.time()
+    index = ExtractorIndex(ies)
+    result = {'build': time.time() - start}
+    result['cold'] = rate(index.first_suitable, 1)
+    result['warm'] = rate(index.first_suitable, rounds)
+    # Every regex is compiled by now, the best case for the linear scan
+    result['scan'] = rate(scan, rounds)
+    return result
@@ -3,16 +3,19 @@
 from __future__ import unicode_literals
 
 
+import collections
 import itertools
 import json
 import os.path
 import random
 import re
+import threading
 import time
 import traceback
 
 from .common import InfoExtractor, SearchInfoExtractor
 from ..jsinterp import JSInterpreter
+from ..profiler import profiled
 from ..swfinterp import SWFInterpreter
 from ..compat import (
     compat_chr,
@@ -1085,9 +1088,19 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         }
     ]
 
+    # Compiled signature functions by (player type, player id), shared by
+    # all instances; a player's function works for every signature length.
+    # Only the _SIG_FUNCTIONS_SIZE last used players are kept, they hold
+    # the whole player code.
+    _sig_functions = collections.OrderedDict()
+    _sig_functions_lock = threading.Lock()
+    _SIG_FUNCTIONS_SIZE = 8
+    # Per player and signature length
+    _PLAYER_CACHE_SIZE = 4 * _SIG_FUNCTIONS_SIZE
+
     def __init__(self, *args, **kwargs):
         super(YoutubeIE, self).__init__(*args, **kwargs)
-        self._player_cache = {}
+        self._player_cache = collections.OrderedDict()
 
     def report_video_info_webpage_download(self, video_id):
         """Report attempt to download video info webpage."""
@@ -1127,6 +1140,27 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         if cache_spec is not None:
             return lambda s: ''.join(s[i] for i in cache_spec)
 
+        key = (player_type, player_id)
+        with self._sig_functions_lock:
+            res = self._sig_functions.pop(key, None)
+            if res is not None:
+                self._sig_functions[key] = res
+        if res is None:
+            # Not under the lock, other threads' players need not wait
+            res = self._load_sig_function(video_id, player_url, player_type, player_id)
+            with self._sig_functions_lock:
+                self._sig_functions[key] = res
+                while len(self._sig_functions) > self._SIG_FUNCTIONS_SIZE:
+                    self._sig_functions.popitem(last=False)
+
+        test_string = ''.join(map(compat_chr, range(len(example_sig))))
+        cache_res = res(test_string)
+        cache_spec = [ord(c) for c in cache_res]
+
+        self._downloader.cache.store('youtube-sigfuncs', func_id, cache_spec)
+        return res
+
+    def _load_sig_function(self, video_id, player_url, player_type, player_id):
         download_note = (
             'Downloading player %s' % player_url
             if self._downloader.params.get('verbose') else
@@ -1137,24 +1171,17 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                 player_url, video_id,
                 note=download_note,
                 errnote='Download of %s failed' % player_url)
-            res = self._parse_sig_js(code)
+            return self._parse_sig_js(code)
         elif player_type == 'swf':
             urlh = self._request_webpage(
                 player_url, video_id,
                 note=download_note,
                 errnote='Download of %s failed' % player_url)
             code = urlh.read()
-            res = self._parse_sig_swf(code)
+            return self._parse_sig_swf(code)
         else:
             assert False, 'Invalid player type %r' % player_type
 
-        test_string = ''.join(map(compat_chr, range(len(example_sig))))
-        cache_res = res(test_string)
-        cache_spec = [ord(c) for c in cache_res]
-
-        self._downloader.cache.store('youtube-sigfuncs', func_id, cache_spec)
-        return res
-
     def _print_sig_code(self, func, example_sig):
         def gen_sig_code(idxs):
             def _genslice(start, end, step):
@@ -1214,6 +1241,7 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
         initial_function = swfi.extract_function(searched_class, 'decipher')
         return lambda s: initial_function([s])
 
+    @profiled('signature')
     def _decrypt_signature(self, s, video_id, player_url, age_gate=False):
         """Turn the encrypted s field into a working signature"""
 
@@ -1227,12 +1255,14 @@ class YoutubeIE(YoutubeBaseInfoExtractor):
                 'https://www.youtube.com', player_url)
         try:
             player_id = (player_url, self._signature_cache_id(s))
-            if player_id not in self._player_cache:
+            func = self._player_cache.pop(player_id, None)
+            if func is None:
                 func = self._extract_signature_function(
                     video_id, player_url, s
                 )
-                self._player_cache[player_id] = func
-            func = self._player_cache[player_id]
+                while len(self._player_cache) >= self._PLAYER_CACHE_SIZE:
+                    self._player_cache.popitem(last=False)
+            self._player_cache[player_id] = func
             if self._downloader.params.get('youtube_print_sig_code'):
                 self._print_sig_code(func, s)
             return func(s)
@@ -26,189 +26,334 @@ _ASSIGN_OPERATORS.append(('=', lambda cur, right: right))
 
 _NAME_RE = r'[a-zA-Z_$][a-zA-Z_$0-9]*'
 
+_BINARY_OPERATORS = dict(_OPERATORS)
+_ASSIGN_OPERATORS_MAP = dict(_ASSIGN_OPERATORS)
+# Binding power, higher binds tighter; all of them are left associative
+_PRECEDENCE = {
+    '|': 1,
+    '^': 2,
+    '&': 3,
+    '>>': 4, '<<': 4,
+    '-': 5, '+': 5,
+    '%': 6, '/': 6, '*': 6,
+}
+_CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+_TOKEN_RE = re.compile(r'''(?x)
+    \s*(?:
+        (?P<num>[0-9]+(?:\.[0-9]+)?)|
+        (?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|
+        (?P<name>%s)|
+        (?P<op>>>=|<<=|>>|<<|[-+*/%%&|^]=|[-+*/%%&|^=()[\]{},.;:!~])
+    )''' % _NAME_RE)
+
+
+def _tokenize(code):
+    """List of (kind, value) tokens of code, kind is one of num, str, name, op"""
+    tokens = []
+    pos = 0
+    end = len(code.rstrip())
+    while pos < end:
+        m = _TOKEN_RE.match(code, pos)
+        if m is None:
+            raise ExtractorError('Unsupported JS code %r' % code[pos:])
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == 'num':
+            value = float(value) if '.' in value else int(value)
+        elif kind == 'str':
+            if value[0] == "'":
+                value = '"%s"' % value[1:-1].replace("\\'", "'").replace('"', '\\"')
+            value = json.loads(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser(object):
+    """Compiles a token list into closures taking the local variables dict.
+
+    Expressions compile to (evaluate, ref) pairs; ref describes the target
+    of an assignment when the expression is one (a name, an index or a
+    member access) and is None otherwise.
+    """
+
+    def __init__(self, interpreter, tokens, source):
+        self.jsi = interpreter
+        self.tokens = tokens
+        self.source = source
+        self.pos = 0
+
+    def peek(self, value=None):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        if value is not None and (token[0] not in ('op', 'name') or token[1] != value):
+            return None
+        return token
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            self.fail()
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        if self.peek(value) is None:
+            self.fail()
+        self.pos += 1
+
+    def fail(self):
+        raise ExtractorError('Unsupported JS expression %r' % self.source)
+
+    def statement(self):
+        """Closure returning (value, should_abort)"""
+        if self.peek('var'):
+            self.pos += 1
+            expr = self.expression()
+            while self.peek(','):
+                self.pos += 1
+                first, expr = expr, self.expression()
+                expr = self._sequence(first, expr)
+            return lambda local_vars: (expr(local_vars), False)
+        if self.peek('return'):
+            self.pos += 1
+            if self.peek() is None:
+                return lambda local_vars: (None, True)
+            expr = self.expression()
+            return lambda local_vars: (expr(local_vars), True)
+        if self.peek() is None:
+            return lambda local_vars: (None, False)
+        expr = self.expression()
+        return lambda local_vars: (expr(local_vars), False)
+
+    @staticmethod
+    def _sequence(first, second):
+        def evaluate(local_vars):
+            first(local_vars)
+            return second(local_vars)
+        return evaluate
+
+    def expression(self):
+        evaluate, ref = self.assignment()
+        return evaluate
+
+    def assignment(self):
+        left, ref = self.binary(0)
+        token = self.peek()
+        if ref is None or token is None or token[0] != 'op' or token[1] not in _ASSIGN_OPERATORS_MAP:
+            return left, ref
+        self.pos += 1
+        opfunc = _ASSIGN_OPERATORS_MAP[token[1]]
+        right, _ = self.assignment()
+        kind = ref[0]
+        if kind == 'name':
+            name = ref[1]
+
+            def evaluate(local_vars):
+                val = opfunc(local_vars.get(name), right(local_vars))
+                local_vars[name] = val
+                return val
+        else:
+            obj, index = ref[1], ref[2]
+
+            def evaluate(local_vars):
+                right_val = right(local_vars)
+                lvar = obj(local_vars)
+                idx = index(local_vars)
+                val = opfunc(lvar[idx], right_val)
+                lvar[idx] = val
+                return val
+        return evaluate, None
+
+    def binary(self, min_precedence):
+        left, ref = self.unary()
+        while True:
+            token = self.peek()
+            if token is None or token[0] != 'op':
+                return left, ref
+            precedence = _PRECEDENCE.get(token[1])
+            if precedence is None or precedence <= min_precedence:
+                return left, ref
+            self.pos += 1
+            right, _ = self.binary(precedence)
+            left, ref = self._binary_op(_BINARY_OPERATORS[token[1]], left, right), None
+
+    @staticmethod
+    def _binary_op(opfunc, left, right):
+        return lambda local_vars: opfunc(left(local_vars), right(local_vars))
+
+    def unary(self):
+        if self.peek('-'):
+            self.pos += 1
+            operand, _ = self.unary()
+            return lambda local_vars: -operand(local_vars), None
+        if self.peek('+'):
+            self.pos += 1
+            return self.unary()[0], None
+        return self.postfix()
+
+    def postfix(self):
+        kind, value = self.next()
+        if kind in ('num', 'str'):
+            res = (lambda local_vars: value), None
+        elif kind == 'name' and value in _CONSTANTS:
+            constant = _CONSTANTS[value]
+            res = (lambda local_vars: constant), None
+        elif kind == 'name':
+            res = self._name(value, self.peek('.') or self.peek('['))
+        elif value == '(':
+            res = self.assignment()
+            self.expect(')')
+        elif value == '[':
+            items = self._arguments(']')
+            res = (lambda local_vars: [item(local_vars) for item in items]), None
+        else:
+            self.fail()
+
+        while True:
+            if self.peek('.'):
+                self.pos += 1
+                kind, member = self.next()
+                if kind != 'name':
+                    self.fail()
+                res = self._member(res[0], lambda local_vars, member=member: member)
+            elif self.peek('['):
+                self.pos += 1
+                index = self.expression()
+                self.expect(']')
+                res = self._member(res[0], index)
+            elif self.peek('('):
+                self.pos += 1
+                res = self._call(res[1], self._arguments(')'))
+            else:
+                return res
+
+    def _arguments(self, closing):
+        args = []
+        while not self.peek(closing):
+            args.append(self.expression())
+            if not self.peek(','):
+                break
+            self.pos += 1
+        self.expect(closing)
+        return args
+
+    def _name(self, name, member_base):
+        jsi = self.jsi
+
+        def evaluate(local_vars):
+            try:
+                return local_vars[name]
+            except KeyError:
+                # Objects of the code are only reachable through members
+                if not member_base:
+                    raise ExtractorError('Undefined JS variable %r' % name)
+                return jsi.get_object(name)
+        return evaluate, ('name', name)
+
+    @staticmethod
+    def _member(obj, index):
+        def evaluate(local_vars):
+            val = obj(local_vars)
+            idx = index(local_vars)
+            if idx == 'length' and not isinstance(val, dict):
+                return len(val)
+            return val[idx]
+        return evaluate, ('member', obj, index)
+
+    def _call(self, ref, args):
+        jsi = self.jsi
+        if ref is not None and ref[0] == 'name':
+            fname = ref[1]
+
+            def call(local_vars):
+                return jsi.extract_function(fname)(
+                    tuple([arg(local_vars) for arg in args]))
+        elif ref is not None and ref[0] == 'member':
+            obj, index = ref[1], ref[2]
+
+            def call(local_vars):
+                return jsi.call_method(
+                    obj(local_vars), index(local_vars),
+                    tuple([arg(local_vars) for arg in args]))
+        else:
+            self.fail()
+        return call, None
+
+
+def _compile_error(error):
+    def fail(local_vars):
+        raise error
+    return fail
+
 
 class JSInterpreter(object):
+    """Runs the functions of a piece of JavaScript.
+
+    Each function body is tokenized and compiled into Python closures
+    once, when it is first extracted; calls only run the closures.
+    """
+
     def __init__(self, code, objects=None):
         if objects is None:
             objects = {}
         self.code = code
         self._functions = {}
         self._objects = objects
+        self._compiled = {}
+
+    def _compile(self, source, statement):
+        key = (source, statement)
+        res = self._compiled.get(key)
+        if res is None:
+            try:
+                parser = _Parser(self, _tokenize(source), source)
+                res = parser.statement() if statement else parser.expression()
+                if parser.peek() is not None:
+                    parser.fail()
+            except ExtractorError as e:
+                # Only fail when the code actually runs, like interpretation does
+                res = _compile_error(e)
+            self._compiled[key] = res
+        return res
 
     def interpret_statement(self, stmt, local_vars, allow_recursion=100):
-        if allow_recursion < 0:
-            raise ExtractorError('Recursion limit reached')
-
-        should_abort = False
-        stmt = stmt.lstrip()
-        stmt_m = re.match(r'var\s', stmt)
-        if stmt_m:
-            expr = stmt[len(stmt_m.group(0)):]
-        else:
-            return_m = re.match(r'return(?:\s+|$)', stmt)
-            if return_m:
-                expr = stmt[len(return_m.group(0)):]
-                should_abort = True
-            else:
-                # Try interpreting it as an expression
-                expr = stmt
-
-        v = self.interpret_expression(expr, local_vars, allow_recursion)
-        return v, should_abort
+        return self._compile(stmt, True)(local_vars)
 
     def interpret_expression(self, expr, local_vars, allow_recursion):
-        expr = expr.strip()
-        if expr == '':  # Empty expression
-            return None
-
-        if expr.startswith('('):
-            parens_count = 0
-            for m in re.finditer(r'[()]', expr):
-                if m.group(0) == '(':
-                    parens_count += 1
-                else:
-                    parens_count -= 1
-                    if parens_count == 0:
-                        sub_expr = expr[1:m.start()]
-                        sub_result = self.interpret_expression(
-                            sub_expr, local_vars, allow_recursion)
-                        remaining_expr = expr[m.end():].strip()
-                        if not remaining_expr:
-                            return sub_result
-                        else:
-                            expr = json.dumps(sub_result) + remaining_expr
-                        break
-            else:
-                raise ExtractorError('Premature end of parens in %r' % expr)
-
-        for op, opfunc in _ASSIGN_OPERATORS:
-            m = re.match(r'''(?x)
-                (?P<out>%s)(?:\[(?P<index>[^\]]+?)\])?
-                \s*%s
-                (?P<expr>.*)$''' % (_NAME_RE, re.escape(op)), expr)
-            if not m:
-                continue
-            right_val = self.interpret_expression(
-                m.group('expr'), local_vars, allow_recursion - 1)
-
-            if m.groupdict().get('index'):
-                lvar = local_vars[m.group('out')]
-                idx = self.interpret_expression(
-                    m.group('index'), local_vars, allow_recursion)
-                assert isinstance(idx, int)
-                cur = lvar[idx]
-                val = opfunc(cur, right_val)
-                lvar[idx] = val
-                return val
-            else:
-                cur = local_vars.get(m.group('out'))
-                val = opfunc(cur, right_val)
-                local_vars[m.group('out')] = val
-                return val
-
-        if expr.isdigit():
-            return int(expr)
-
-        var_m = re.match(
-            r'(?!if|return|true|false)(?P<name>%s)$' % _NAME_RE,
-            expr)
-        if var_m:
-            return local_vars[var_m.group('name')]
-
-        try:
-            return json.loads(expr)
-        except ValueError:
-            pass
-
-        m = re.match(
-            r'(?P<in>%s)\[(?P<idx>.+)\]$' % _NAME_RE, expr)
-        if m:
-            val = local_vars[m.group('in')]
-            idx = self.interpret_expression(
-                m.group('idx'), local_vars, allow_recursion - 1)
-            return val[idx]
+        return self._compile(expr, False)(local_vars)
 
-        m = re.match(
-            r'(?P<var>%s)(?:\.(?P<member>[^(]+)|\[(?P<member2>[^]]+)\])\s*(?:\(+(?P<args>[^()]*)\))?$' % _NAME_RE,
-            expr)
-        if m:
-            variable = m.group('var')
-            member = remove_quotes(m.group('member') or m.group('member2'))
-            arg_str = m.group('args')
+    def get_object(self, objname):
+        obj = self._objects.get(objname)
+        if obj is None:
+            obj = self._objects[objname] = self.extract_object(objname)
+        return obj
 
-            if variable in local_vars:
-                obj = local_vars[variable]
-            else:
-                if variable not in self._objects:
-                    self._objects[variable] = self.extract_object(variable)
-                obj = self._objects[variable]
-
-            if arg_str is None:
-                # Member access
-                if member == 'length':
-                    return len(obj)
-                return obj[member]
-
-            assert expr.endswith(')')
-            # Function call
-            if arg_str == '':
-                argvals = tuple()
-            else:
-                argvals = tuple([
-                    self.interpret_expression(v, local_vars, allow_recursion)
-                    for v in arg_str.split(',')])
-
-            if member == 'split':
-                assert argvals == ('',)
-                return list(obj)
-            if member == 'join':
-                assert len(argvals) == 1
-                return argvals[0].join(obj)
-            if member == 'reverse':
-                assert len(argvals) == 0
-                obj.reverse()
-                return obj
-            if member == 'slice':
-                assert len(argvals) == 1
-                return obj[argvals[0]:]
-            if member == 'splice':
-                assert isinstance(obj, list)
-                index, howMany = argvals
-                res = []
-                for i in range(index, min(index + howMany, len(obj))):
-                    res.append(obj.pop(index))
-                return res
+    def call_method(self, obj, member, argvals):
+        if member == 'split':
+            assert argvals == ('',)
+            return list(obj)
+        if member == 'join':
+            assert len(argvals) == 1
+            return argvals[0].join(obj)
+        if member == 'reverse':
+            assert len(argvals) == 0
+            obj.reverse()
+            return obj
+        if member == 'slice':
+            assert len(argvals) == 1
+            return obj[argvals[0]:]
+        if member == 'splice':
+            assert isinstance(obj, list)
+            index, howMany = argvals
+            res = []
+            for i in range(index, min(index + howMany, len(obj))):
+                res.append(obj.pop(index))
+            return res
 
-            return obj[member](argvals)
-
-        for op, opfunc in _OPERATORS:
-            m = re.match(r'(?P<x>.+?)%s(?P<y>.+)' % re.escape(op), expr)
-            if not m:
-                continue
-            x, abort = self.interpret_statement(
-                m.group('x'), local_vars, allow_recursion - 1)
-            if abort:
-                raise ExtractorError(
-                    'Premature left-side return of %s in %r' % (op, expr))
-            y, abort = self.interpret_statement(
-                m.group('y'), local_vars, allow_recursion - 1)
-            if abort:
-                raise ExtractorError(
-                    'Premature right-side return of %s in %r' % (op, expr))
-            return opfunc(x, y)
-
-        m = re.match(
-            r'^(?P<func>%s)\((?P<args>[a-zA-Z0-9_$,]*)\)$' % _NAME_RE, expr)
-        if m:
-            fname = m.group('func')
-            argvals = tuple([
-                int(v) if v.isdigit() else local_vars[v]
-                for v in m.group('args').split(',')]) if len(m.group('args')) > 0 else tuple()
-            if fname not in self._functions:
-                self._functions[fname] = self.extract_function(fname)
-            return self._functions[fname](argvals)
-
-        raise ExtractorError('Unsupported JS expression %r' % expr)
+        return obj[member](argvals)
 
     def extract_object(self, objname):
         _FUNC_NAME_RE = r'''(?:[a-zA-Z$0-9]+|"[a-zA-Z$0-9]+"|'[a-zA-Z$0-9]+')'''
@@ -234,6 +379,9 @@ class JSInterpreter(object):
         return obj
 
     def extract_function(self, funcname):
+        f = self._functions.get(funcname)
+        if f is not None:
+            return f
         func_m = re.search(
             r'''(?x)
                 (?:function\s+%s|[{;,]\s*%s\s*=\s*function|var\s+%s\s*=\s*function)\s*
@@ -245,17 +393,21 @@ class JSInterpreter(object):
             raise ExtractorError('Could not find JS function %r' % funcname)
         argnames = func_m.group('args').split(',')
 
-        return self.build_function(argnames, func_m.group('code'))
+        f = self._functions[funcname] = self.build_function(argnames, func_m.group('code'))
+        return f
 
     def call_function(self, funcname, *args):
         f = self.extract_function(funcname)
         return f(args)
 
     def build_function(self, argnames, code):
+        stmts = [self._compile(stmt, True) for stmt in code.split(';')]
+
         def resf(args):
             local_vars = dict(zip(argnames, args))
-            for stmt in code.split(';'):
-                res, abort = self.interpret_statement(stmt, local_vars)
+            res = None
+            for stmt in stmts:
+                res, abort = stmt(local_vars)
                 if abort:
                     break
             return res
@@ -226,6 +226,11 @@ def parseOpts(overrideArguments=None):
         action='store_const', const='::', dest='source_address',
         help='Make all connections via IPv6',
     )
+    network.add_option(
+        '--http-pool-size',
+        dest='http_pool_size', metavar='N', default=None, type=int,
+        help='Keep up to N idle HTTP connections per host alive for reuse '
+             '(default is 4, 0 opens a new connection for every request)')
 
     geo = optparse.OptionGroup(parser, 'Geo Restriction')
     geo.add_option(
@@ -470,6 +475,10 @@ def parseOpts(overrideArguments=None):
         '--abort-on-unavailable-fragment',
         action='store_false', dest='skip_unavailable_fragments',
         help='Abort downloading when some fragment is not available')
+    downloader.add_option(
+        '-N', '--concurrent-fragments',
+        dest='concurrent_fragment_downloads', metavar='N', default=1, type=int,
+        help='Number of fragments to download concurrently (default is %default) (DASH and hlsnative)')
     downloader.add_option(
         '--keep-fragments',
         action='store_true', dest='keep_fragments', default=False,
@@ -482,6 +491,10 @@ def parseOpts(overrideArguments=None):
         '--no-resize-buffer',
         action='store_true', dest='noresizebuffer', default=False,
         help='Do not automatically adjust the buffer size. By default, the buffer size is automatically resized from an initial value of SIZE.')
+    downloader.add_option(
+        '--http-connections',
+        dest='http_connections', metavar='N', default=1, type=int,
+        help='Download files of known size over N connections, each fetching a part of the file (default is %default)')
     downloader.add_option(
         '--http-chunk-size',
         dest='http_chunk_size', metavar='SIZE', default=None,
@@ -663,6 +676,11 @@ def parseOpts(overrideArguments=None):
         '--print-traffic', '--dump-headers',
         dest='debug_printtraffic', action='store_true', default=False,
         help='Display sent and read HTTP traffic')
+    verbosity.add_option(
+        '--profile-file',
+        dest='profile_file', metavar='FILE', default=None,
+        help='Append a JSON line with the time, calls and bytes per extraction phase '
+             '(network, regex, json, xml, manifest, signature) of every URL to FILE')
     verbosity.add_option(
         '-C', '--call-home',
         dest='call_home', action='store_true', default=False,
@@ -755,6 +773,31 @@ def parseOpts(overrideArguments=None):
     filesystem.add_option(
         '--no-cache-dir', action='store_const', const=False, dest='cachedir',
         help='Disable filesystem caching')
+    filesystem.add_option(
+        '--cache-backend',
+        dest='cache_backend', metavar='BACKEND', choices=('sqlite', 'json'), default=None,
+        help='How to store the cache: "sqlite" (one database file in the cache dir, the default when available) '
+             'or "json" (one file per entry). A new sqlite cache imports the json files')
+    filesystem.add_option(
+        '--cache-max-size',
+        dest='cache_max_size', metavar='SIZE', default=None,
+        help='Drop the oldest sqlite cache entries beyond SIZE bytes (e.g. 50m)')
+    filesystem.add_option(
+        '--cache-max-age',
+        dest='cache_max_age', metavar='SECONDS', type=int, default=None,
+        help='Drop sqlite cache entries written more than SECONDS ago')
+    filesystem.add_option(
+        '--no-resolve-cache',
+        action='store_false', dest='resolve_cache', default=True,
+        help='Do not reuse download URLs resolved earlier for the same video')
+    filesystem.add_option(
+        '--resolve-cache-ttl',
+        dest='resolve_cache_ttl', metavar='SECONDS', type=int, default=None,
+        help='Cache resolved URLs without an embedded expiry for SECONDS (default: do not cache them)')
+    filesystem.add_option(
+        '--resolve-cache-size',
+        dest='resolve_cache_size', metavar='N', type=int, default=None,
+        help='Keep at most N resolved URLs, least recently used ones are dropped first (default 1000)')
     filesystem.add_option(
         '--rm-cache-dir',
         action='store_true', dest='rm_cachedir',
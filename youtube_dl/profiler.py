@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+
+import contextlib
+import functools
+import io
+import json
+import threading
+import time
+
+from .compat import compat_str
+from .utils import error_to_compat_str
+
+
+def profiled(phase):
+    """Count the calls of an InfoExtractor method towards phase when its
+    downloader profiles extractions (see ExtractionProfiler)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._profiler
+            if profiler is None:
+                return func(self, *args, **kwargs)
+            frame = profiler.enter(self.IE_NAME, phase)
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                profiler.leave(frame)
+        return wrapper
+    return decorate
+
+
+class ExtractionProfiler(object):
+    """Wall time, bytes and calls per phase and extractor of extract_info.
+
+    The phases are those of the InfoExtractor methods decorated with
+    profiled(): network, regex, json, xml, manifest and signature, plus
+    extract (the extractor's own code) and other (format selection, the
+    resolve cache, ...).  Time spent in a phase nested in another one,
+    like the download of a manifest, only counts towards the inner one,
+    and nested calls of the same phase count as one call.  bytes are the
+    response bytes read by network.
+
+    Each top level extract_info call makes one record, appended as a JSON
+    line to filename and passed to every hook:
+
+        {"url": "...", "ok": true, "error": null, "time": 1.52,
+         "phases": {"network": {"time": 1.1, "calls": 3, "bytes": 412345},
+                    ...},
+         "extractors": {"Youtube": {"network": {...}, ...}}}
+
+    Records are kept per thread, a YoutubeDL used from several threads
+    calls the hooks from each of them.
+    """
+
+    def __init__(self, filename=None, hooks=()):
+        self.filename = filename
+        self.hooks = list(hooks)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        """Whether an extraction of this thread is being recorded"""
+        return bool(getattr(self._local, 'stack', None))
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def extraction(self, url):
+        """Record the extraction of url, yields the record so that the
+        caller can set ok"""
+        local = self._local
+        record = {'url': url, 'ok': False, 'error': None}
+        root = [None, 'other', time.time(), 0.0, True]
+        local.stack = [root]
+        local.totals = {}
+        try:
+            yield record
+        except Exception as err:
+            record['error'] = error_to_compat_str(err)
+            raise
+        finally:
+            elapsed = time.time() - root[2]
+            totals = local.totals
+            local.stack = local.totals = None
+            totals[(None, 'other')] = [elapsed - root[3], 1, 0]
+            record['time'] = round(elapsed, 6)
+            self._fill(record, totals)
+            self._emit(record)
+
+    def enter(self, ie_name, phase):
+        stack = getattr(self._local, 'stack', None)
+        if not stack:
+            return None
+        parent = stack[-1]
+        frame = [ie_name, phase, time.time(), 0.0, parent[0] != ie_name or parent[1] != phase]
+        stack.append(frame)
+        return frame
+
+    def leave(self, frame):
+        stack = getattr(self._local, 'stack', None)
+        if frame is None or not stack:
+            return
+        elapsed = time.time() - frame[2]
+        stack.pop()
+        stack[-1][3] += elapsed
+        entry = self._local.totals.setdefault((frame[0], frame[1]), [0.0, 0, 0])
+        entry[0] += elapsed - frame[3]
+        if frame[4]:
+            entry[1] += 1
+
+    def add_bytes(self, count):
+        """Count bytes towards the current phase"""
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            frame = stack[-1]
+            self._local.totals.setdefault((frame[0], frame[1]), [0.0, 0, 0])[2] += count
+
+    @staticmethod
+    def _fill(record, totals):
+        phases = {}
+        extractors = {}
+        for (ie_name, phase), (seconds, calls, nbytes) in totals.items():
+            total = phases.setdefault(phase, {'time': 0.0, 'calls': 0, 'bytes': 0})
+            total['time'] += seconds
+            total['calls'] += calls
+            total['bytes'] += nbytes
+            if ie_name is not None:
+                extractors.setdefault(ie_name, {})[phase] = {
+                    'time': round(seconds, 6), 'calls': calls, 'bytes': nbytes}
+        for total in phases.values():
+            total['time'] = round(total['time'], 6)
+        record['phases'] = phases
+        record['extractors'] = extractors
+
+    def _emit(self, record):
+        if self.filename:
+            line = compat_str(json.dumps(record)) + '\n'
+            with self._lock:
+                with io.open(self.filename, 'a', encoding='utf-8') as f:
+                    f.write(line)
+        for hook in self.hooks:
+            hook(record)
@@ -14,7 +14,6 @@ import email.utils
 import email.header
 import errno
 import functools
-import gzip
 import io
 import itertools
 import json
@@ -25,11 +24,14 @@ import os
 import platform
 import random
 import re
+import select
 import socket
 import ssl
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import traceback
 import xml.etree.ElementTree
 import zlib
@@ -949,6 +951,306 @@ def handle_youtubedl_headers(headers):
     return filtered_headers
 
 
+class _PooledHTTPResponse(compat_http_client.HTTPResponse):
+    """HTTPResponse that gives its connection back to the pool once the
+    body has been read to the end, and drops it when closed before that"""
+
+    _ytdl_release = None
+    _ytdl_reading = 0
+
+    def _ytdl_read(self, method, *args):
+        self._ytdl_reading += 1
+        try:
+            result = method(self, *args)
+        except Exception:
+            self._ytdl_done(False)
+            raise
+        finally:
+            self._ytdl_reading -= 1
+        if self.fp is None:
+            # Closed by httplib itself: the body (or the chunked trailer)
+            # is read, unless the server went away before Content-Length
+            self._ytdl_done(not self.will_close and (self.chunked or self.length == 0))
+        return result
+
+    def read(self, *args):
+        return self._ytdl_read(compat_http_client.HTTPResponse.read, *args)
+
+    def readinto(self, *args):
+        return self._ytdl_read(compat_http_client.HTTPResponse.readinto, *args)
+
+    def read1(self, *args):
+        return self._ytdl_read(compat_http_client.HTTPResponse.read1, *args)
+
+    def readline(self, *args):
+        return self._ytdl_read(compat_http_client.HTTPResponse.readline, *args)
+
+    def close(self):
+        compat_http_client.HTTPResponse.close(self)
+        if not self._ytdl_reading:
+            self._ytdl_done(False)
+
+    def _ytdl_done(self, reusable):
+        release, self._ytdl_release = self._ytdl_release, None
+        if release is not None:
+            release(reusable)
+
+
+class HTTPConnectionPool(object):
+    """Idle keep-alive connections of the YoutubeDLHandler and
+    YoutubeDLHTTPSHandler of one YoutubeDL, at most size per key.
+
+    A key is (scheme, host, tunnel host, socks proxy), so connections
+    through a proxy are only reused for the same proxy and CONNECT
+    target.  Connections idle for longer than idle_timeout seconds, or
+    that the server has closed (readable while idle), are not reused.
+    Thread-safe.
+    """
+
+    def __init__(self, size=4, idle_timeout=30):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._stats = {'opened': 0, 'reused': 0, 'retried': 0, 'discarded': 0}
+
+    def get(self, key):
+        """An idle connection for key or None"""
+        now = time.time()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                conn, since = idle.pop()
+            if now - since <= self.idle_timeout and not self._dropped(conn):
+                with self._lock:
+                    self._stats['reused'] += 1
+                return conn
+            self._discard(conn)
+
+    def put(self, key, conn, reusable=True):
+        if reusable and conn.sock is not None:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.size:
+                    idle.append((conn, time.time()))
+                    return
+        self._discard(conn)
+
+    def count(self, what):
+        with self._lock:
+            self._stats[what] += 1
+
+    def _discard(self, conn):
+        with self._lock:
+            self._stats['discarded'] += 1
+        conn.close()
+
+    @staticmethod
+    def _dropped(conn):
+        try:
+            return bool(select.select([conn.sock], [], [], 0)[0])
+        except (select.error, ValueError, socket.error):
+            return True
+
+    def stats(self):
+        """Counters of connections opened, reused, retried after a reused
+        one failed and discarded, and of the idle ones"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(idle) for idle in self._idle.values())
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+
+def _pooled_open(handler, scheme, socks_proxy, http_class, req, **http_conn_args):
+    """AbstractHTTPHandler.do_open on a keep-alive connection from the
+    handler's connection pool.
+
+    A GET or HEAD request failing on a reused connection before any
+    response (the server closed it meanwhile) is sent again once on a new
+    one.  Other requests are not safe to send twice, they always get a new
+    connection.
+    """
+    if sys.version_info < (3, 0):
+        host, selector = req.get_host(), req.get_selector()
+    else:
+        host, selector = req.host, req.selector
+    if not host:
+        raise compat_urllib_error.URLError('no host given')
+    pool = handler._connection_pool
+    key = (scheme, host, req._tunnel_host, socks_proxy)
+
+    headers = dict(req.unredirected_hdrs)
+    headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+    headers = dict((name.title(), val) for name, val in headers.items())
+    tunnel_headers = {}
+    proxy_auth_hdr = str('Proxy-Authorization')
+    if req._tunnel_host and proxy_auth_hdr in headers:
+        # Proxy-Authorization should not be sent to origin server
+        tunnel_headers[proxy_auth_hdr] = headers.pop(proxy_auth_hdr)
+
+    idempotent = req.data is None and req.get_method() in ('GET', 'HEAD')
+    while True:
+        h = pool.get(key) if idempotent else None
+        reused = h is not None
+        if reused:
+            h.timeout = req.timeout
+            if req.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                h.sock.settimeout(req.timeout)
+        else:
+            h = http_class(host, timeout=req.timeout, **http_conn_args)
+            h.response_class = _PooledHTTPResponse
+            if req._tunnel_host:
+                h.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+            pool.count('opened')
+        h.set_debuglevel(handler._debuglevel)
+
+        try:
+            try:
+                h.request(req.get_method(), selector, req.data, headers)
+            except socket.error as err:
+                raise compat_urllib_error.URLError(err)
+            if reused and hasattr(socket, 'TCP_QUICKACK'):
+                # Delayed ACKs stall servers that write headers and body
+                # separately with Nagle on, 40ms per request on Linux
+                try:
+                    h.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+                except socket.error:
+                    pass
+            if sys.version_info < (3, 0):
+                # As urllib2 does, headers are read a byte per recv() otherwise
+                r = h.getresponse(buffering=True)
+            else:
+                r = h.getresponse()
+        except (compat_urllib_error.URLError, compat_http_client.BadStatusLine, socket.error) as err:
+            h.close()
+            if reused and not isinstance(err, socket.timeout):
+                pool.count('retried')
+                continue
+            raise
+        except Exception:
+            h.close()
+            raise
+        break
+
+    if not r.will_close:
+        if r.length == 0:
+            # Nothing to read (HEAD, 204, 304), free the connection right away
+            r.close()
+            pool.put(key, h)
+        else:
+            r._ytdl_release = functools.partial(pool.put, key, h)
+
+    url = req.get_full_url()
+    if sys.version_info < (3, 0):
+        # As urllib2 does, see AbstractHTTPHandler.do_open
+        r.recv = r.read
+        fp = socket._fileobject(r, close=True)
+        resp = compat_urllib_request.addinfourl(fp, r.msg, url)
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+    r.url = url
+    r.msg = r.reason
+    return r
+
+
+class _DecompressedReader(io.RawIOBase):
+    """The body of resp, gzip or deflate encoded, decoded as it is read.
+
+    Like browsers, and the GzipFile of Python 2, data after the end of
+    the compressed stream is ignored and a stream cut short ends with
+    what could be decoded.  deflate is tried as raw deflate first, then
+    with a zlib header (see YoutubeDLHandler.deflate).
+    """
+
+    _BLOCK_SIZE = 64 * 1024
+    # Most decoded bytes kept at once
+    _CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, resp, encoding):
+        io.RawIOBase.__init__(self)
+        self._resp = resp
+        self._gzip = encoding == 'gzip'
+        self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS if self._gzip else -zlib.MAX_WBITS)
+        # deflate: everything read before the first output, to start over
+        # with a zlib header
+        self._head = None if self._gzip else b''
+        self._pending = b''
+        self._buffer = b''
+        self._offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._offset == len(self._buffer):
+            self._buffer, self._offset = self._decode(), 0
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def readall(self):
+        chunks = [self._buffer[self._offset:]]
+        self._buffer, self._offset = b'', 0
+        while True:
+            out = self._decode()
+            if not out:
+                return b''.join(chunks)
+            chunks.append(out)
+
+    def _decode(self):
+        while self._decomp is not None:
+            data = self._pending
+            self._pending = b''
+            if not data:
+                data = self._resp.read(self._BLOCK_SIZE)
+                if not data:
+                    out = self._decomp.flush()
+                    self._decomp = None
+                    return out
+                if self._head is not None:
+                    self._head += data
+            try:
+                out = self._decomp.decompress(data, self._CHUNK_SIZE)
+            except zlib.error as err:
+                if self._head is None:
+                    raise IOError('Error decoding the response: %s' % error_to_compat_str(err))
+                self._decomp = zlib.decompressobj()
+                self._pending, self._head = self._head, None
+                continue
+            if out:
+                self._head = None
+            self._pending = self._decomp.unconsumed_tail
+            rest = self._decomp.unused_data
+            if rest:
+                if self._gzip and rest.startswith(b'\x1f\x8b'):
+                    # Another gzip member
+                    self._decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    self._pending = rest
+                else:
+                    self._decomp = None
+                    # Skip trailing junk so that the connection can be reused
+                    while self._resp.read(self._BLOCK_SIZE):
+                        pass
+            if out:
+                return out
+        return b''
+
+    def close(self):
+        io.RawIOBase.close(self)
+        self._resp.close()
+
+
 class YoutubeDLHandler(compat_urllib_request.HTTPHandler):
     """Handler for HTTP requests and responses.
 
@@ -965,9 +1267,13 @@ class YoutubeDLHandler(compat_urllib_request.HTTPHandler):
 
     Andrew Rowls, the author of that code, agreed to release it to the
     public domain.
+
+    With a connection_pool (HTTPConnectionPool), connections are kept
+    alive and reused across requests.
     """
 
     def __init__(self, params, *args, **kwargs):
+        self._connection_pool = kwargs.pop('connection_pool', None)
         compat_urllib_request.HTTPHandler.__init__(self, *args, **kwargs)
         self._params = params
 
@@ -979,9 +1285,10 @@ class YoutubeDLHandler(compat_urllib_request.HTTPHandler):
             conn_class = make_socks_conn_class(conn_class, socks_proxy)
             del req.headers['Ytdl-socks-proxy']
 
-        return self.do_open(functools.partial(
-            _create_http_connection, self, conn_class, False),
-            req)
+        conn_factory = functools.partial(_create_http_connection, self, conn_class, False)
+        if self._connection_pool is not None:
+            return _pooled_open(self, 'http', socks_proxy, conn_factory, req)
+        return self.do_open(conn_factory, req)
 
     @staticmethod
     def deflate(data):
@@ -1023,31 +1330,11 @@ class YoutubeDLHandler(compat_urllib_request.HTTPHandler):
 
     def http_response(self, req, resp):
         old_resp = resp
-        # gzip
-        if resp.headers.get('Content-encoding', '') == 'gzip':
-            content = resp.read()
-            gz = gzip.GzipFile(fileobj=io.BytesIO(content), mode='rb')
-            try:
-                uncompressed = io.BytesIO(gz.read())
-            except IOError as original_ioerror:
-                # There may be junk add the end of the file
-                # See http://stackoverflow.com/q/4928560/35070 for details
-                for i in range(1, 1024):
-                    try:
-                        gz = gzip.GzipFile(fileobj=io.BytesIO(content[:-i]), mode='rb')
-                        uncompressed = io.BytesIO(gz.read())
-                    except IOError:
-                        continue
-                    break
-                else:
-                    raise original_ioerror
-            resp = compat_urllib_request.addinfourl(uncompressed, old_resp.headers, old_resp.url, old_resp.code)
-            resp.msg = old_resp.msg
-            del resp.headers['Content-encoding']
-        # deflate
-        if resp.headers.get('Content-encoding', '') == 'deflate':
-            gz = io.BytesIO(self.deflate(resp.read()))
-            resp = compat_urllib_request.addinfourl(gz, old_resp.headers, old_resp.url, old_resp.code)
+        # gzip and deflate, decoded as the body is read
+        encoding = resp.headers.get('Content-encoding', '')
+        if encoding in ('gzip', 'deflate'):
+            fp = io.BufferedReader(_DecompressedReader(old_resp, encoding))
+            resp = compat_urllib_request.addinfourl(fp, old_resp.headers, old_resp.url, old_resp.code)
             resp.msg = old_resp.msg
             del resp.headers['Content-encoding']
         # Percent-encode redirect URL of Location HTTP header to satisfy RFC 3986 (see
@@ -1117,6 +1404,7 @@ def make_socks_conn_class(base_class, socks_proxy):
 
 class YoutubeDLHTTPSHandler(compat_urllib_request.HTTPSHandler):
     def __init__(self, params, https_conn_class=None, *args, **kwargs):
+        self._connection_pool = kwargs.pop('connection_pool', None)
         compat_urllib_request.HTTPSHandler.__init__(self, *args, **kwargs)
         self._https_conn_class = https_conn_class or compat_http_client.HTTPSConnection
         self._params = params
@@ -1135,9 +1423,10 @@ class YoutubeDLHTTPSHandler(compat_urllib_request.HTTPSHandler):
             conn_class = make_socks_conn_class(conn_class, socks_proxy)
             del req.headers['Ytdl-socks-proxy']
 
-        return self.do_open(functools.partial(
-            _create_http_connection, self, conn_class, True),
-            req, **kwargs)
+        conn_factory = functools.partial(_create_http_connection, self, conn_class, True)
+        if self._connection_pool is not None:
+            return _pooled_open(self, 'https', socks_proxy, conn_factory, req, **kwargs)
+        return self.do_open(conn_factory, req, **kwargs)
 
 
 class YoutubeDLCookieJar(compat_cookiejar.MozillaCookieJar):